@@ -0,0 +1,288 @@
+"""
+端到端流水线基准（可复现）
+  1. 用 synth_corpus 生成 / 复用合成规范语料（页数 × 文本层 / 栅格化 × 有无条文说明）
+  2. 启动本地 MinerU 桩服务（mineru_stub），流水线经 HTTP 调用，与线上流程一致
+  3. 每份文档在独立子进程中依次执行：页面索引 + 目录页检测 → run_pipeline（自动条文说明）
+  4. 报告各阶段耗时、子进程峰值 RSS，以及与标准答案对比的准确率：
+       目录页是否正确、offset 是否正确、条文说明目录页是否检出、书签召回率 / 精确率
+     （书签按 层级 + 章节号 + PDF 页码 + 是否条文说明子书签 比对），以及匹配书签中标题不一致的数量
+
+栅格化变体需要 Tesseract（TESSERACT_CMD），未安装时跳过并在报告中注明。
+--baseline 对比上一次的 JSON 报告：书签召回率下降或文档失败时退出码为 1。
+
+用法:
+  python benchmarks/bench_pipeline.py [--sizes 80,300,1000] [--variants text,raster]
+                                      [--clause both|yes|no] [--repeat 1]
+                                      [--out report.json] [--baseline old.json]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'webapp'))
+
+# 基准只测流水线本身：关闭目录指纹库（否则第二次运行直接命中）
+os.environ.setdefault('TOC_LIBRARY', '0')
+os.environ.setdefault('MINERU_API_TOKEN', 'stub')
+os.environ.setdefault('MINERU_POLL_INTERVAL', '0.2')
+
+import fitz                      # noqa: E402
+import pytesseract               # noqa: E402
+
+import metrics                   # noqa: E402
+import pipeline_core             # noqa: E402
+from page_index import PageIndex  # noqa: E402
+
+import mineru_stub               # noqa: E402
+import synth_corpus              # noqa: E402
+
+try:
+    import resource
+except ImportError:              # Windows
+    resource = None
+
+DEFAULT_CORPUS = os.path.join(HERE, 'corpus')
+
+
+def _peak_rss_mb():
+    """
+    本进程峰值 RSS（MB）。Linux 读 /proc/self/status 的 VmHWM：
+    ru_maxrss 会从父进程继承（fork 后 exec 也不清零），不能反映子进程自身的峰值。
+    """
+    try:
+        with open('/proc/self/status') as fh:
+            for line in fh:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def score_bookmarks(toc, truth):
+    """
+    最终书签与标准答案比对，返回
+    {matched, expected, produced, misplaced, title_errors, recall, precision}。
+    matched 按 层级 + 章节号 + 页码 + 是否条文说明子书签 计；title_errors 为其中标题不一致的数量。
+    """
+    got, in_clause = {}, False
+    for level, title, page, *_ in toc:
+        key = title.split('  ', 1)[0]
+        if level == 1:
+            in_clause = False
+        got[(level, key, page, in_clause)] = title
+        if level == 1 and key == '条文说明':
+            in_clause = True
+    want    = {tuple(b[:4]): b[4] for b in truth['bookmarks']}
+    matched = got.keys() & want.keys()
+    placed  = {(l, k, c) for l, k, _, c in got}
+    return {
+        'matched':      len(matched),
+        'expected':     len(want),
+        'produced':     len(got),
+        'misplaced':    sum(1 for l, k, p, c in want.keys() - got.keys() if (l, k, c) in placed),
+        'title_errors': sum(1 for k in matched if got[k] != want[k]),
+        'recall':       round(len(matched) / len(want), 4) if want else 1.0,
+        'precision':    round(len(matched) / len(got), 4) if got else 0.0,
+    }
+
+
+def run_document(pdf_path, truth, work_dir):
+    """在子进程中处理一份语料，返回结果 dict（阶段耗时、峰值 RSS、准确率）。"""
+    name    = os.path.splitext(os.path.basename(pdf_path))[0]
+    job_dir = os.path.join(work_dir, name)
+    shutil.rmtree(job_dir, ignore_errors=True)
+    os.makedirs(job_dir)
+    result = {'name': name, 'pages': truth['pages'], 'raster': truth['raster'],
+              'clause': truth['clause'], 'rss_base_mb': _peak_rss_mb()}
+    log = open(os.path.join(job_dir, 'pipeline.log'), 'w', encoding='utf-8')
+
+    def emit(type_, msg='', step=None, progress=None, **kwargs):
+        log.write(f'{type_}: {msg}\n')
+
+    t0 = time.perf_counter()
+    try:
+        index     = PageIndex.build(pdf_path)
+        results   = pipeline_core.detect_toc_pages(pdf_path, index=index)
+        toc_pages = pipeline_core.pick_toc_pages(results, index.total)
+        detect_s  = time.perf_counter() - t0
+        summary   = pipeline_core.run_pipeline(
+            pdf_path, job_dir, emit, toc_pages, clause_event=None, clause_pages_holder=[None],
+            cache={'page_index': index}, auto_clause=True)
+        with open(os.path.join(job_dir, metrics.TIMINGS_FILE), encoding='utf-8') as fh:
+            timings = json.load(fh)
+        with fitz.open(os.path.join(job_dir, 'final.pdf')) as doc:
+            toc = doc.get_toc()
+    except Exception as exc:
+        log.close()
+        return dict(result, status='error', error=f'{type(exc).__name__}: {exc}',
+                    total_s=round(time.perf_counter() - t0, 3), rss_peak_mb=_peak_rss_mb())
+    log.close()
+
+    want_clause = truth['clause_toc_pages']
+    result.update({
+        'status':      'done',
+        'total_s':     round(time.perf_counter() - t0, 3),
+        'stages':      dict(timings['steps'], detect=round(detect_s, 3)),
+        'spans':       timings['spans'],
+        'rss_peak_mb': _peak_rss_mb(),
+        'toc_ok':      toc_pages == truth['toc_pages'],
+        'offset_ok':   summary['offset'] == truth['offset'],
+        'clause_ok':   (set(want_clause) <= set(summary['clause_pages'] or ())
+                        if want_clause else not summary['clause_pages']),
+        'bookmarks':   score_bookmarks(toc, truth),
+    })
+    return result
+
+
+def _run_isolated(pdf_path, truth, work_dir):
+    """每份文档一个新的 spawn 子进程，峰值 RSS 互不影响。"""
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+        return pool.submit(run_document, pdf_path, truth, work_dir).result()
+
+
+def _tesseract_available():
+    try:
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+
+def _environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE,
+                                capture_output=True, text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ''
+    return {'python': platform.python_version(), 'platform': platform.platform(),
+            'pymupdf': fitz.VersionBind, 'cpus': os.cpu_count(), 'commit': commit}
+
+
+def _fmt_row(r):
+    if r['status'] != 'done':
+        return f"{r['name']:32s} {r['status']}: {r.get('error', '')}"
+    st  = r['stages']
+    bm  = r['bookmarks']
+    rss = f"{r['rss_peak_mb']:7.0f}" if r['rss_peak_mb'] is not None else '    n/a'
+    ok  = ''.join('✓' if r[k] else '✗' for k in ('toc_ok', 'offset_ok', 'clause_ok'))
+    return (f"{r['name']:32s} {st.get('detect', 0):7.2f} {st.get('step2', 0):7.2f} "
+            f"{st.get('step3', 0):7.2f} "
+            f"{sum(st.get(s, 0) for s in ('step4', 'step5', 'step6')):7.2f} "
+            f"{r['total_s']:7.2f} {rss} {ok:>5s} {bm['recall']:6.1%} {bm['precision']:6.1%} "
+            f"{bm['title_errors']:5d}")
+
+
+def compare(baseline, documents):
+    """与基线报告对比，打印差异；返回是否出现准确率回退。"""
+    base = {d['name']: d for d in baseline.get('documents', [])}
+    regressed = False
+    print('\n与基线对比（耗时 / 峰值 RSS / 书签召回率）:')
+    for r in documents:
+        b = base.get(r['name'])
+        if not b or b['status'] != 'done' or r['status'] != 'done':
+            continue
+        dt   = (r['total_s'] - b['total_s']) / b['total_s'] if b['total_s'] else 0
+        drss = ((r['rss_peak_mb'] or 0) - (b['rss_peak_mb'] or 0))
+        drec = r['bookmarks']['recall'] - b['bookmarks']['recall']
+        flag = ''
+        if drec < 0:
+            flag, regressed = '  ← 准确率下降', True
+        print(f"  {r['name']:32s} {dt:+7.1%}  {drss:+7.1f} MB  {drec:+.2%}{flag}")
+    return regressed
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='端到端流水线基准：合成规范语料 + MinerU 桩服务')
+    ap.add_argument('--sizes', default='80,300,1000', help='页数列表（逗号分隔）')
+    ap.add_argument('--variants', default='text,raster', help='text / raster（逗号分隔）')
+    ap.add_argument('--clause', choices=('both', 'yes', 'no'), default='both',
+                    help='是否包含条文说明')
+    ap.add_argument('--seed', type=int, default=0, help='语料随机种子')
+    ap.add_argument('--repeat', type=int, default=1, help='每份文档重复次数（取最快一次）')
+    ap.add_argument('--corpus', default=DEFAULT_CORPUS, help='语料缓存目录')
+    ap.add_argument('--mineru-latency', type=float, default=0.0,
+                    help='MinerU 桩服务每个批次的模拟解析耗时（秒）')
+    ap.add_argument('--out', help='JSON 报告输出路径')
+    ap.add_argument('--baseline', help='用于对比的上一次 JSON 报告')
+    ap.add_argument('--keep', action='store_true', help='保留各文档的工作目录（日志、中间产物）')
+    args = ap.parse_args(argv)
+
+    clauses  = {'both': (True, False), 'yes': (True,), 'no': (False,)}[args.clause]
+    variants = args.variants.split(',')
+    specs    = [(int(n), v == 'raster', c) for n in args.sizes.split(',')
+                for v in variants for c in clauses]
+
+    print(f'准备语料（{args.corpus}）...')
+    corpus = []
+    for pages, raster, clause in specs:
+        t0 = time.perf_counter()
+        pdf_path, truth = synth_corpus.generate(args.corpus, pages, raster, clause, args.seed)
+        corpus.append((pdf_path, truth))
+        print(f'  {os.path.basename(pdf_path)}  ({time.perf_counter() - t0:.1f}s)')
+
+    oracle_paths = [os.path.splitext(p)[0] + '.oracle.json' for p, t in corpus if t['raster']]
+    stub = mineru_stub.serve(latency=args.mineru_latency,
+                             oracle=mineru_stub.load_oracle(oracle_paths))
+    os.environ['MINERU_API_BASE'] = stub.api_base      # spawn 子进程继承
+    has_tesseract = _tesseract_available()
+    work_dir = tempfile.mkdtemp(prefix='bench_pipeline_')
+
+    print(f"\n{'文档':30s} {'检测':>7s} {'MinerU':>7s} {'解析注入':>5s} {'条文说明':>5s} "
+          f"{'合计(s)':>6s} {'RSS(MB)':>7s} {'页/偏/条':>4s} {'召回':>5s} {'精确':>5s} {'标题错':>3s}")
+    documents = []
+    try:
+        for pdf_path, truth in corpus:
+            if truth['raster'] and not has_tesseract:
+                r = {'name': os.path.splitext(os.path.basename(pdf_path))[0],
+                     'pages': truth['pages'], 'raster': True, 'clause': truth['clause'],
+                     'status': 'skipped', 'error': '未找到 Tesseract（设置 TESSERACT_CMD）'}
+            else:
+                runs = [_run_isolated(pdf_path, truth, work_dir) for _ in range(args.repeat)]
+                done = [x for x in runs if x['status'] == 'done']
+                r = min(done, key=lambda x: x['total_s']) if done else runs[0]
+            documents.append(r)
+            print(_fmt_row(r), flush=True)
+    finally:
+        stub.shutdown()
+        if args.keep:
+            print(f'\n工作目录: {work_dir}')
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'created':     time.strftime('%Y-%m-%d %H:%M:%S'),
+        'environment': _environment(),
+        'settings':    {'sizes': args.sizes, 'variants': args.variants, 'clause': args.clause,
+                        'seed': args.seed, 'repeat': args.repeat,
+                        'mineru_latency': args.mineru_latency,
+                        'mineru_poll_interval': pipeline_core.MINERU_POLL_INTERVAL},
+        'documents':   documents,
+    }
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as fh:
+            json.dump(report, fh, ensure_ascii=False, indent=2)
+        print(f'\n报告已写入 {args.out}')
+
+    failed = any(d['status'] == 'error' for d in documents)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as fh:
+            failed = compare(json.load(fh), documents) or failed
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""
+启动耗时预算检查
+  每个入口模块在全新子进程中导入（取多次中位数），检查：
+  1. 导入耗时不超过预算（--budget 模块=毫秒 可覆盖默认值）
+  2. 导入后没有加载重依赖（pipeline_core.HEAVY_MODULES：fitz / requests / pytesseract / PIL），
+     它们应在首次使用或 warm_up() 时才加载
+  同时报告 warm_up() 的耗时（即首个请求原本要承担的开销）。任一检查不通过时退出码为 1。
+
+用法:
+  python benchmarks/bench_startup.py [--repeat 7] [--budget app=300]
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+HERE   = os.path.dirname(os.path.abspath(__file__))
+WEBAPP = os.path.join(HERE, '..', 'webapp')
+
+# 导入耗时预算（毫秒）：app 含 Flask 本身的导入
+BUDGETS = {'pipeline_core': 120, 'batch_cli': 150, 'app': 350}
+
+_PROBE = r'''
+import sys, json, time
+sys.path.insert(0, {webapp!r})
+t0 = time.perf_counter()
+import {module}
+import_ms = (time.perf_counter() - t0) * 1000
+import pipeline_core
+loaded = [m for m in pipeline_core.HEAVY_MODULES if m in sys.modules]
+warm_ms = pipeline_core.warm_up() * 1000
+print(json.dumps({{'import_ms': import_ms, 'loaded': loaded, 'warm_ms': warm_ms}}))
+'''
+
+
+def measure(module, env):
+    """在全新解释器中导入 module，返回 {import_ms, loaded, warm_ms}。"""
+    code = _PROBE.format(webapp=os.path.abspath(WEBAPP), module=module)
+    out = subprocess.run([sys.executable, '-c', code], env=env, check=True,
+                         capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='入口模块导入耗时预算检查')
+    ap.add_argument('--repeat', type=int, default=7, help='每个模块的测量次数（取中位数）')
+    ap.add_argument('--budget', action='append', default=[], metavar='模块=毫秒',
+                    help='覆盖默认预算，可多次指定')
+    args = ap.parse_args(argv)
+
+    budgets = dict(BUDGETS)
+    for item in args.budget:
+        name, ms = item.split('=', 1)
+        budgets[name] = float(ms)
+
+    failed = False
+    with tempfile.TemporaryDirectory(prefix='pdfbm-startup-') as tmp:
+        # 导入 app 会创建上传目录并恢复任务，指向临时目录以免受本地数据影响
+        env = dict(os.environ, UPLOAD_DIR=tmp, TOC_LIBRARY_DIR=os.path.join(tmp, '_toc_library'))
+        print(f"{'模块':<16}{'导入(ms)':>10}{'预算(ms)':>10}{'预热(ms)':>10}  提前加载的重依赖")
+        for module, budget in budgets.items():
+            runs = [measure(module, env) for _ in range(args.repeat)]
+            import_ms = statistics.median(r['import_ms'] for r in runs)
+            warm_ms   = statistics.median(r['warm_ms'] for r in runs)
+            loaded    = sorted({m for r in runs for m in r['loaded']})
+            ok = import_ms <= budget and not loaded
+            failed |= not ok
+            print(f"{module:<16}{import_ms:>10.1f}{budget:>10.0f}{warm_ms:>10.1f}  "
+                  f"{', '.join(loaded) or '-'}{'' if ok else '  ✗'}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
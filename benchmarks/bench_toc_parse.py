@@ -0,0 +1,122 @@
+"""
+目录行解析基准
+  1. 用 data/toc_parse_golden.jsonl 校验 _parse_toc_line / _split_merged_entries /
+     _preprocess_lines 的输出（不一致则退出码 1）
+  2. 生成多卷大型目录（默认 10 万行），报告预处理 + 解析的吞吐（行/秒）
+
+用法:
+  python benchmarks/bench_toc_parse.py [--lines 100000] [--repeat 5] [--check-only]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'webapp'))
+
+import pipeline_core  # noqa: E402
+
+GOLDEN = os.path.join(HERE, 'data', 'toc_parse_golden.jsonl')
+
+
+def check_golden(path=GOLDEN):
+    """返回 (校验行数, 不一致条目列表)；列表为空表示全部一致。"""
+    with open(path, encoding='utf-8') as fh:
+        records = [json.loads(l) for l in fh if l.strip()]
+    lines = [r['line'] for r in records if 'line' in r]
+    failures = []
+    for r in records:
+        if 'line' in r:
+            got = pipeline_core._parse_toc_line(r['line'])
+            got = list(got) if got else None
+            if got != r['parse']:
+                failures.append(('parse', r['line'], got, r['parse']))
+            got = pipeline_core._split_merged_entries(r['line'])
+            if got != r['split']:
+                failures.append(('split', r['line'], got, r['split']))
+        else:
+            a, b = r['block']
+            got = pipeline_core._preprocess_lines(lines[a:b])
+            if got != r['preprocess']:
+                failures.append(('preprocess', f'lines[{a}:{b}]', got, r['preprocess']))
+    return len(lines), failures
+
+
+def synthetic_toc(n_lines, seed=2026):
+    """多卷规范目录：章/节/条 + 附录 + 条文说明，混合点线引导符与括号页码。"""
+    rnd = random.Random(seed)
+    titles = ['总则', '术语和符号', '基本规定', '材料', '结构分析', '承载能力极限状态计算',
+              '正常使用极限状态验算', '构造规定', '结构构件的基本规定', '预应力混凝土结构构件',
+              '混凝土结构构件抗震设计', '施工质量验收', '地基基础', '一般规定']
+    leaders = ['……………………', '………', ' ', '·········', '．．．．．．', '  ']
+    out, page = [], 1
+    while len(out) < n_lines:
+        page = 1
+        for ch in range(1, 13):
+            fmt = rnd.choice(['{s} {t}{l}{p}', '{s} {t}{l}({p})', '{s} {t}{l}（{p}）'])
+            out.append(fmt.format(s=ch, t=rnd.choice(titles), l=rnd.choice(leaders), p=page))
+            for sec in range(1, rnd.randint(3, 9)):
+                page += rnd.randint(0, 3)
+                line = fmt.format(s=f'{ch}.{sec}', t=rnd.choice(titles),
+                                  l=rnd.choice(leaders), p=page)
+                if rnd.random() < 0.1:   # MinerU 常把两个条目粘在一行
+                    page += 1
+                    line += fmt.format(s=f'{ch}.{sec + 1}', t=rnd.choice(titles),
+                                       l=rnd.choice(leaders), p=page)
+                out.append(line)
+            page += rnd.randint(1, 5)
+        for app in 'ABCDEF':
+            if rnd.random() < 0.3:     # 附录标题被换行拆开
+                out.append(f'附录{app}')
+                out.append(f'{rnd.choice(titles)}（{page}）')
+            else:
+                out.append(f'附录 {app} {rnd.choice(titles)}{rnd.choice(leaders)}{page}')
+            page += rnd.randint(1, 4)
+        out.append(f'本规范用词说明 （{page}）')
+        out.append(f'引用标准名录 （{page + 1}）')
+        out.append(f'附：条文说明 （{page + 2}）')
+        out.append('')
+    return out[:n_lines]
+
+
+def bench(lines, repeat):
+    best = float('inf')
+    entries = 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        pre = pipeline_core._preprocess_lines(lines)
+        parsed = [e for e in map(pipeline_core._parse_toc_line, pre) if e]
+        best = min(best, time.perf_counter() - t0)
+        entries = len(parsed)
+    return best, entries
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='目录行解析：黄金输出校验 + 吞吐基准')
+    ap.add_argument('--lines', type=int, default=100_000, help='合成目录行数')
+    ap.add_argument('--repeat', type=int, default=5, help='重复次数（取最快一次）')
+    ap.add_argument('--check-only', action='store_true', help='只做黄金输出校验')
+    args = ap.parse_args(argv)
+
+    n, failures = check_golden()
+    for kind, line, got, want in failures[:20]:
+        print(f'✗ {kind}: {line!r}\n    got  {got!r}\n    want {want!r}')
+    print(f'黄金输出校验: {n} 行，{len(failures)} 处不一致')
+    if failures:
+        return 1
+    if args.check_only:
+        return 0
+
+    lines = synthetic_toc(args.lines)
+    elapsed, entries = bench(lines, args.repeat)
+    print(f'合成目录 {len(lines)} 行 → {entries} 个条目')
+    print(f'预处理 + 解析: {elapsed * 1000:.1f} ms，{len(lines) / elapsed:,.0f} 行/秒'
+          f'（每 1000 行 {elapsed / len(lines) * 1e6:.1f} ms）')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
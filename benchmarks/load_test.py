@@ -0,0 +1,421 @@
+"""
+并发压测：N 个模拟用户按网页版的真实顺序调用各路由
+  /upload/init → 分块 PUT /upload/<id> → /upload/<id>/complete →
+  /thumbnail 突发（首屏 25 张，6 路并发，同浏览器）→ /detect 轮询 → /start →
+  /progress（SSE）→ [select_clause 时再拉 20 张缩略图 → /start_clause] → /download
+
+默认在临时目录（UPLOAD_DIR）中以子进程启动 Flask 服务，并启动本地 MinerU 桩服务
+（可配置解析延迟）；每个用户上传内容不同的文件（末尾追加注释，SHA-256 不同），
+不会命中去重缓存（--dedup 则全部上传同一文件）。
+
+报告:
+  - 每个路由的请求数、错误数、p50 / p95 / p99 / 最大延迟（/progress 取首个事件到达时间）
+  - 整个任务（/start → done 事件）的耗时分布
+  - 吞吐：完成的会话数 / 分钟、请求数 / 秒
+  - 服务进程的线程数、RSS、运行中任务数随时间的变化（/proc + /metrics 采样）
+  - 逐页渲染 / OCR 优先级队列中缩略图（interactive）与后台 OCR（background）的排队与执行耗时
+    （/render_queue）
+
+用法:
+  python benchmarks/load_test.py --users 8 --sessions 2 --mineru-latency 3
+  python benchmarks/load_test.py --url http://127.0.0.1:5000 --users 4   # 压测已运行的服务
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WEBAPP = os.path.join(HERE, '..', 'webapp')
+
+THUMB_BATCH       = 25     # 首屏缩略图数（同 index.html 的 PAGE_BATCH）
+CLAUSE_THUMBS     = 20     # 条文说明选择面板的缩略图数
+BROWSER_PARALLEL  = 6      # 浏览器对同一主机的并发连接数
+DETECT_POLL       = 1.5    # /detect 轮询间隔（同 index.html）
+
+
+def percentile(values, q):
+    """最近秩百分位；values 为空时返回 None。"""
+    if not values:
+        return None
+    s = sorted(values)
+    return s[min(len(s) - 1, max(0, int(round(q / 100 * len(s) + 0.5)) - 1))]
+
+
+class Recorder:
+    """线程安全地收集每个请求的 (路由, 状态码, 延迟秒)。"""
+
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+
+    def add(self, route, status, seconds):
+        with self._lock:
+            self.records.append((route, status, seconds, time.time()))
+
+    def timed(self, session, method, route, url, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            resp = session.request(method, url, timeout=kwargs.pop('timeout', 120), **kwargs)
+        except requests.RequestException:
+            self.add(route, 0, time.perf_counter() - t0)
+            raise
+        self.add(route, resp.status_code, time.perf_counter() - t0)
+        return resp
+
+    def summary(self):
+        routes = {}
+        for route, status, seconds, _ in self.records:
+            r = routes.setdefault(route, {'latencies': [], 'errors': 0})
+            r['latencies'].append(seconds)
+            if not 200 <= status < 300:
+                r['errors'] += 1
+        out = {}
+        for route, r in routes.items():
+            lat = r['latencies']
+            out[route] = {'count': len(lat), 'errors': r['errors'],
+                          **{f'p{q}': round(percentile(lat, q) * 1000, 1) for q in (50, 95, 99)},
+                          'max': round(max(lat) * 1000, 1)}
+        return out
+
+
+class User:
+    """一个模拟用户：按网页版的调用顺序跑完若干次会话。"""
+
+    def __init__(self, base, rec, pdf_bytes, clause_pages, unique=True):
+        self.base, self.rec = base, rec
+        self.pdf_bytes, self.clause_pages, self.unique = pdf_bytes, clause_pages, unique
+        self.sess = requests.Session()
+        self.thumbs = ThreadPoolExecutor(BROWSER_PARALLEL)
+
+    def _thumb_burst(self, job_id, pages):
+        def _get(n):
+            s = requests.Session()
+            try:
+                self.rec.timed(s, 'GET', '/thumbnail', f'{self.base}/thumbnail/{job_id}/{n}')
+            except requests.RequestException:
+                pass
+        list(self.thumbs.map(_get, pages))
+
+    def _upload(self, data):
+        """同 index.html 的 uploadChunked：init → 按 chunk_size 顺序 PUT → complete。"""
+        r = self.rec.timed(self.sess, 'POST', '/upload/init', f'{self.base}/upload/init',
+                           json={'filename': 'load_test.pdf', 'size': len(data)})
+        if r.status_code != 200:
+            return {'error': f'upload/init {r.status_code}'}
+        init = r.json()
+        upload_id, chunk = init['upload_id'], init['chunk_size']
+        offset = 0
+        while offset < len(data):
+            r = self.rec.timed(self.sess, 'PUT', '/upload/chunk',
+                               f'{self.base}/upload/{upload_id}?offset={offset}',
+                               data=data[offset:offset + chunk])
+            if r.status_code != 200:
+                return {'error': f'upload/chunk {r.status_code}'}
+            offset = r.json()['received']
+        r = self.rec.timed(self.sess, 'POST', '/upload/complete',
+                           f'{self.base}/upload/{upload_id}/complete')
+        if r.status_code != 200:
+            return {'error': f'upload/complete {r.status_code}'}
+        return r.json()
+
+    def session(self):
+        """跑一次完整会话，返回 {'ok', 'job_seconds', 'error'}。"""
+        data = self.pdf_bytes
+        if self.unique:
+            data += f'\n% load-test {uuid.uuid4().hex}\n'.encode()
+        up = self._upload(data)
+        if 'error' in up:
+            return {'ok': False, 'error': up['error']}
+        job_id, total = up['job_id'], up['total_pages']
+
+        # 首屏缩略图与检测轮询同时进行（页面一加载就开始轮询）
+        burst = threading.Thread(target=self._thumb_burst,
+                                 args=(job_id, range(min(THUMB_BATCH, total))))
+        burst.start()
+        pages = None
+        deadline = time.time() + 180
+        while time.time() < deadline:
+            time.sleep(DETECT_POLL)
+            d = self.rec.timed(self.sess, 'GET', '/detect', f'{self.base}/detect/{job_id}').json()
+            if d.get('status') == 'done':
+                pages = d.get('pages') or [0]
+                break
+        burst.join()
+        if pages is None:
+            return {'ok': False, 'error': 'detect timeout'}
+
+        t_start = time.perf_counter()
+        r = self.rec.timed(self.sess, 'POST', '/start', f'{self.base}/start/{job_id}',
+                           json={'toc_pages': pages})
+        if r.status_code != 200:
+            return {'ok': False, 'error': f'start {r.status_code}'}
+
+        status = self._follow_progress(job_id, total)
+        job_seconds = time.perf_counter() - t_start
+        if status != 'done':
+            return {'ok': False, 'error': status, 'job_seconds': job_seconds}
+
+        r = self.rec.timed(self.sess, 'GET', '/download', f'{self.base}/download/{job_id}')
+        if r.status_code != 200:
+            return {'ok': False, 'error': f'download {r.status_code}', 'job_seconds': job_seconds}
+        return {'ok': True, 'job_seconds': job_seconds}
+
+    def _follow_progress(self, job_id, total):
+        """读 SSE 直到 end；select_clause 时模拟用户选择条文说明目录页。返回 'done' 或错误信息。"""
+        t0 = time.perf_counter()
+        first = True
+        status = 'stream ended'
+        try:
+            with self.sess.get(f'{self.base}/progress/{job_id}', stream=True,
+                               timeout=(10, 120)) as resp:
+                # 按字节分行再解码：text/event-stream 没有 charset，requests 会按 latin-1 解码，
+                # str.splitlines 又会在 \x85 等字符处断行
+                for raw in resp.iter_lines():
+                    line = raw.decode('utf-8')
+                    if not line.startswith('data: '):
+                        continue
+                    if first:
+                        self.rec.add('/progress', resp.status_code, time.perf_counter() - t0)
+                        first = False
+                    ev = json.loads(line[6:])
+                    if ev['type'] == 'select_clause':
+                        start = ev.get('clause_page') or 0
+                        self._thumb_burst(job_id, range(start, min(start + CLAUSE_THUMBS, total)))
+                        self.rec.timed(self.sess, 'POST', '/start_clause',
+                                       f'{self.base}/start_clause/{job_id}',
+                                       json={'clause_pages': self.clause_pages})
+                    elif ev['type'] == 'done':
+                        status = 'done'
+                    elif ev['type'] == 'error':
+                        status = f"error: {ev.get('msg')}"
+                    elif ev['type'] == 'end':
+                        break
+        except requests.RequestException as exc:
+            if first:
+                self.rec.add('/progress', 0, time.perf_counter() - t0)
+            return f'progress: {exc}'
+        return status
+
+
+def _proc_status(pid):
+    """(线程数, RSS MB)；非 Linux 或进程不存在时为 (None, None)。"""
+    try:
+        with open(f'/proc/{pid}/status') as fh:
+            fields = dict(line.split(':', 1) for line in fh if ':' in line)
+        return int(fields['Threads']), round(int(fields['VmRSS'].split()[0]) / 1024, 1)
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def _scrape(base, name):
+    """从 /metrics 读取无标签 gauge 的值。"""
+    try:
+        for line in requests.get(f'{base}/metrics', timeout=5).text.splitlines():
+            if line.startswith(name + ' '):
+                return float(line.split()[1])
+    except requests.RequestException:
+        pass
+    return None
+
+
+def _render_queue_stats(base):
+    try:
+        return requests.get(f'{base}/render_queue', timeout=5).json()
+    except (requests.RequestException, ValueError):
+        return None
+
+
+def sample_resources(base, pid, interval, stop, out):
+    t0 = time.time()
+    while not stop.wait(interval):
+        threads, rss = _proc_status(pid) if pid else (None, None)
+        out.append({'t': round(time.time() - t0, 1), 'threads': threads, 'rss_mb': rss,
+                    'jobs_in_flight': _scrape(base, 'pdfbm_jobs_in_flight')})
+
+
+def _start_server(tmp, mineru_api, toc_library):
+    """子进程启动 Flask 服务（独立 UPLOAD_DIR），返回 (Popen, base_url)。"""
+    import socket
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    env = dict(os.environ,
+               UPLOAD_DIR=os.path.join(tmp, 'uploads'),
+               TOC_LIBRARY='1' if toc_library else '0',
+               TOC_LIBRARY_DIR=os.path.join(tmp, 'toc_library'),
+               AI_CACHE_DIR=os.path.join(tmp, 'ai_cache'),
+               MINERU_API_BASE=mineru_api,
+               MINERU_API_TOKEN=os.environ.get('MINERU_API_TOKEN') or 'stub',
+               MINERU_POLL_INTERVAL=os.environ.get('MINERU_POLL_INTERVAL') or '0.5')
+    code = ('import sys; sys.path.insert(0, sys.argv[1]); import app; '
+            'app.app.run(host="127.0.0.1", port=int(sys.argv[2]), threaded=True)')
+    log = open(os.path.join(tmp, 'server.log'), 'w')
+    proc = subprocess.Popen([sys.executable, '-c', code, WEBAPP, str(port)],
+                            env=env, stdout=log, stderr=subprocess.STDOUT)
+    base = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f'服务启动失败，见 {log.name}')
+        try:
+            requests.get(base + '/metrics', timeout=2)
+            return proc, base
+        except requests.RequestException:
+            time.sleep(0.3)
+    proc.kill()
+    raise RuntimeError('服务启动超时')
+
+
+def _print_report(report):
+    print(f"\n{'路由':16s} {'请求':>6s} {'错误':>5s} {'p50(ms)':>9s} {'p95(ms)':>9s} "
+          f"{'p99(ms)':>9s} {'max(ms)':>9s}")
+    for route, r in sorted(report['routes'].items()):
+        print(f"{route:16s} {r['count']:6d} {r['errors']:5d} {r['p50']:9.1f} {r['p95']:9.1f} "
+              f"{r['p99']:9.1f} {r['max']:9.1f}")
+    job = report['job_seconds']
+    if job['count']:
+        print(f"{'任务 start→done':14s} {job['count']:6d} {'':5s} {job['p50'] * 1000:9.1f} "
+              f"{job['p95'] * 1000:9.1f} {job['p99'] * 1000:9.1f} {job['max'] * 1000:9.1f}")
+    t = report['throughput']
+    print(f"\n会话: 成功 {t['sessions_ok']} / 失败 {t['sessions_failed']}，耗时 {t['wall_seconds']:.1f}s，"
+          f"{t['sessions_per_minute']:.1f} 会话/分钟，{t['requests_per_second']:.1f} 请求/秒")
+    for err in report['errors'][:10]:
+        print(f'  ✗ {err}')
+
+    samples = report['resources']
+    if samples:
+        step = max(1, len(samples) // 15)
+        print(f"\n{'时间(s)':>7s} {'线程':>6s} {'RSS(MB)':>8s} {'运行中任务':>6s}")
+        for s in samples[::step]:
+            fmt = lambda v, spec: format(v, spec) if v is not None else 'n/a'   # noqa: E731
+            print(f"{s['t']:7.1f} {fmt(s['threads'], '6d'):>6s} {fmt(s['rss_mb'], '8.1f'):>8s} "
+                  f"{fmt(s['jobs_in_flight'], '6.0f'):>10s}")
+        peak = lambda k: max((s[k] for s in samples if s[k] is not None), default=None)  # noqa: E731
+        print(f"峰值：线程 {peak('threads')}，RSS {peak('rss_mb')} MB，"
+              f"运行中任务 {peak('jobs_in_flight')}")
+
+    rq = report.get('render_queue')
+    if rq:
+        print(f"\n渲染队列（名额 {rq['slots']}）")
+        print(f"{'优先级':12s} {'次数':>7s} {'排队p50':>9s} {'排队p95':>9s} {'排队max':>9s} "
+              f"{'执行p50':>9s} {'执行p95':>9s}  (ms)")
+        fmt = lambda v: format(v, '9.1f') if v is not None else f"{'n/a':>9s}"   # noqa: E731
+        for name, st in rq['priorities'].items():
+            print(f"{name:12s} {st['count']:7d} {fmt(st['wait_p50_ms'])} {fmt(st['wait_p95_ms'])} "
+                  f"{fmt(st['wait_max_ms'])} {fmt(st['run_p50_ms'])} {fmt(st['run_p95_ms'])}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='网页版并发压测（真实路由顺序 + MinerU 桩服务）')
+    ap.add_argument('--users', type=int, default=4, help='并发用户数')
+    ap.add_argument('--sessions', type=int, default=1, help='每个用户的会话次数')
+    ap.add_argument('--ramp', type=float, default=2.0, help='在多少秒内逐个启动用户')
+    ap.add_argument('--pages', type=int, default=80, help='合成语料页数')
+    ap.add_argument('--no-clause', action='store_true', help='语料不含条文说明')
+    ap.add_argument('--pdf', help='改用指定 PDF（不做条文说明选择）')
+    ap.add_argument('--dedup', action='store_true', help='所有用户上传同一文件（命中去重缓存）')
+    ap.add_argument('--mineru-latency', type=float, default=2.0, help='MinerU 每批次模拟耗时（秒）')
+    ap.add_argument('--mineru-page-latency', type=float, default=0.0,
+                    help='MinerU 每页追加的模拟耗时（秒）')
+    ap.add_argument('--toc-library', action='store_true', help='开启目录指纹库（默认关闭）')
+    ap.add_argument('--url', help='压测已运行的服务（不启动服务与 MinerU 桩）')
+    ap.add_argument('--pid', type=int, help='配合 --url：采样该服务进程的线程数与内存')
+    ap.add_argument('--sample-interval', type=float, default=1.0, help='资源采样间隔（秒）')
+    ap.add_argument('--out', help='JSON 报告输出路径')
+    args = ap.parse_args(argv)
+
+    tmp = tempfile.mkdtemp(prefix='load_test_')
+    if args.pdf:
+        with open(args.pdf, 'rb') as fh:
+            pdf_bytes = fh.read()
+        clause_pages = None
+    else:
+        import synth_corpus
+        path, truth = synth_corpus.generate(os.path.join(HERE, 'corpus'), args.pages,
+                                            clause=not args.no_clause)
+        with open(path, 'rb') as fh:
+            pdf_bytes = fh.read()
+        clause_pages = truth['clause_toc_pages']
+
+    proc = stub = None
+    try:
+        if args.url:
+            base, pid = args.url.rstrip('/'), args.pid
+        else:
+            import mineru_stub
+            stub = mineru_stub.serve(latency=args.mineru_latency,
+                                     page_latency=args.mineru_page_latency)
+            proc, base = _start_server(tmp, stub.api_base, args.toc_library)
+            pid = proc.pid
+        print(f'服务 {base}，{args.users} 个用户 × {args.sessions} 次会话，'
+              f'MinerU 延迟 {args.mineru_latency}s')
+
+        rec, results, samples = Recorder(), [], []
+        stop = threading.Event()
+        sampler = threading.Thread(target=sample_resources,
+                                   args=(base, pid, args.sample_interval, stop, samples),
+                                   daemon=True)
+        sampler.start()
+
+        def _user(i):
+            time.sleep(args.ramp * i / max(1, args.users))
+            user = User(base, rec, pdf_bytes, clause_pages, unique=not args.dedup)
+            for _ in range(args.sessions):
+                try:
+                    results.append(user.session())
+                except Exception as exc:     # 网络错误等：记为失败的会话
+                    results.append({'ok': False, 'error': f'{type(exc).__name__}: {exc}'})
+            user.thumbs.shutdown()
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(args.users) as pool:
+            list(pool.map(_user, range(args.users)))
+        wall = time.perf_counter() - t0
+        stop.set()
+        sampler.join()
+        render_queue = _render_queue_stats(base)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=10)
+        if stub is not None:
+            stub.shutdown()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    ok = [r for r in results if r['ok']]
+    job = [r['job_seconds'] for r in results if r.get('job_seconds') is not None]
+    report = {
+        'created':  time.strftime('%Y-%m-%d %H:%M:%S'),
+        'settings': {k: v for k, v in vars(args).items() if k not in ('out',)},
+        'routes':   rec.summary(),
+        'job_seconds': {'count': len(job),
+                        **{f'p{q}': percentile(job, q) for q in (50, 95, 99)},
+                        'max': max(job, default=None)},
+        'throughput': {'sessions_ok': len(ok), 'sessions_failed': len(results) - len(ok),
+                       'wall_seconds': round(wall, 2),
+                       'sessions_per_minute': round(len(ok) / wall * 60, 2),
+                       'requests_per_second': round(len(rec.records) / wall, 2)},
+        'errors':    [r['error'] for r in results if not r['ok']],
+        'resources': samples,
+        'render_queue': render_queue,
+    }
+    _print_report(report)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as fh:
+            json.dump(report, fh, ensure_ascii=False, indent=2)
+        print(f'\n报告已写入 {args.out}')
+    return 0 if len(ok) == len(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,192 @@
+"""
+本地 MinerU Cloud API 桩服务，用于离线跑通完整流水线（基准测试、压测）
+  - POST /api/v4/file-urls/batch              → {batch_id, file_urls: [上传地址]}
+  - PUT  /upload/<batch_id>                   → 接收 PDF
+  - GET  /api/v4/extract-results/batch/<id>   → waiting-file / running / done
+  - GET  /zip/<batch_id>.zip                  → <name>_content_list.json + full.md
+  - 识别结果：有文本层的页直接取文本；纯图片页按图片流摘要查“OCR 答案表”
+    （合成语料生成栅格化 PDF 时写出的 ocr_oracle.json），查不到则为空
+  - --latency / --page-latency 模拟排队与解析耗时：上传后经过
+    latency + 页数 × page-latency 秒才返回 done
+
+用法:
+  python benchmarks/mineru_stub.py --port 8012 --latency 3 --oracle corpus/ocr_oracle.json
+  MINERU_API_BASE=http://127.0.0.1:8012/api/v4 MINERU_API_TOKEN=stub \\
+      MINERU_POLL_INTERVAL=0.5 python webapp/app.py
+"""
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import hashlib
+import zipfile
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import fitz
+
+
+def page_image_digest(doc, page):
+    """纯图片页的图片流摘要（insert_pdf 原样复制图片流，拆页后摘要不变）；无图片返回 None。"""
+    images = page.get_images(full=True)
+    if not images:
+        return None
+    h = hashlib.sha1()
+    for img in images:
+        h.update(doc.xref_stream_raw(img[0]) or b'')
+    return h.hexdigest()
+
+
+def content_list(pdf_bytes, oracle):
+    """模拟 MinerU 的 content_list：每个非空文本行一项。"""
+    items = []
+    with fitz.open(stream=pdf_bytes, filetype='pdf') as doc:
+        for i, page in enumerate(doc):
+            text = page.get_text()
+            if not text.strip():
+                text = oracle.get(page_image_digest(doc, page), '')
+            for line in text.splitlines():
+                if line.strip():
+                    items.append({'type': 'text', 'text': line.strip(), 'page_idx': i})
+    return items
+
+
+def _page_count(pdf_bytes):
+    try:
+        with fitz.open(stream=pdf_bytes, filetype='pdf') as doc:
+            return len(doc)
+    except Exception:
+        return 0
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, fmt, *args):
+        if not self.server.quiet:
+            super().log_message(fmt, *args)
+
+    def _json(self, obj, status=200):
+        payload = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/api/v4/file-urls/batch':
+            self.send_error(404)
+            return
+        req = json.loads(self._body() or b'{}')
+        name = (req.get('files') or [{}])[0].get('name', 'file.pdf')
+        batch_id = uuid.uuid4().hex
+        with self.server.lock:
+            self.server.batches[batch_id] = {'name': name, 'pdf': None, 'ready_at': None}
+            self.server.stats['batches'] += 1
+        host = f'http://127.0.0.1:{self.server.server_port}'
+        self._json({'code': 0, 'msg': 'ok', 'data': {
+            'batch_id': batch_id, 'file_urls': [f'{host}/upload/{batch_id}']}})
+
+    def do_PUT(self):
+        batch_id = self.path.rsplit('/', 1)[-1]
+        data = self._body()
+        with self.server.lock:
+            batch = self.server.batches.get(batch_id)
+            if batch is None:
+                self.send_error(404)
+                return
+            self.server.stats['uploaded_bytes'] += len(data)
+        delay = self.server.latency + _page_count(data) * self.server.page_latency
+        batch.update(pdf=data, ready_at=time.time() + delay)
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        parts = self.path.strip('/').split('/')
+        if parts[:3] == ['api', 'v4', 'extract-results'] and len(parts) == 5:
+            batch = self.server.batches.get(parts[4])
+            if batch is None:
+                self._json({'code': -1, 'msg': 'batch not found'})
+                return
+            host = f'http://127.0.0.1:{self.server.server_port}'
+            if batch['ready_at'] is None:
+                state = {'state': 'waiting-file'}
+            elif time.time() < batch['ready_at']:
+                state = {'state': 'running'}
+            else:
+                state = {'state': 'done', 'full_zip_url': f'{host}/zip/{parts[4]}.zip'}
+            self._json({'code': 0, 'data': {'batch_id': parts[4], 'extract_result': [
+                dict(state, file_name=batch['name'], err_msg='')]}})
+        elif parts[0] == 'zip' and len(parts) == 2:
+            batch = self.server.batches.get(parts[1][:-len('.zip')])
+            if batch is None or batch['pdf'] is None:
+                self.send_error(404)
+                return
+            items = content_list(batch['pdf'], self.server.oracle)
+            stem  = os.path.splitext(batch['name'])[0]
+            buf   = io.BytesIO()
+            with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as zf:
+                zf.writestr(f'{stem}_content_list.json', json.dumps(items, ensure_ascii=False))
+                zf.writestr('full.md', '\n\n'.join(it['text'] for it in items))
+            payload = buf.getvalue()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/zip')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        else:
+            self.send_error(404)
+
+
+def load_oracle(paths):
+    oracle = {}
+    for path in paths or ():
+        with open(path, encoding='utf-8') as fh:
+            oracle.update(json.load(fh))
+    return oracle
+
+
+def serve(port=0, latency=0.0, page_latency=0.0, oracle=None, quiet=True):
+    """
+    在后台线程启动桩服务，返回 server：
+      server.api_base    供 MINERU_API_BASE 使用的地址
+      server.oracle      {图片流摘要: 文本}，可在运行中追加
+      server.stats       {batches, uploaded_bytes}
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+    server.daemon_threads = True
+    server.latency, server.page_latency, server.quiet = latency, page_latency, quiet
+    server.oracle  = dict(oracle or {})
+    server.batches = {}
+    server.stats   = {'batches': 0, 'uploaded_bytes': 0}
+    server.lock    = threading.Lock()
+    server.api_base = f'http://127.0.0.1:{server.server_port}/api/v4'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='本地 MinerU Cloud API 桩服务')
+    ap.add_argument('--port', type=int, default=8012)
+    ap.add_argument('--latency', type=float, default=0.0, help='每个批次的固定解析耗时（秒）')
+    ap.add_argument('--page-latency', type=float, default=0.0, help='每页追加的解析耗时（秒）')
+    ap.add_argument('--oracle', action='append', help='栅格化页的 OCR 答案表（可多次指定）')
+    args = ap.parse_args(argv)
+    server = serve(args.port, args.latency, args.page_latency,
+                   load_oracle(args.oracle), quiet=False)
+    print(f'MinerU 桩服务: MINERU_API_BASE={server.api_base}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
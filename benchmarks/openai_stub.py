@@ -0,0 +1,112 @@
+"""
+本地 OpenAI 兼容桩服务（/chat/completions），用于离线验证 AI 目录解析
+  - 从提示词中取出 OCR 文本，用正则解析器生成“模型输出”
+  - 支持 stream=true（SSE 分片返回）与普通 JSON 返回
+  - --delay 模拟模型首包延迟，--max-entries 模拟 max_tokens 截断（finish_reason=length）
+
+用法:
+  python benchmarks/openai_stub.py --port 8011 --delay 0.5
+  DEEPSEEK_BASE_URL=http://127.0.0.1:8011 DEEPSEEK_API_KEY=stub python webapp/app.py
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'webapp'))
+
+import pipeline_core  # noqa: E402
+
+
+def _answer(prompt, max_entries):
+    """返回 (模型输出文本, finish_reason)。"""
+    text = prompt.split('OCR文本：\n', 1)[-1].split('\n\n返回JSON', 1)[0]
+    entries = [e for e in map(pipeline_core._parse_toc_line, text.splitlines()) if e]
+    finish = 'stop'
+    if max_entries and len(entries) > max_entries:
+        entries, finish = entries[:max_entries], 'length'
+    body = json.dumps([{'level': l, 'section': s, 'title': t, 'page': p}
+                       for l, s, t, p in entries], ensure_ascii=False)
+    if finish == 'length':
+        body = body[:-1] + ', {"level": 2, "sec'     # 截断在对象中间
+    return body, finish
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, fmt, *args):
+        if not self.server.quiet:
+            super().log_message(fmt, *args)
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self.send_error(404)
+            return
+        req = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        with self.server.lock:
+            self.server.requests += 1
+        time.sleep(self.server.delay)
+        body, finish = _answer(req['messages'][-1]['content'], self.server.max_entries)
+        base = {'id': 'stub', 'created': int(time.time()), 'model': req.get('model', 'stub')}
+
+        if not req.get('stream'):
+            payload = json.dumps(dict(base, object='chat.completion', choices=[{
+                'index': 0, 'finish_reason': finish,
+                'message': {'role': 'assistant', 'content': body}}],
+                usage={'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}),
+                ensure_ascii=False).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+
+        def _send(delta, reason=None):
+            chunk = dict(base, object='chat.completion.chunk', choices=[{
+                'index': 0, 'delta': delta, 'finish_reason': reason}])
+            self.wfile.write(f'data: {json.dumps(chunk, ensure_ascii=False)}\n\n'.encode('utf-8'))
+            self.wfile.flush()
+
+        _send({'role': 'assistant', 'content': ''})
+        for i in range(0, len(body), 64):
+            _send({'content': body[i:i + 64]})
+        _send({}, finish)
+        self.wfile.write(b'data: [DONE]\n\n')
+
+
+def serve(port=0, delay=0.0, max_entries=0, quiet=True):
+    """在后台线程启动桩服务，返回 server（server.server_port / server.requests）。"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+    server.daemon_threads = True
+    server.delay, server.max_entries, server.quiet = delay, max_entries, quiet
+    server.lock, server.requests = threading.Lock(), 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='本地 OpenAI 兼容桩服务')
+    ap.add_argument('--port', type=int, default=8011)
+    ap.add_argument('--delay', type=float, default=0.0, help='每个请求的模拟延迟（秒）')
+    ap.add_argument('--max-entries', type=int, default=0,
+                    help='每个响应最多返回的条目数，超出时模拟截断（0=不限）')
+    args = ap.parse_args(argv)
+    server = serve(args.port, args.delay, args.max_entries, quiet=False)
+    print(f'OpenAI 兼容桩服务: http://127.0.0.1:{server.server_port}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
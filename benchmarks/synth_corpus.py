@@ -0,0 +1,331 @@
+"""
+合成中文规范 PDF 语料（带标准答案），供端到端基准使用
+  - 版式：封面 → 前言 → 目次 → 正文（章 / 节，页脚印刷页码）→ 附录 → 用词说明 →
+    引用标准名录 → [附：条文说明 → 条文说明目次 → 条文说明正文]
+  - 变体：文本层（born-digital）与栅格化（每页渲染为灰度图片，无文本层）
+  - 标准答案 <name>.truth.json：目录页、条文说明目录页、页码偏移、期望的最终书签
+  - 栅格化变体另写 <name>.oracle.json（{图片流摘要: 页面文本}），
+    供 MinerU 桩服务“识别”纯图片页
+同一参数生成的页面内容与标准答案完全相同；已存在且版本一致的文件不会重复生成。
+
+用法:
+  python benchmarks/synth_corpus.py OUT_DIR [--sizes 80,300,1000] [--variants text,raster]
+"""
+import os
+import sys
+import json
+import math
+import random
+import argparse
+
+import fitz
+
+from mineru_stub import page_image_digest
+
+CORPUS_VERSION = 2
+
+LINES_PER_PAGE     = 40
+TOC_LINES_PER_PAGE = 32
+RASTER_DPI         = 150
+
+_CHAPTERS = ['术语和符号', '基本规定', '材料', '结构分析', '承载能力极限状态计算',
+             '正常使用极限状态验算', '构造规定', '结构构件的基本规定', '预应力混凝土结构构件',
+             '混凝土结构构件抗震设计', '地基基础', '施工', '质量验收', '耐久性设计',
+             '防火设计', '检测与评定', '加固', '维护', '安全监测']
+_SECTIONS = ['一般规定', '设计要求', '计算方法', '构造要求', '材料性能', '荷载与作用',
+             '正截面承载力', '斜截面承载力', '裂缝控制', '变形验算', '连接', '锚固',
+             '施工要求', '检验方法', '验收标准']
+_APPENDICES = ['素混凝土结构构件设计', '任意截面构件正截面承载力计算', '钢筋与混凝土本构关系',
+               '混凝土多轴强度和本构关系']
+_PHRASES = ['结构构件应根据承载能力极限状态及正常使用极限状态的要求',
+            '按下列规定进行计算和验算', '混凝土强度等级应按立方体抗压强度标准值确定',
+            '当有可靠经验时可适当调整', '设计时应考虑施工阶段的不利影响',
+            '受力钢筋的混凝土保护层厚度不应小于钢筋的公称直径',
+            '对直接承受动力荷载的构件应进行疲劳验算', '本条规定了结构设计的基本原则',
+            '应符合国家现行有关标准的规定', '计算时可采用弹性分析方法']
+
+
+def _paragraph(rnd, number):
+    """一条正文：编号 + 2~5 行文字，行尾不带数字。"""
+    lines = [f'{number} {rnd.choice(_PHRASES)}，']
+    for _ in range(rnd.randint(1, 4)):
+        lines.append(rnd.choice(_PHRASES) + '。')
+    return lines
+
+
+def _toc_line(rnd, sec, title, page):
+    label = f'{sec} {title}'.strip()
+    r = rnd.random()
+    if r < 0.7:
+        return label + '…' * max(3, 24 - len(label)) + str(page)
+    if r < 0.85:
+        return f'{label}（{page}）'
+    return f'{label} {"." * 10} {page}'
+
+
+def _split(lines, n):
+    """目录行均分到 n 页。"""
+    per = math.ceil(len(lines) / n)
+    return [lines[i * per:(i + 1) * per] for i in range(n)]
+
+
+def _allocate(rnd, units, budget):
+    """把 budget 页分给各单元（每个至少 1 页），返回页数列表。"""
+    if budget < len(units):
+        raise ValueError('页数太少，容纳不下全部章节')
+    weights = [rnd.uniform(0.5, 2.0) for _ in units]
+    total   = sum(weights)
+    counts  = [1 + int((budget - len(units)) * w / total) for w in weights]
+    for i in range(budget - sum(counts)):
+        counts[i % len(counts)] += 1
+    return counts
+
+
+def _structure(rnd, pages):
+    """章节结构：[(章号, 章名, [(节号, 节名), ...]), ...]；第 1 章“总则”没有节。"""
+    n_ch = max(3, min(len(_CHAPTERS) + 1, pages // 45))
+    chapters = [(1, '总则', [])]
+    for c in range(2, n_ch + 1):
+        n_sec = 2 if c == 2 else rnd.randint(2, 8)
+        secs  = [(f'{c}.{s}', rnd.choice(_SECTIONS)) for s in range(1, n_sec + 1)]
+        chapters.append((c, _CHAPTERS[c - 2], secs))
+    return chapters
+
+
+def _units(chapters):
+    """正文单元：每个节（无节的章为整章）从新页开始；返回 [(章, 节或 None), ...]。"""
+    out = []
+    for ch in chapters:
+        out.extend([(ch, sec) for sec in ch[2]] or [(ch, None)])
+    return out
+
+
+def _body_pages(rnd, units, counts, prefix=''):
+    """单元 → 页面行列表，同时返回每个单元首页在本段中的序号。"""
+    pages, starts = [], []
+    for (ch, sec), n in zip(units, counts):
+        c, ch_title, secs = ch
+        starts.append(len(pages))
+        head = []
+        if sec is None or sec == secs[0]:
+            head.append(f'{c} {ch_title}')
+        if sec is not None:
+            head.append(f'{sec[0]} {sec[1]}')
+        base = sec[0] if sec is not None else f'{c}.0'
+        k = 1
+        for p in range(n):
+            lines = list(head) if p == 0 else []
+            while len(lines) < LINES_PER_PAGE - 6:
+                lines.extend(_paragraph(rnd, f'{prefix}{base}.{k}'))
+                k += 1
+            pages.append(lines)
+    return pages, starts
+
+
+def build_document(pages, clause=True, seed=0):
+    """
+    生成文档内容。返回 (每页文本行列表, 标准答案 dict)。
+    书页码 1 从正文第一页开始，之后连续编号（含条文说明）。
+    """
+    rnd      = random.Random(f'{seed}-{pages}-{clause}')
+    code     = f'GB {rnd.randint(50001, 50999)}-20{rnd.randint(10, 25)}'
+    title    = rnd.choice(['混凝土结构设计标准', '建筑地基基础设计规范', '钢结构设计标准',
+                           '砌体结构设计规范', '建筑抗震设计标准'])
+    chapters = _structure(rnd, pages)
+    units    = _units(chapters)
+    apps     = [(f'附录{chr(65 + i)}', _APPENDICES[i]) for i in range(2 if pages < 300 else 4)]
+
+    main_entries = []   # (level, section, title, 单元标识)
+    for c, ch_title, secs in chapters:
+        main_entries.append((1, str(c), ch_title, ('unit', c, None)))
+        for sec, sec_title in secs:
+            main_entries.append((2, sec, sec_title, ('unit', c, sec)))
+    main_entries += [(1, a, t, ('app', a)) for a, t in apps]
+    main_entries += [(1, '本规范用词说明', '', ('words',)), (1, '引用标准名录', '', ('refs',))]
+    if clause:
+        main_entries.append((1, '条文说明', '', ('clause',)))
+    clause_entries = [e for e in main_entries if e[3][0] == 'unit'] if clause else []
+
+    front   = 2 if pages < 300 else 3
+    toc_n   = math.ceil((len(main_entries) + 1) / TOC_LINES_PER_PAGE)
+    ctoc_n  = math.ceil((len(clause_entries) + 1) / TOC_LINES_PER_PAGE) if clause else 0
+    app_n   = [rnd.randint(1, 3) for _ in apps]
+    fixed   = front + toc_n + sum(app_n) + 2 + (1 + ctoc_n if clause else 0)
+    budget  = pages - fixed
+    c_units = _units(chapters) if clause else []
+    c_budget = max(len(c_units), budget // 5) if clause else 0
+    main_pages, main_starts = _body_pages(rnd, units, _allocate(rnd, units, budget - c_budget))
+    if clause:
+        c_pages, c_starts = _body_pages(rnd, c_units, _allocate(rnd, c_units, c_budget))
+
+    # ── 按书页码排版 ────────────────────────────────────────────────
+    book = []                 # 正文起的每页行列表（书页码 = 下标 + 1）
+    first_page = {}           # 单元标识 → 书页码
+    for (ch, sec), start in zip(units, main_starts):
+        key = ('unit', ch[0], sec[0] if sec else None)
+        first_page[key] = start + 1
+        if sec is not None and sec == ch[2][0]:
+            first_page[('unit', ch[0], None)] = start + 1
+    book.extend(main_pages)
+    for (a, t), n in zip(apps, app_n):
+        first_page[('app', a)] = len(book) + 1
+        k = 1
+        for p in range(n):
+            lines = [f'{a} {t}'] if p == 0 else []
+            while len(lines) < LINES_PER_PAGE - 6:
+                lines.extend(_paragraph(rnd, f'{a[-1]}.0.{k}'))
+                k += 1
+            book.append(lines)
+    first_page[('words',)] = len(book) + 1
+    book.append(['本规范用词说明',
+                 '1 为便于在执行本规范条文时区别对待，对要求严格程度不同的用词说明如下：',
+                 '1）表示很严格，非这样做不可的：正面词采用“必须”，反面词采用“严禁”；',
+                 '2）表示严格，在正常情况下均应这样做的：正面词采用“应”，反面词采用“不应”或“不得”。',
+                 '2 条文中指明应按其他有关标准执行的写法为：“应符合……的规定”或“应按……执行”。'])
+    first_page[('refs',)] = len(book) + 1
+    book.append(['引用标准名录'] + [f'{i} 《{rnd.choice(_CHAPTERS)}标准》GB 5{rnd.randint(1000, 9999)}'
+                                   for i in range(1, 9)])
+    clause_toc_book = []
+    if clause:
+        first_page[('clause',)] = len(book) + 1
+        book.append(['中华人民共和国国家标准', title, code, '', '条文说明', '',
+                     '修订说明', f'《{title}》{code}，经住房和城乡建设部公告批准发布。',
+                     '为便于广大设计、施工、科研、学校等单位有关人员在使用本标准时能正确理解和执行条文规定，',
+                     '编制组按章、节、条顺序编制了本标准的条文说明，对条文规定的目的、依据以及执行中需注意的有关事项进行了说明。'])
+        c_first = {}
+        for (ch, sec), start in zip(c_units, c_starts):
+            c_first[(ch[0], sec[0] if sec else None)] = start
+            if sec is not None and sec == ch[2][0]:
+                c_first[(ch[0], None)] = start
+        c_base = len(book) + ctoc_n + 1       # 条文说明正文第一页的书页码
+        c_toc_lines = ['目次'] + [
+            _toc_line(rnd, sec, t, c_base + c_first[(key[1], key[2])])
+            for _, sec, t, key in clause_entries]
+        for lines in _split(c_toc_lines, ctoc_n):
+            clause_toc_book.append(len(book))
+            book.append(lines)
+        book.extend(c_pages)
+
+    # ── 封面、前言、目次 ────────────────────────────────────────────
+    doc_pages = [['中华人民共和国国家标准', '', title, '', code, '',
+                  '主编部门：中国建筑科学研究院', '批准部门：中华人民共和国住房和城乡建设部',
+                  f'施行日期：20{rnd.randint(10, 26)}年{rnd.randint(1, 12)}月1日', '',
+                  '中国建筑工业出版社', '北京']]
+    for _ in range(front - 1):
+        lines = ['前言']
+        while len(lines) < LINES_PER_PAGE - 10:
+            lines.extend(_paragraph(rnd, '')[1:])
+        doc_pages.append(lines)
+    toc_lines = ['目次'] + [_toc_line(rnd, sec, t, first_page[key])
+                          for _, sec, t, key in main_entries]
+    toc_pages = []
+    for lines in _split(toc_lines, toc_n):
+        toc_pages.append(len(doc_pages))
+        doc_pages.append(lines)
+    offset = len(doc_pages)
+    for n, lines in enumerate(book, 1):
+        doc_pages.append(lines + ['', f'— {n} —'])
+
+    def _full(sec, t):
+        return f'{sec}  {t}' if t else sec
+
+    bookmarks = [[1, '目录', toc_pages[0] + 1, False, '目录']]
+    for level, sec, t, key in main_entries:
+        bookmarks.append([level, sec, first_page[key] + offset, False, _full(sec, t)])
+        if key == ('clause',):
+            bookmarks += [[c_level + 1, c_sec, c_base + c_first[(k[1], k[2])] + offset, True,
+                           _full(c_sec, c_t)]
+                          for c_level, c_sec, c_t, k in clause_entries]
+    truth = {
+        'version':          CORPUS_VERSION,
+        'pages':            len(doc_pages),
+        'title':            title,
+        'clause':           clause,
+        'seed':             seed,
+        'toc_pages':        toc_pages,
+        'offset':           offset,
+        'clause_toc_pages': [p + offset for p in clause_toc_book] or None,
+        'bookmarks':        bookmarks,    # [level, 章节号, PDF 页码(1-indexed), 是否条文说明子书签, 标题]
+    }
+    return doc_pages, truth
+
+
+def _write_text_pdf(doc_pages, path):
+    doc = fitz.open()
+    for lines in doc_pages:
+        page = doc.new_page(width=595, height=842)
+        page.insert_text((60, 60), '\n'.join(lines), fontname='china-s', fontsize=10.5)
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+
+
+def _write_raster_pdf(text_pdf, path):
+    """每页渲染为灰度 PNG 写入新 PDF（无文本层），返回 {图片流摘要: 页面文本}。"""
+    src, out = fitz.open(text_pdf), fitz.open()
+    for page in src:
+        pix = page.get_pixmap(dpi=RASTER_DPI, colorspace=fitz.csGRAY)
+        new = out.new_page(width=page.rect.width, height=page.rect.height)
+        new.insert_image(new.rect, stream=pix.tobytes('png'))
+    out.save(path, garbage=3, deflate=True)
+    out.close()
+    oracle = {}
+    with fitz.open(path) as doc:
+        for page, text_page in zip(doc, src):
+            oracle[page_image_digest(doc, page)] = text_page.get_text()
+    src.close()
+    return oracle
+
+
+def doc_name(pages, raster=False, clause=True, seed=0):
+    return (f'std_{pages:04d}p_{"scan" if raster else "text"}_'
+            f'{"clause" if clause else "noclause"}_s{seed}')
+
+
+def generate(out_dir, pages, raster=False, clause=True, seed=0):
+    """生成（或复用）一份语料，返回 (pdf 路径, 标准答案 dict)。"""
+    os.makedirs(out_dir, exist_ok=True)
+    name       = doc_name(pages, raster, clause, seed)
+    pdf_path   = os.path.join(out_dir, name + '.pdf')
+    truth_path = os.path.join(out_dir, name + '.truth.json')
+    try:
+        with open(truth_path, encoding='utf-8') as fh:
+            truth = json.load(fh)
+        if truth.get('version') == CORPUS_VERSION and os.path.exists(pdf_path):
+            return pdf_path, truth
+    except (OSError, ValueError):
+        pass
+
+    doc_pages, truth = build_document(pages, clause, seed)
+    truth['raster'] = raster
+    if raster:
+        text_pdf = pdf_path + '.text.tmp'
+        _write_text_pdf(doc_pages, text_pdf)
+        oracle = _write_raster_pdf(text_pdf, pdf_path)
+        os.remove(text_pdf)
+        with open(os.path.join(out_dir, name + '.oracle.json'), 'w', encoding='utf-8') as fh:
+            json.dump(oracle, fh, ensure_ascii=False)
+    else:
+        _write_text_pdf(doc_pages, pdf_path)
+    with open(truth_path, 'w', encoding='utf-8') as fh:
+        json.dump(truth, fh, ensure_ascii=False, indent=1)
+    return pdf_path, truth
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='生成带标准答案的合成规范 PDF 语料')
+    ap.add_argument('out_dir')
+    ap.add_argument('--sizes', default='80,300,1000', help='页数列表（逗号分隔）')
+    ap.add_argument('--variants', default='text,raster', help='text / raster')
+    ap.add_argument('--seed', type=int, default=0)
+    args = ap.parse_args(argv)
+    for pages in map(int, args.sizes.split(',')):
+        for variant in args.variants.split(','):
+            for clause in (True, False):
+                path, truth = generate(args.out_dir, pages, variant == 'raster', clause, args.seed)
+                print(f'{os.path.basename(path)}: {truth["pages"]} 页，目录页 {truth["toc_pages"]}，'
+                      f'{len(truth["bookmarks"])} 个书签')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,44 +3,114 @@ Flask 后端：PDF 书签注入工具网页版
 v1.0 - 2026-02-28
 路由:
   GET  /                          → index.html
-  POST /upload                    → {job_id, total_pages}
+  POST /upload[?profile=1]        → {job_id, total_pages, dedup}
+  POST /upload/init               → body:{filename, size}  → {upload_id, chunk_size}
+  GET  /upload/<upload_id>        → {size, received}  (断点续传查询)
+  PUT  /upload/<upload_id>?offset=N → 原始分块字节 → {received}
+  POST /upload/<upload_id>/complete[?profile=1] → {job_id, total_pages, dedup}
   GET  /thumbnail/<job_id>/<n>    → PNG 缩略图（第 n 页，0-indexed）
-  GET  /detect/<job_id>           → {status, pages}  (轮询目录页自动检测)
-  POST /start/<job_id>            → body:{toc_pages:[...]}  启动流水线
+  GET  /detect/<job_id>[?profile=1] → {status, pages}  (轮询目录页自动检测)
+  POST /start/<job_id>            → body:{toc_pages:[...], profile?}  启动流水线
   GET  /progress/<job_id>         → SSE 实时进度
   GET  /download/<job_id>         → 下载 final.pdf
+  GET  /download/<job_id>/profile → 剖析结果 zip（profile=1 或 PROFILE_JOBS=1 时生成）
+  GET  /bookmarks/<job_id>        → {offset, base_offset, total_pages, bookmarks:[{key, level, title, page}], overrides, order}
+  POST /bookmarks/<job_id>        → body:{edits?, offset?, offset_shift?, reset?}  改书签并重写 final.pdf
+  POST /api/batch                 → 批量提交（无需人工确认）→ {batch_id, documents}
+  GET  /api/batch/<batch_id>      → 批次汇总状态 + 每个文档的结果
+  GET  /api/batch/<batch_id>/<job_id> → 单个文档结果
+  GET  /storage                   → 磁盘占用、配额与每个 job 的字节数
+  GET  /timings/<job_id>          → 各步骤与热点函数耗时（timings.json）
+  GET  /metrics                   → Prometheus 文本格式指标
+  GET  /render_queue              → 逐页渲染 / OCR 优先级队列：名额、排队数、各优先级排队与执行耗时分位数
 """
+import io
 import os
 import uuid
 import time
+import socket
 import json
 import shutil
+import zipfile
 import threading
 from queue import Queue, Empty
+from concurrent.futures import ThreadPoolExecutor
 
 from flask import (Flask, request, jsonify, send_file,
                    stream_with_context, Response, render_template)
 
+import metrics
 import pipeline_core
+from page_index import PageIndex
+from profiling import PROFILE_JOBS, profiled, profile_files
+from upload_store import UploadStore, UploadError, CHUNK_SIZE
+from storage import StorageManager, UPLOAD_DIR
+from bookmarks import get_bookmarks, edit_bookmarks, BookmarkEditError
+from render_queue import RENDER_QUEUE
 
 app = Flask(__name__)
 
-UPLOAD_DIR = os.path.join(os.path.dirname(__file__), 'uploads')
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+_store   = UploadStore(UPLOAD_DIR)
+_storage = StorageManager(UPLOAD_DIR)
+
 # job 注册表
 # {job_id: {
 #   'queue':          Queue,
-#   'status':         'uploaded'|'detecting'|'selecting'|'running'|'done'|'error',
+#   'status':         'uploaded'|'detecting'|'selecting'|'queued'|'running'|'done'|'error',
 #   'created':        float,
 #   'total_pages':    int,
-#   'detected_pages': None | [int, ...]
+#   'detected_pages': None | [int, ...],
+#   'sha256':         str   (内容哈希，指向 uploads/_cas/<sha256>/)
+#   'filename':       str,
+#   'profile':        bool  (剖析检测与流水线，结果见 /download/<job_id>/profile)
+#   'run':            None | {toc_pages, use_ai, clause, clause_pages}  (流水线参数)
+#   'batch':          None | batch_id  (批处理提交的文档)
+#   'batch_opts':     None | 批处理中该文档的选项 (见 batch_submit)
+#   'result':         None | run_pipeline 返回的摘要,
+#   'error':          None | str,
+#   'accessed':       float (最近访问时间，磁盘配额 LRU 淘汰依据)
 # }}
 _jobs: dict = {}
 _jobs_lock = threading.Lock()
 
 JOB_TTL = 3600   # 1 小时后自动清理
 
+# 持久化到 job 目录的字段（job.json），重启后据此恢复注册表
+JOB_RECORD       = 'job.json'
+_JOB_RECORD_KEYS = ('created', 'total_pages', 'detected_pages', 'sha256',
+                    'filename', 'profile', 'run', 'status', 'error', 'batch', 'batch_opts')
+
+# 批处理 API：{batch_id: {'created': float, 'jobs': [job_id, ...]}}；重启后由 job.json 的 batch 字段重建
+_batches: dict = {}
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', '4'))   # 批处理并发文档数
+WARM_UP       = os.environ.get('WARM_UP', '1') != '0'      # 开始监听后在后台预加载重依赖
+_batch_pool   = ThreadPoolExecutor(max_workers=BATCH_WORKERS,
+                                   thread_name_prefix='batch')
+_batch_pending = 0      # 已提交到 _batch_pool 但尚未开始执行的文档数（持 _jobs_lock 读写）
+
+
+def _job_gauges():
+    with _jobs_lock:
+        statuses = [j['status'] for j in _jobs.values()]
+    return {(st,): statuses.count(st) for st in set(statuses)}
+
+
+def _queue_gauges():
+    with _jobs_lock:
+        events = sum(j['queue'].qsize() for j in _jobs.values())
+        pending = _batch_pending
+    return {('batch',): pending, ('sse_events',): events}
+
+
+metrics.REGISTRY.gauge('pdfbm_jobs', '当前注册的任务数（按状态）', ['status'], fn=_job_gauges)
+metrics.REGISTRY.gauge('pdfbm_jobs_in_flight', '排队或运行中的流水线任务数', fn=lambda: {
+    (): sum(n for (st,), n in _job_gauges().items() if st in ('queued', 'running'))})
+metrics.REGISTRY.gauge('pdfbm_queue_depth',
+                       '队列深度：batch=等待执行的批处理文档，sse_events=未推送的进度事件',
+                       ['queue'], fn=_queue_gauges)
+
 
 # ── 后台清理线程 ────────────────────────────────────────────────────
 def _cleanup_loop():
@@ -56,9 +126,39 @@ def _cleanup_loop():
                 shutil.rmtree(job_dir, ignore_errors=True)
             with _jobs_lock:
                 _jobs.pop(jid, None)
+        with _jobs_lock:
+            for bid in [b for b, v in _batches.items() if now - v['created'] > JOB_TTL]:
+                _batches.pop(bid, None)
+        _store.cleanup(now)
+        _ensure_space(0)
 
 
-threading.Thread(target=_cleanup_loop, daemon=True, name='cleanup').start()
+# ── 磁盘配额 ────────────────────────────────────────────────────────
+def _evict_job(job_id):
+    """淘汰已结束的 job；挑选候选之后被重新启动的跳过，返回是否已淘汰。"""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is not None and job['status'] not in ('done', 'error'):
+            return False
+        _jobs.pop(job_id, None)     # 先注销，之后的 /start 等请求不会再找到它
+    shutil.rmtree(os.path.join(UPLOAD_DIR, job_id), ignore_errors=True)
+    return True
+
+
+def _ensure_space(needed):
+    """写入 needed 字节前调用；超出配额时按 LRU 淘汰已结束的 job。"""
+    with _jobs_lock:
+        candidates = [(jid, j.get('accessed', j['created'])) for jid, j in _jobs.items()
+                      if j['status'] in ('done', 'error')]
+    return _storage.ensure_space(needed, candidates, _evict_job)
+
+
+def _touch(job):
+    job['accessed'] = time.time()
+
+
+def _insufficient_storage():
+    return jsonify({'error': '服务器存储空间不足，请稍后再试'}), 507
 
 
 # ── 路由 ────────────────────────────────────────────────────────────
@@ -68,6 +168,63 @@ def index():
     return render_template('index.html')
 
 
+def _create_job(sha, filename='', profile=False):
+    """为 CAS 中的文件创建 job；命中历史产物时直接复用页数与检测结果。"""
+    job_id  = str(uuid.uuid4())
+    job_dir = os.path.join(UPLOAD_DIR, job_id)
+    os.makedirs(job_dir)
+    pdf_path = _store.link_input(sha, job_dir)
+
+    meta        = _store.load_meta(sha)
+    total_pages = meta.get('total_pages')
+    if total_pages is None:
+        try:
+            total_pages = pipeline_core.get_pdf_page_count(pdf_path)
+            _store.update_meta(sha, total_pages=total_pages)
+        except Exception:
+            total_pages = 0
+    detected = meta.get('detected_pages')
+
+    with _jobs_lock:
+        _jobs[job_id] = {
+            'queue':          Queue(),
+            'status':         'selecting' if detected is not None else 'uploaded',
+            'created':        time.time(),
+            'total_pages':    total_pages,
+            'detected_pages': detected,
+            'sha256':         sha,
+            'filename':       filename,
+            'profile':        profile,
+            'accessed':       time.time(),
+        }
+        _save_job_record(job_id, _jobs[job_id])
+    return job_id, total_pages
+
+
+def _page_index(job, pdf_path):
+    """该文件内容的逐页特征索引：优先读 CAS 缓存，否则构建并写回（每个文件只构建一次）。"""
+    index = PageIndex.from_dict(_store.load_page_index(job['sha256']) or {})
+    metrics.cache_lookup('page_index', hits=index is not None, misses=index is None)
+    if index is None:
+        index = PageIndex.build(pdf_path)
+        _store.save_page_index(job['sha256'], index.to_dict())
+    return index
+
+
+def _flag(value):
+    return str(value).lower() in ('1', 'true', 'yes', 'on')
+
+
+def _profiled(job_id, job, name):
+    """job 开启剖析（或 PROFILE_JOBS=1）时剖析 with 块，结果写入 job 目录 profile_<name>.*。"""
+    return profiled(os.path.join(UPLOAD_DIR, job_id, f'profile_{name}'),
+                    PROFILE_JOBS or bool(job.get('profile')))
+
+
+def _upload_error(exc):
+    return jsonify({'error': str(exc), **exc.extra}), exc.status
+
+
 @app.route('/upload', methods=['POST'])
 def upload():
     if 'file' not in request.files:
@@ -75,29 +232,59 @@ def upload():
     f = request.files['file']
     if not f.filename.lower().endswith('.pdf'):
         return jsonify({'error': '只支持 PDF 格式'}), 400
+    if not _ensure_space(request.content_length or 0):
+        return _insufficient_storage()
+
+    sha, hit = _store.save_stream(f.stream)
+    metrics.cache_lookup('upload_dedup', hits=hit, misses=not hit)
+    job_id, total_pages = _create_job(sha, f.filename,
+                                      profile=_flag(request.values.get('profile')))
+    return jsonify({'job_id': job_id, 'total_pages': total_pages, 'dedup': hit})
+
+
+@app.route('/upload/init', methods=['POST'])
+def upload_init():
+    body = request.get_json(silent=True) or {}
+    size = body.get('size')
+    if isinstance(size, int) and not _ensure_space(size):
+        return _insufficient_storage()
+    try:
+        upload_id = _store.init_upload(body.get('filename'), size)
+    except UploadError as exc:
+        return _upload_error(exc)
+    return jsonify({'upload_id': upload_id, 'chunk_size': CHUNK_SIZE})
 
-    job_id  = str(uuid.uuid4())
-    job_dir = os.path.join(UPLOAD_DIR, job_id)
-    os.makedirs(job_dir)
 
-    pdf_path = os.path.join(job_dir, 'input.pdf')
-    f.save(pdf_path)
+@app.route('/upload/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    try:
+        return jsonify(_store.status(upload_id))
+    except UploadError as exc:
+        return _upload_error(exc)
 
+
+@app.route('/upload/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({'error': '缺少 offset 参数'}), 400
     try:
-        total_pages = pipeline_core.get_pdf_page_count(pdf_path)
-    except Exception:
-        total_pages = 0
+        received = _store.write_chunk(upload_id, offset, request.stream,
+                                      length=request.content_length)
+    except UploadError as exc:
+        return _upload_error(exc)
+    return jsonify({'received': received})
 
-    with _jobs_lock:
-        _jobs[job_id] = {
-            'queue':          Queue(),
-            'status':         'uploaded',
-            'created':        time.time(),
-            'total_pages':    total_pages,
-            'detected_pages': None,
-        }
 
-    return jsonify({'job_id': job_id, 'total_pages': total_pages})
+@app.route('/upload/<upload_id>/complete', methods=['POST'])
+def upload_complete(upload_id):
+    try:
+        sha, hit = _store.complete(upload_id)
+    except UploadError as exc:
+        return _upload_error(exc)
+    metrics.cache_lookup('upload_dedup', hits=hit, misses=not hit)
+    job_id, total_pages = _create_job(sha, profile=_flag(request.args.get('profile')))
+    return jsonify({'job_id': job_id, 'total_pages': total_pages, 'dedup': hit})
 
 
 @app.route('/thumbnail/<job_id>/<int:page_num>')
@@ -106,6 +293,7 @@ def thumbnail(job_id, page_num):
         job = _jobs.get(job_id)
     if not job:
         return '', 404
+    _touch(job)
 
     pdf_path = os.path.join(UPLOAD_DIR, job_id, 'input.pdf')
     if not os.path.exists(pdf_path):
@@ -135,7 +323,7 @@ def detect(job_id):
     status = job['status']
 
     # 已经完成检测（或直接进入后续阶段）
-    if status in ('selecting', 'running', 'done', 'error'):
+    if status in ('selecting', 'queued', 'running', 'done', 'error'):
         return jsonify({'status': 'done', 'pages': job.get('detected_pages') or []})
 
     # 检测正在进行
@@ -144,38 +332,155 @@ def detect(job_id):
 
     # status == 'uploaded'：启动检测线程
     job['status'] = 'detecting'
+    if _flag(request.args.get('profile')):
+        job['profile'] = True
     pdf_path    = os.path.join(UPLOAD_DIR, job_id, 'input.pdf')
     total_pages = job['total_pages']
 
     def _run_detect():
         try:
-            results = pipeline_core.detect_toc_pages(pdf_path)
-            detected_raw = sorted(r['page'] for r in results if r['detected'])
-
-            if detected_raw:
-                # 取第一个连续簇
-                cluster = [detected_raw[0]]
-                for p in detected_raw[1:]:
-                    if p <= cluster[-1] + 2:
-                        cluster.append(p)
-                    else:
-                        break
-                pages = list(range(cluster[0], cluster[-1] + 1))
-            else:
-                pages = list(range(3, min(8, total_pages)))
+            with _profiled(job_id, job, 'detect'):
+                results = pipeline_core.detect_toc_pages(
+                    pdf_path, index=_page_index(job, pdf_path))
+            pages   = pipeline_core.pick_toc_pages(results, total_pages)
+            _store.update_meta(job['sha256'], detected_pages=pages)
         except Exception:
             pages = list(range(3, min(8, total_pages)))
 
         with _jobs_lock:
             if job_id in _jobs:
                 _jobs[job_id]['detected_pages'] = pages
-                _jobs[job_id]['status'] = 'selecting'
+                # 检测期间任务可能已被批处理提交（queued / running），不覆盖其状态
+                if _jobs[job_id]['status'] == 'detecting':
+                    _jobs[job_id]['status'] = 'selecting'
+                _save_job_record(job_id, _jobs[job_id])
 
     threading.Thread(target=_run_detect, daemon=True,
                      name=f'detect-{job_id[:8]}').start()
     return jsonify({'status': 'detecting'})
 
 
+def _make_emit(job):
+    def _emit(type_, msg='', step=None, progress=None, **kwargs):
+        event = {'type': type_, 'msg': msg}
+        if step     is not None: event['step']     = step
+        if progress is not None: event['progress'] = progress
+        event.update(kwargs)
+        job['queue'].put(event)
+    return _emit
+
+
+def _save_job_record(job_id, job):
+    """将 job 元数据写入 job 目录下的 job.json，供进程重启后恢复。"""
+    record = {k: job.get(k) for k in _JOB_RECORD_KEYS}
+    path = os.path.join(UPLOAD_DIR, job_id, JOB_RECORD)
+    tmp  = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as fh:
+        json.dump(record, fh, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _run_job(job_id, job):
+    """
+    按 job['run'] 同步执行流水线（调用方负责放到后台线程），结束后写入 status/result。
+    run: {toc_pages, use_ai, clause: 'interactive'|'auto'|'skip', clause_pages}
+    """
+    run      = job['run']
+    job_dir  = os.path.join(UPLOAD_DIR, job_id)
+    pdf_path = os.path.join(job_dir, 'input.pdf')
+    _emit    = _make_emit(job)
+    _save_job_record(job_id, job)
+
+    clause_event, clause_pages_holder, auto_clause = None, [None], False
+    if run.get('clause_pages'):
+        # 显式指定条文说明页：预置已触发的 Event，流水线不会阻塞
+        clause_event = threading.Event()
+        clause_event.set()
+        clause_pages_holder = [run['clause_pages']]
+    elif run['clause'] == 'auto':
+        auto_clause = True
+    elif run['clause'] == 'interactive':
+        # 条文说明交互机制：[0] 由 /start_clause 填入
+        clause_event = threading.Event()
+        job['clause_event']         = clause_event
+        job['clause_pages_holder']  = clause_pages_holder
+
+    sha   = job['sha256']
+    cache = {
+        'page_texts': _store.load_page_texts(sha),
+        'offsets':    dict(_store.load_meta(sha).get('offsets') or {}),
+        'page_index': PageIndex.from_dict(_store.load_page_index(sha) or {}),
+    }
+    try:
+        with _profiled(job_id, job, 'pipeline'):
+            job['result'] = pipeline_core.run_pipeline(
+                pdf_path, job_dir, _emit, run['toc_pages'],
+                clause_event, clause_pages_holder, use_ai=run['use_ai'], cache=cache,
+                auto_clause=auto_clause)
+        _store.update_meta(sha, offsets=cache['offsets'])
+        job['status'] = 'done'
+    except Exception as exc:
+        _emit('error', f'处理失败: {exc}')
+        job['error']  = str(exc)
+        job['status'] = 'error'
+    finally:
+        # 已 OCR 的正文页即使失败也保留，供同内容文件复用
+        _store.save_page_texts(sha, cache['page_texts'])
+        if cache['page_index'] is not None:   # 条文说明检测可能补 OCR 了扫描页
+            _store.save_page_index(sha, cache['page_index'].to_dict())
+        _save_job_record(job_id, job)
+        _touch(job)
+        job['queue'].put(None)   # sentinel
+    _ensure_space(0)
+
+
+def _restore_jobs():
+    """
+    启动时根据各 job 目录的 job.json / checkpoint.json 重建注册表；
+    运行中断的流水线从第一个未完成阶段继续（已完成的 MinerU/OCR 不再重复）。
+    """
+    now = time.time()
+    for job_id in os.listdir(UPLOAD_DIR):
+        job_dir = os.path.join(UPLOAD_DIR, job_id)
+        if job_id.startswith('_') or not os.path.isdir(job_dir):
+            continue
+        try:
+            with open(os.path.join(job_dir, JOB_RECORD), encoding='utf-8') as fh:
+                record = json.load(fh)
+        except (OSError, ValueError):
+            record = None
+        created = record.get('created', 0) if record else os.path.getmtime(job_dir)
+        if now - created > JOB_TTL:
+            shutil.rmtree(job_dir, ignore_errors=True)   # 过期或无记录的残留目录
+            continue
+        if record is None:
+            continue
+        job = dict(record, queue=Queue())
+        ckpt = pipeline_core.PipelineCheckpoint.load(job_dir) or {}
+        if ckpt.get('finished'):
+            job['status'] = 'done'
+            job['result'] = ckpt['finished']
+        elif record.get('status') == 'error':
+            pass                                   # 已失败的保持原状，由用户重新 /start
+        elif record.get('run'):
+            job['status'] = 'running'              # 运行中被中断 → 自动续跑
+        elif record.get('status') == 'queued' and record.get('batch_opts'):
+            pass                                   # 批处理排队中 → 重新排队
+        else:
+            job['status'] = 'selecting' if record.get('detected_pages') is not None else 'uploaded'
+        with _jobs_lock:
+            _jobs[job_id] = job
+            if job.get('batch'):
+                batch = _batches.setdefault(job['batch'], {'created': created, 'jobs': []})
+                batch['created'] = min(batch['created'], created)
+                batch['jobs'].append(job_id)
+        if job['status'] == 'running':
+            threading.Thread(target=_run_job, args=(job_id, job), daemon=True,
+                             name=f'resume-{job_id[:8]}').start()
+        elif job['status'] == 'queued':
+            _submit_batch_doc(job_id, job, job['batch_opts'])
+
+
 @app.route('/start/<job_id>', methods=['POST'])
 def start(job_id):
     with _jobs_lock:
@@ -183,7 +488,7 @@ def start(job_id):
     if not job:
         return jsonify({'error': 'job 不存在'}), 404
 
-    if job['status'] == 'running':
+    if job['status'] in ('queued', 'running'):
         return jsonify({'error': '已在运行中'}), 409
 
     body      = request.get_json(silent=True) or {}
@@ -191,39 +496,21 @@ def start(job_id):
     if not toc_pages or not isinstance(toc_pages, list) or len(toc_pages) == 0:
         return jsonify({'error': '请至少选择一个目录页'}), 400
 
-    use_ai = bool(body.get('use_ai', False))
-
+    if job['status'] in ('done', 'error'):
+        # 用户重新运行：从头执行（重新询问条文说明、重建 final.pdf），检查点只供中断续跑
+        pipeline_core.PipelineCheckpoint.clear(os.path.join(UPLOAD_DIR, job_id))
     job['status'] = 'running'
-    job_dir  = os.path.join(UPLOAD_DIR, job_id)
-    pdf_path = os.path.join(job_dir, 'input.pdf')
-
-    # 条文说明交互机制
-    clause_event          = threading.Event()
-    clause_pages_holder   = [None]   # [0] 由 /start_clause 填入
-    job['clause_event']         = clause_event
-    job['clause_pages_holder']  = clause_pages_holder
-
-    def _emit(type_, msg='', step=None, progress=None, **kwargs):
-        event = {'type': type_, 'msg': msg}
-        if step     is not None: event['step']     = step
-        if progress is not None: event['progress'] = progress
-        event.update(kwargs)
-        job['queue'].put(event)
-
-    def _run():
-        try:
-            pipeline_core.run_pipeline(
-                pdf_path, job_dir, _emit, toc_pages,
-                clause_event, clause_pages_holder, use_ai=use_ai)
-            job['status'] = 'done'
-        except Exception as exc:
-            _emit('error', f'处理失败: {exc}')
-            job['status'] = 'error'
-        finally:
-            job['queue'].put(None)   # sentinel
-
-    threading.Thread(target=_run, daemon=True,
-                     name=f'pipeline-{job_id[:8]}').start()
+    job['error']  = None
+    if body.get('profile'):
+        job['profile'] = True
+    job['run']    = {
+        'toc_pages':    toc_pages,
+        'use_ai':       bool(body.get('use_ai', False)),
+        'clause':       'interactive',
+        'clause_pages': None,
+    }
+    threading.Thread(target=_run_job, args=(job_id, job),
+                     daemon=True, name=f'pipeline-{job_id[:8]}').start()
     return jsonify({'ok': True})
 
 
@@ -257,6 +544,7 @@ def progress(job_id):
         job = _jobs.get(job_id)
     if not job:
         return jsonify({'error': 'job 不存在'}), 404
+    _touch(job)
 
     q = job['queue']
 
@@ -291,6 +579,7 @@ def download(job_id):
         job = _jobs.get(job_id)
     if not job:
         return jsonify({'error': 'job 不存在'}), 404
+    _touch(job)
 
     final_pdf = os.path.join(UPLOAD_DIR, job_id, 'final.pdf')
     if not os.path.exists(final_pdf):
@@ -304,7 +593,321 @@ def download(job_id):
     )
 
 
+@app.route('/bookmarks/<job_id>', methods=['GET', 'POST'])
+def bookmarks(job_id):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'job 不存在'}), 404
+    if job['status'] != 'done':
+        return jsonify({'error': '流水线尚未完成'}), 400
+    _touch(job)
+
+    job_dir = os.path.join(UPLOAD_DIR, job_id)
+    try:
+        if request.method == 'GET':
+            return jsonify(get_bookmarks(job_dir))
+        return jsonify(edit_bookmarks(job_dir, request.get_json(silent=True) or {}))
+    except BookmarkEditError as exc:
+        return jsonify({'error': str(exc)}), exc.status
+
+
+@app.route('/download/<job_id>/profile')
+def download_profile(job_id):
+    """剖析结果打包下载：profile_*.prof（pstats）、profile_*.collapsed（折叠栈）与 timings.json。"""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'job 不存在'}), 404
+    _touch(job)
+
+    job_dir = os.path.join(UPLOAD_DIR, job_id)
+    names   = profile_files(job_dir)
+    if not names:
+        return jsonify({'error': '该 job 未开启剖析或尚未运行'}), 404
+    if os.path.exists(os.path.join(job_dir, metrics.TIMINGS_FILE)):
+        names.append(metrics.TIMINGS_FILE)
+
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for name in names:
+            zf.write(os.path.join(job_dir, name), name)
+    buf.seek(0)
+    return send_file(buf, as_attachment=True, download_name=f'profile_{job_id[:8]}.zip',
+                     mimetype='application/zip')
+
+
+# ── 批处理 API ──────────────────────────────────────────────────────
+# 无需人工确认目录页与条文说明，供上游系统批量调用。
+#
+# POST /api/batch
+#   multipart: files=<PDF>（可多个），options=<JSON 字符串>
+#   或 JSON:   {"job_ids": [已通过 /upload 上传的 job_id, ...], ...options}
+#   options:   {
+#     "use_ai":    false,
+#     "profile":   false,                      剖析每个文档（结果见 /download/<job_id>/profile）
+#     "clause":    "auto" | "skip",          默认 auto（自动检测条文说明目录页）
+#     "documents": [{"toc_pages": [...], "clause_pages": [...]}, ...]
+#                  可选，与 files / job_ids 顺序一一对应；省略的字段自动检测
+#   }
+
+def _page_list(value):
+    if value is None:
+        return None
+    if (not isinstance(value, list) or not value
+            or not all(isinstance(p, int) and not isinstance(p, bool) and p >= 0
+                       for p in value)):
+        raise ValueError('页码列表必须为非空的非负整数数组')
+    return sorted(set(value))
+
+
+def _submit_batch_doc(job_id, job, opts):
+    """把批处理文档提交到 _batch_pool，计入等待执行的文档数。"""
+    global _batch_pending
+    with _jobs_lock:
+        _batch_pending += 1
+    _batch_pool.submit(_run_batch_doc, job_id, job, opts)
+
+
+def _run_batch_doc(job_id, job, opts):
+    """批处理中单个文档的执行体（在 _batch_pool 中运行）。"""
+    global _batch_pending
+    with _jobs_lock:
+        _batch_pending -= 1
+    job['status'] = 'running'
+    if opts['profile']:
+        job['profile'] = True
+    pdf_path  = os.path.join(UPLOAD_DIR, job_id, 'input.pdf')
+    toc_pages = opts['toc_pages'] or job.get('detected_pages')
+    if not toc_pages:
+        try:
+            with _profiled(job_id, job, 'detect'):
+                results = pipeline_core.detect_toc_pages(
+                    pdf_path, index=_page_index(job, pdf_path))
+            toc_pages = pipeline_core.pick_toc_pages(results, job['total_pages'])
+            _store.update_meta(job['sha256'], detected_pages=toc_pages)
+        except Exception as exc:
+            _make_emit(job)('error', f'目录页检测失败: {exc}')
+            job['error']  = str(exc)
+            job['status'] = 'error'
+            job['queue'].put(None)
+            return
+        job['detected_pages'] = toc_pages
+    job['run'] = {
+        'toc_pages':    toc_pages,
+        'use_ai':       opts['use_ai'],
+        'clause':       opts['clause'],
+        'clause_pages': opts['clause_pages'],
+    }
+    _run_job(job_id, job)
+
+
+def _doc_status(job_id):
+    job = _jobs.get(job_id)
+    if not job:
+        return {'job_id': job_id, 'status': 'expired'}
+    doc = {
+        'job_id':   job_id,
+        'filename': job.get('filename', ''),
+        'status':   job['status'],
+    }
+    if job.get('run'):
+        doc['toc_pages'] = job['run']['toc_pages']
+    if job.get('result'):
+        doc['result']   = job['result']
+        doc['download']  = f'/download/{job_id}'
+        doc['bookmarks'] = f'/bookmarks/{job_id}'
+    if job.get('profile') or PROFILE_JOBS:
+        doc['profile'] = f'/download/{job_id}/profile'
+    if job.get('error'):
+        doc['error'] = job['error']
+    return doc
+
+
+@app.route('/api/batch', methods=['POST'])
+def batch_submit():
+    if request.files:
+        try:
+            options = json.loads(request.form.get('options') or '{}')
+        except ValueError:
+            return jsonify({'error': 'options 不是合法 JSON'}), 400
+        if not isinstance(options, dict):
+            return jsonify({'error': 'options 必须是 JSON 对象'}), 400
+        uploads = request.files.getlist('files')
+        if not uploads:
+            return jsonify({'error': '请通过 files 字段上传 PDF'}), 400
+        if any(not f.filename.lower().endswith('.pdf') for f in uploads):
+            return jsonify({'error': '只支持 PDF 格式'}), 400
+        if not _ensure_space(request.content_length or 0):
+            return _insufficient_storage()
+        job_ids = None
+    else:
+        options = request.get_json(silent=True) or {}
+        if not isinstance(options, dict):
+            return jsonify({'error': '请求体必须是 JSON 对象'}), 400
+        uploads = None
+        job_ids = options.get('job_ids')
+        if not job_ids or not isinstance(job_ids, list):
+            return jsonify({'error': '请上传 files 或提供 job_ids'}), 400
+        if not all(isinstance(j, str) for j in job_ids):
+            return jsonify({'error': 'job_ids 必须为字符串数组'}), 400
+        if len(set(job_ids)) != len(job_ids):
+            return jsonify({'error': 'job_ids 不能重复'}), 400
+
+    clause = options.get('clause', 'auto')
+    if clause not in ('auto', 'skip'):
+        return jsonify({'error': "clause 只能为 'auto' 或 'skip'"}), 400
+    count   = len(uploads) if uploads is not None else len(job_ids)
+    per_doc = options.get('documents') or []
+    if not isinstance(per_doc, list) or len(per_doc) > count:
+        return jsonify({'error': 'documents 数量与文件数不符'}), 400
+    try:
+        doc_opts = []
+        for i in range(count):
+            d = per_doc[i] if i < len(per_doc) else {}
+            doc_opts.append({
+                'toc_pages':    _page_list(d.get('toc_pages')),
+                'clause_pages': _page_list(d.get('clause_pages')),
+                'clause':       clause,
+                'use_ai':       bool(options.get('use_ai', False)),
+                'profile':      bool(options.get('profile', False)),
+            })
+    except (ValueError, AttributeError) as exc:
+        return jsonify({'error': str(exc)}), 400
+
+    if uploads is not None:
+        job_ids = []
+        for f in uploads:
+            sha, _ = _store.save_stream(f.stream)
+            job_ids.append(_create_job(sha, f.filename)[0])
+
+    batch_id = str(uuid.uuid4())
+    with _jobs_lock:
+        # 与排队在同一把锁内检查：检查之后过期 / 被淘汰的 job 不会在这里 KeyError
+        missing = [j for j in job_ids if j not in _jobs]
+        if missing:
+            return jsonify({'error': 'job 不存在', 'job_ids': missing}), 404
+        busy = [j for j in job_ids if _jobs[j]['status'] in ('queued', 'running')]
+        if busy:
+            return jsonify({'error': '已在运行中', 'job_ids': busy}), 409
+        jobs = [_jobs[j] for j in job_ids]
+        for job_id, job, opts in zip(job_ids, jobs, doc_opts):
+            if job['status'] in ('done', 'error'):
+                pipeline_core.PipelineCheckpoint.clear(os.path.join(UPLOAD_DIR, job_id))
+            job['status']     = 'queued'
+            job['batch']      = batch_id
+            job['batch_opts'] = opts
+            job['run'] = job['result'] = job['error'] = None   # 重启时按排队恢复，不沿用上次的参数
+        _batches[batch_id] = {'created': time.time(), 'jobs': list(job_ids)}
+
+    for job_id, job, opts in zip(job_ids, jobs, doc_opts):
+        _save_job_record(job_id, job)       # 排队中的文档重启后由 _restore_jobs 重新排队
+        _submit_batch_doc(job_id, job, opts)
+
+    return jsonify({
+        'batch_id':  batch_id,
+        'documents': [{'job_id': j, 'filename': job.get('filename', '')}
+                      for j, job in zip(job_ids, jobs)],
+    }), 202
+
+
+@app.route('/api/batch/<batch_id>')
+def batch_status(batch_id):
+    with _jobs_lock:
+        batch = _batches.get(batch_id)
+        if not batch:
+            return jsonify({'error': 'batch 不存在'}), 404
+        docs = [_doc_status(j) for j in batch['jobs']]
+
+    counts = {}
+    for d in docs:
+        counts[d['status']] = counts.get(d['status'], 0) + 1
+    pending = counts.get('queued', 0) + counts.get('running', 0)
+    return jsonify({
+        'batch_id':  batch_id,
+        'status':    'running' if pending else 'done',
+        'total':     len(docs),
+        'counts':    counts,
+        'elapsed':   round(time.time() - batch['created'], 1),
+        'documents': docs,
+    })
+
+
+@app.route('/api/batch/<batch_id>/<job_id>')
+def batch_document(batch_id, job_id):
+    with _jobs_lock:
+        batch = _batches.get(batch_id)
+        if not batch or job_id not in batch['jobs']:
+            return jsonify({'error': '文档不存在'}), 404
+        return jsonify(_doc_status(job_id))
+
+
+@app.route('/storage')
+def storage_usage():
+    usage = _storage.usage()
+    with _jobs_lock:
+        jobs = [{
+            'job_id':   jid,
+            'status':   j['status'],
+            'bytes':    usage['jobs'].get(jid, 0),
+            'accessed': j.get('accessed', j['created']),
+        } for jid, j in _jobs.items()]
+    disk = shutil.disk_usage(UPLOAD_DIR)
+    return jsonify({
+        'quota_bytes':   _storage.quota_bytes,
+        'used_bytes':    usage['used'],
+        'cas_bytes':     usage['cas'],
+        'partial_bytes': usage['partial'],
+        'cache_bytes':   sum(usage['caches'].values()),
+        'disk_free':     disk.free,
+        'jobs':          sorted(jobs, key=lambda j: -j['bytes']),
+    })
+
+
+@app.route('/timings/<job_id>')
+def timings(job_id):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'job 不存在'}), 404
+    path = os.path.join(UPLOAD_DIR, job_id, metrics.TIMINGS_FILE)
+    if not os.path.exists(path):
+        return jsonify({'error': '流水线尚未运行'}), 404
+    with open(path, encoding='utf-8') as fh:
+        return jsonify(json.load(fh))
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.REGISTRY.render(),
+                    content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.route('/render_queue')
+def render_queue_stats():
+    return jsonify(RENDER_QUEUE.stats())
+
+
+def _warm_up_when_listening(port, timeout=30):
+    """等服务开始监听（端口可连接）后导入重依赖、定位 Tesseract，首个请求不再承担这部分开销。"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    print(f"预热完成（{pipeline_core.warm_up():.2f}s）")
+
+
+_restore_jobs()
+threading.Thread(target=_cleanup_loop, daemon=True, name='cleanup').start()
+
+
 if __name__ == '__main__':
     print("启动 PDF 书签注入工具 Web 服务...")
     print("访问 http://localhost:5000")
+    if WARM_UP:
+        threading.Thread(target=_warm_up_when_listening, args=(5000,),
+                         daemon=True, name='warm-up').start()
     app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
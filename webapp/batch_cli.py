@@ -0,0 +1,260 @@
+"""
+命令行批处理：无人值守地为整个目录下的 PDF 注入书签
+  - 目录页：自动采用 detect_toc_pages 检出的第一个连续簇
+  - 条文说明：自动采用 find_clause_toc_pages 的结果（--no-clause 跳过）
+  - 多进程并发（-j），每个文档输出 PDF + JSON 报告
+  - 断点续传：报告中 status=done 的文档再次运行时自动跳过；中断或失败的文档保留工作目录
+    OUTPUT_DIR/.work/<文档>/，再次运行时流水线按其中的 checkpoint.json 从未完成的阶段继续
+    （源 PDF 已改变或加 --fresh 时从头处理），完成后删除工作目录
+
+用法:
+  python webapp/batch_cli.py INPUT_DIR OUTPUT_DIR [-j 4] [--use-ai] [--no-clause] [--retry-failed]
+                             [--profile] [--fresh]
+
+输出:
+  OUTPUT_DIR/<相对路径>.pdf            注入书签后的 PDF
+  OUTPUT_DIR/<相对路径>.report.json    状态、各步耗时、热点函数耗时（spans）、RSS 峰值、书签数、offset
+  OUTPUT_DIR/<相对路径>.log            流水线日志
+  OUTPUT_DIR/<相对路径>.profile_{detect,pipeline}.{prof,collapsed}
+                                       --profile 时的剖析结果（cProfile + 折叠栈）
+  OUTPUT_DIR/batch_summary.json        本次运行汇总
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import metrics
+import pipeline_core
+from page_index import PageIndex
+from profiling import PROFILE_JOBS, profiled
+
+WORK_DIRNAME = '.work'
+SOURCE_FILE  = 'source.json'    # 工作目录对应的源 PDF {path, size, mtime_ns}
+
+
+def _write_json(path, obj):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as fh:
+        json.dump(obj, fh, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def _load_report(path):
+    try:
+        with open(path, encoding='utf-8') as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _inside(path, directory):
+    """path 是否为 directory 本身或其子目录（按路径分量比较，out 不包含 out2）。"""
+    try:
+        return os.path.commonpath([path, directory]) == directory
+    except ValueError:          # Windows 上不同盘符
+        return False
+
+
+def find_pdfs(input_dir, exclude_dir=None):
+    """递归列出 input_dir 下的 PDF（相对路径，排序后返回）。"""
+    exclude_dir = os.path.abspath(exclude_dir) if exclude_dir else None
+    found = []
+    for root, dirs, files in os.walk(input_dir):
+        if exclude_dir and _inside(os.path.abspath(root), exclude_dir):
+            dirs[:] = []
+            continue
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith('.pdf'):
+                found.append(os.path.relpath(os.path.join(root, name), input_dir))
+    return found
+
+
+def _output_paths(output_dir, rel):
+    base = os.path.join(output_dir, os.path.splitext(rel)[0])
+    return base + '.pdf', base + '.report.json', base + '.log'
+
+
+def _prepare_work_dir(job_dir, src_pdf, fresh):
+    """
+    准备文档的工作目录：保留上次中断留下的检查点以便续传，
+    fresh 或源 PDF 已改变时清空。返回是否保留了已有的检查点。
+    """
+    st = os.stat(src_pdf)
+    source = {'path': os.path.abspath(src_pdf), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+    resumable = (not fresh and _load_report(os.path.join(job_dir, SOURCE_FILE)) == source
+                 and pipeline_core.PipelineCheckpoint.load(job_dir) is not None)
+    if not resumable:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        os.makedirs(job_dir)
+        _write_json(os.path.join(job_dir, SOURCE_FILE), source)
+    return resumable
+
+
+def process_document(src_pdf, output_dir, rel, use_ai=False, clause=True, profile=False,
+                     fresh=False):
+    """
+    处理单个文档（在子进程中运行）。返回报告 dict，并写入 <相对路径>.report.json。
+    工作目录中有上次中断留下的检查点时从未完成的阶段继续（fresh=True 时从头处理）。
+    """
+    out_pdf, report_path, log_path = _output_paths(output_dir, rel)
+    profile_base = os.path.splitext(out_pdf)[0] + '.profile_'
+    profile = profile or PROFILE_JOBS
+    os.makedirs(os.path.dirname(out_pdf), exist_ok=True)
+    job_dir = os.path.join(output_dir, WORK_DIRNAME,
+                           rel.replace(os.sep, '__').replace('/', '__'))
+    resumed = _prepare_work_dir(job_dir, src_pdf, fresh)
+
+    report = {
+        'source':  src_pdf,
+        'output':  out_pdf,
+        'status':  'running',
+        'started': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'resumed': resumed,
+        'timings': {},
+    }
+    t0 = time.perf_counter()
+    current = ['detect', t0]   # [当前阶段名, 阶段开始时间]
+
+    def _close_stage(now):
+        name, start = current
+        report['timings'][name] = round(
+            report['timings'].get(name, 0) + now - start, 3)
+
+    with open(log_path, 'a' if resumed else 'w', encoding='utf-8') as log:
+        if resumed:
+            log.write(f'\n==== {report["started"]} 从检查点继续 ====\n')
+
+        def emit(type_, msg='', step=None, progress=None, **kwargs):
+            now = time.perf_counter()
+            if type_ == 'step_start' and step is not None:
+                _close_stage(now)
+                current[:] = [f'step{step}', now]
+            log.write(f'[{now - t0:8.2f}s] {type_}: {msg}\n')
+            log.flush()
+
+        try:
+            total_pages = pipeline_core.get_pdf_page_count(src_pdf)
+            report['total_pages'] = total_pages
+            with profiled(profile_base + 'detect', profile):
+                index   = PageIndex.build(src_pdf)   # 主目录与条文说明检测共用
+                results = pipeline_core.detect_toc_pages(src_pdf, index=index)
+            toc_pages = pipeline_core.pick_toc_pages(results, total_pages)
+            report['toc_pages'] = toc_pages
+            emit('log', f'自动选定目录页（0-indexed）: {toc_pages}')
+
+            # clause_event=None：不等待用户；no-clause 时直接跳过条文说明
+            with profiled(profile_base + 'pipeline', profile):
+                summary = pipeline_core.run_pipeline(
+                    src_pdf, job_dir, emit, toc_pages,
+                    clause_event=None, clause_pages_holder=[None],
+                    use_ai=use_ai, cache={'page_index': index}, auto_clause=clause)
+            _close_stage(time.perf_counter())
+
+            tmp = out_pdf + '.tmp'
+            shutil.copy2(os.path.join(job_dir, 'final.pdf'), tmp)
+            os.replace(tmp, out_pdf)
+            report.update(summary)
+            report['status'] = 'done'
+            timings = _load_report(os.path.join(job_dir, metrics.TIMINGS_FILE)) or {}
+            report['spans'] = timings.get('spans', {})
+            report['peak_rss_mb'] = timings.get('peak_rss_mb')
+        except Exception as exc:
+            _close_stage(time.perf_counter())
+            log.write(traceback.format_exc())
+            report['status'] = 'error'
+            report['error']  = str(exc)
+
+    report['elapsed'] = round(time.perf_counter() - t0, 3)
+    _write_json(report_path, report)
+    if report['status'] == 'done':
+        shutil.rmtree(job_dir, ignore_errors=True)
+    return report
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='批量为 PDF 规范注入书签（无人值守）')
+    ap.add_argument('input_dir',  help='待处理 PDF 所在目录（递归扫描）')
+    ap.add_argument('output_dir', help='输出目录')
+    ap.add_argument('-j', '--jobs', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                    help='并发进程数（默认 CPU 核数的一半）')
+    ap.add_argument('--use-ai', action='store_true', help='使用 DeepSeek 解析目录')
+    ap.add_argument('--no-clause', action='store_true', help='跳过条文说明子书签')
+    ap.add_argument('--retry-failed', action='store_true',
+                    help='重新处理上次失败（status=error）的文档')
+    ap.add_argument('--profile', action='store_true',
+                    help='剖析每个文档的检测与流水线，结果写在输出 PDF 旁')
+    ap.add_argument('--fresh', action='store_true',
+                    help='忽略上次中断留下的检查点，从头处理每个文档')
+    args = ap.parse_args(argv)
+
+    if not pipeline_core.MINERU_API_TOKEN:
+        print('未设置 MINERU_API_TOKEN', file=sys.stderr)
+        return 2
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    pdfs = find_pdfs(args.input_dir, exclude_dir=args.output_dir)
+
+    todo, skipped = [], 0
+    for rel in pdfs:
+        out_pdf, report_path, _ = _output_paths(args.output_dir, rel)
+        prev = _load_report(report_path)
+        if prev and prev.get('status') == 'done' and os.path.exists(out_pdf):
+            skipped += 1
+            continue
+        if prev and prev.get('status') == 'error' and not args.retry_failed:
+            skipped += 1
+            continue
+        todo.append(rel)
+
+    print(f'共 {len(pdfs)} 个 PDF，跳过 {skipped} 个（已完成/已失败），待处理 {len(todo)} 个，'
+          f'并发 {args.jobs}')
+
+    counts = {'done': 0, 'error': 0}
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {
+            pool.submit(process_document, os.path.join(args.input_dir, rel),
+                        args.output_dir, rel, args.use_ai, not args.no_clause,
+                        args.profile, args.fresh): rel
+            for rel in todo
+        }
+        try:
+            for n, fut in enumerate(as_completed(futures), 1):
+                rel = futures[fut]
+                try:
+                    report = fut.result()
+                except Exception as exc:   # 子进程崩溃等
+                    report = {'status': 'error', 'error': str(exc), 'elapsed': 0}
+                    _write_json(_output_paths(args.output_dir, rel)[1], report)
+                counts[report['status']] += 1
+                detail = (f"书签 {report.get('total_bookmarks')}  offset={report.get('offset')}"
+                          if report['status'] == 'done' else report.get('error', ''))
+                print(f"[{n}/{len(todo)}] {report['status']:5s} {report['elapsed']:7.1f}s  "
+                      f"{rel}  {detail}", flush=True)
+        except KeyboardInterrupt:
+            print('中断：等待运行中的文档结束，下次运行将从断点继续', file=sys.stderr)
+            for fut in futures:
+                fut.cancel()
+            raise
+
+    summary = {
+        'total':    len(pdfs),
+        'skipped':  skipped,
+        'done':     counts['done'],
+        'error':    counts['error'],
+        'elapsed':  round(time.perf_counter() - t0, 3),
+        'finished': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    _write_json(os.path.join(args.output_dir, 'batch_summary.json'), summary)
+    print(f"完成：成功 {counts['done']}，失败 {counts['error']}，耗时 {summary['elapsed']:.0f}s")
+    return 0 if counts['error'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,278 @@
+"""
+书签编辑：流水线完成后修改 final.pdf 的书签，不重新 OCR、不调用 MinerU
+  - 流水线检查点（checkpoint.json）保存了目录条目（parse_inject.raw_entries）、
+    条文说明目录条目（clause_inject.clause_entries）与页码偏移，书签树由它们重新构建，
+    再叠加用户的编辑，只重写 final.pdf 的书签（增量保存，千页文档约 10ms）；
+    增量保存累积的增长超过上次完整保存大小的 MAX_INCR_GROWTH 时改为完整保存到临时文件再替换，
+    回收旧书签对象
+  - 每个书签有稳定的 key：章节号（如 "3.2"），条文说明子书签为 "clause:3.2"，目录书签为 "toc"
+  - 编辑操作（按顺序应用）:
+      {"key": k, "title": "新标题"}       改标题
+      {"key": k, "page": n}               改目标页（PDF 页码，1-indexed）
+      {"key": k, "level": n}              改层级
+      {"key": k, "after": k2 | null}      连同子书签移到 k2 之后（null = 最前面）
+      {"key": k, "delete": true}          删除（子书签保留，层级自动顺接）
+    修改偏移（offset / offset_shift）时按新偏移重新计算所有页码，已保存的编辑重新叠加
+    （改过页码的书签保持指定页码，已不存在的 key 跳过）；新偏移使所有目录条目越界时拒绝
+  - 编辑按 key 合并保存在 job 目录的 bookmark_edits.json（同一书签多次编辑只保留最终值，
+    文件大小与编辑次数无关）；final.pdf 被流水线重新生成后自动作废
+
+bookmark_edits.json:
+  {"offset": int,
+   "overrides": {key: {"title"?, "page"?, "level"?, "delete"?}},
+   "order": [key, ...] | null,         移动过书签时为移动后的书签顺序
+   "stamp": [mtime_ns, size],          最近一次写入后的 final.pdf
+   "compact_size": int}                最近一次完整保存（或流水线生成）时 final.pdf 的大小
+"""
+import os
+import json
+import time
+import threading
+
+from memory import open_pdf
+from metrics import span
+from pipeline_core import (PipelineCheckpoint, toc_bookmarks, insert_clause_bookmarks,
+                           normalize_levels, strip_keys)
+
+EDITS_FILE = 'bookmark_edits.json'
+MAX_LEVEL  = 3          # 主目录两级 + 条文说明子书签
+MAX_INCR_GROWTH = 0.1   # 增量保存累积增长超过完整保存大小的这一比例时改为完整保存
+
+_lock = threading.Lock()
+
+
+class BookmarkEditError(Exception):
+    """书签编辑请求无效；status 为建议的 HTTP 状态码。"""
+
+    def __init__(self, msg, status=400):
+        super().__init__(msg)
+        self.status = status
+
+
+def _stamp(path):
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _load_state(job_dir):
+    """读取检查点中缓存的解析结果与已保存的编辑。"""
+    final_pdf = os.path.join(job_dir, 'final.pdf')
+    data = PipelineCheckpoint.load(job_dir)
+    if not data or not data.get('finished') or not os.path.exists(final_pdf):
+        raise BookmarkEditError('流水线尚未完成')
+    stages = data['stages']
+    raw_entries = stages.get('parse_inject', {}).get('raw_entries')
+    if not raw_entries:
+        raise BookmarkEditError('该任务没有缓存的目录条目（旧版本生成），请重新运行流水线')
+
+    state = {
+        'final_pdf':      final_pdf,
+        'toc_pages':      data['params']['toc_pages'],
+        'raw_entries':    raw_entries,
+        'clause_entries': stages.get('clause_inject', {}).get('clause_entries'),
+        'base_offset':    stages['parse_inject']['offset'],
+        'offset':         stages['parse_inject']['offset'],
+        'overrides':      {},
+        'order':          None,
+        'compact_size':   os.path.getsize(final_pdf),
+    }
+    try:
+        with open(os.path.join(job_dir, EDITS_FILE), encoding='utf-8') as fh:
+            saved = json.load(fh)
+    except (OSError, ValueError):
+        saved = None
+    if saved and saved.get('stamp') == _stamp(final_pdf):
+        for field in ('offset', 'overrides', 'order', 'compact_size'):
+            state[field] = saved[field]
+    return state
+
+
+def _base_bookmarks(state, offset, total):
+    """按 offset 重新构建流水线生成的书签（带 key）。"""
+    bookmarks = toc_bookmarks(state['raw_entries'], offset, total, state['toc_pages'])
+    if state['clause_entries']:
+        try:
+            bookmarks = insert_clause_bookmarks(bookmarks, state['clause_entries'],
+                                                offset, total)
+        except RuntimeError:
+            pass        # 条文说明书签越界被跳过时，同流水线一样只保留主目录书签
+    return bookmarks
+
+
+def _subtree_end(bookmarks, i):
+    """bookmarks[i] 及其子书签的结束下标（不含）。"""
+    j = i + 1
+    while j < len(bookmarks) and bookmarks[j][0] > bookmarks[i][0]:
+        j += 1
+    return j
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _apply(bookmarks, edit, total):
+    """应用一个编辑操作（key 不存在或参数无效时抛 BookmarkEditError）。"""
+    if not isinstance(edit, dict) or 'key' not in edit:
+        raise BookmarkEditError(f'编辑操作缺少 key: {edit!r}')
+    keys = [b[3] for b in bookmarks]
+    key  = edit['key']
+    if key not in keys:
+        raise BookmarkEditError(f'书签不存在: {key}', status=404)
+    i = keys.index(key)
+
+    if edit.get('delete'):
+        return bookmarks[:i] + bookmarks[i + 1:]
+    if 'title' in edit:
+        title = edit['title']
+        if not isinstance(title, str) or not title.strip():
+            raise BookmarkEditError('标题不能为空')
+        bookmarks[i][1] = title.strip()
+    if 'page' in edit:
+        page = edit['page']
+        if not _is_int(page) or not 1 <= page <= total:
+            raise BookmarkEditError(f'页码超出范围 1-{total}: {page!r}')
+        bookmarks[i][2] = page
+    if 'level' in edit:
+        level = edit['level']
+        if not _is_int(level) or not 1 <= level <= MAX_LEVEL:
+            raise BookmarkEditError(f'层级超出范围 1-{MAX_LEVEL}: {level!r}')
+        bookmarks[i][0] = level
+    if 'after' in edit:
+        end  = _subtree_end(bookmarks, i)
+        moved, rest = bookmarks[i:end], bookmarks[:i] + bookmarks[end:]
+        after = edit['after']
+        if after is None:
+            pos = 0
+        else:
+            rest_keys = [b[3] for b in rest]
+            if after not in rest_keys:
+                raise BookmarkEditError(f'无法移到 {after} 之后（不存在或是自身的子书签）')
+            pos = _subtree_end(rest, rest_keys.index(after))
+        bookmarks = rest[:pos] + moved + rest[pos:]
+    return bookmarks
+
+
+def _merge(state, edit, bookmarks):
+    """把已应用的编辑合并进 state 的 overrides / order。"""
+    key = edit['key']
+    if edit.get('delete'):
+        state['overrides'][key] = {'delete': True}
+        return
+    fields = {f: edit[f] for f in ('title', 'page', 'level') if f in edit}
+    if 'title' in fields:
+        fields['title'] = fields['title'].strip()
+    if fields:
+        state['overrides'].setdefault(key, {}).update(fields)
+    if 'after' in edit:
+        state['order'] = [b[3] for b in bookmarks]
+
+
+def _reorder(bookmarks, order):
+    """按保存的顺序排列；order 中没有的书签（如偏移变化后重新出现的）跟在原来的前一个书签后面。"""
+    pos, prev, ranked = {k: n for n, k in enumerate(order)}, -1, []
+    for n, b in enumerate(bookmarks):
+        if b[3] in pos:
+            prev = pos[b[3]]
+            ranked.append(((prev, 0, n), b))
+        else:
+            ranked.append(((prev, 1, n), b))
+    return [b for _, b in sorted(ranked, key=lambda item: item[0])]
+
+
+def _build(state, total, new_edits=()):
+    """重建书签树并叠加已保存的编辑；new_edits 逐个校验应用并合并进 state。"""
+    bookmarks = _base_bookmarks(state, state['offset'], total)
+    if not any(b[3] != 'toc' for b in bookmarks):
+        raise BookmarkEditError(f'页码偏移 {state["offset"]} 使所有目录条目超出 1-{total} 页')
+    if state['order']:
+        bookmarks = _reorder(bookmarks, state['order'])
+    result = []
+    for b in bookmarks:
+        override = state['overrides'].get(b[3], {})
+        if override.get('delete'):
+            continue
+        if 'level' in override:
+            b[0] = override['level']
+        if 'title' in override:
+            b[1] = override['title']
+        if 'page' in override and override['page'] <= total:
+            b[2] = override['page']
+        result.append(b)
+    for edit in new_edits:
+        result = _apply(result, edit, total)
+        _merge(state, edit, result)
+    return normalize_levels(result)
+
+
+def _result(state, total, bookmarks, **extra):
+    return {
+        'offset':      state['offset'],
+        'base_offset': state['base_offset'],
+        'total_pages': total,
+        'bookmarks':   [{'key': b[3], 'level': b[0], 'title': b[1], 'page': b[2]}
+                        for b in bookmarks],
+        'overrides':   state['overrides'],
+        'order':       state['order'],
+        **extra,
+    }
+
+
+def get_bookmarks(job_dir):
+    """当前书签树（已叠加保存的编辑）。"""
+    state = _load_state(job_dir)
+    with open_pdf(state['final_pdf']) as doc:
+        total = len(doc)
+    return _result(state, total, _build(state, total))
+
+
+def edit_bookmarks(job_dir, body):
+    """
+    应用编辑并重写 final.pdf 的书签。
+    body: {edits?: [...], offset?: int, offset_shift?: int, reset?: bool}
+    """
+    t0 = time.perf_counter()
+    if not isinstance(body, dict):
+        raise BookmarkEditError('请求体必须是 JSON 对象')
+    edits = body.get('edits') or []
+    if not isinstance(edits, list):
+        raise BookmarkEditError('edits 必须是数组')
+
+    with _lock, span('bookmark_reinject'):
+        state = _load_state(job_dir)
+        if body.get('reset'):
+            state.update(offset=state['base_offset'], overrides={}, order=None)
+        for field in ('offset', 'offset_shift'):
+            value = body.get(field)
+            if value is not None and not _is_int(value):
+                raise BookmarkEditError(f'{field} 必须是整数: {value!r}')
+        if body.get('offset') is not None:
+            state['offset'] = body['offset']
+        state['offset'] += body.get('offset_shift') or 0
+
+        with open_pdf(state['final_pdf']) as doc:
+            total     = len(doc)
+            bookmarks = _build(state, total, edits)
+            doc.set_toc(strip_keys(bookmarks))
+            size = os.path.getsize(state['final_pdf'])
+            if (doc.can_save_incrementally()
+                    and size <= state['compact_size'] * (1 + MAX_INCR_GROWTH)):
+                doc.saveIncr()
+                tmp = None
+            else:
+                tmp = state['final_pdf'] + '.tmp'
+                doc.save(tmp, garbage=2, deflate=True)
+        if tmp:
+            os.replace(tmp, state['final_pdf'])
+            state['compact_size'] = os.path.getsize(state['final_pdf'])
+
+        saved = {field: state[field]
+                 for field in ('offset', 'overrides', 'order', 'compact_size')}
+        saved['stamp'] = _stamp(state['final_pdf'])
+        tmp = os.path.join(job_dir, EDITS_FILE + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            json.dump(saved, fh, ensure_ascii=False)
+        os.replace(tmp, os.path.join(job_dir, EDITS_FILE))
+
+    return _result(state, total, bookmarks,
+                   elapsed_ms=round((time.perf_counter() - t0) * 1000, 1))
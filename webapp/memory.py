@@ -0,0 +1,174 @@
+"""
+大文件低内存模式：上千页的扫描件多个任务并行处理时控制内存
+  - 页数 ≥ LARGE_FILE_PAGES 的文档按大文件模式处理：iter_pages 逐页产出页面，每处理完
+    一页检查进程 RSS，超过 MEMORY_LIMIT_MB 时清空 MuPDF 资源缓存（解码后的图片、字体等）
+    并回收垃圾（计入 pdfbm_memory_over_limit_total）；关闭大文件时也清空一次缓存。
+    不逐页无条件清空：文本层页面共享字体，每页重新解析字体会让检测慢数倍
+  - open_pdf(path)：流水线、页面索引、目录指纹打开源文件都经过它，同时打开的文档数
+    不超过 MAX_OPEN_DOCS（所有任务共享，超出时等待；缩略图、页数等毫秒级读取不受限）
+  - RssTracker：任务运行期间采样进程 RSS，峰值随耗时报告写入 timings.json（peak_rss_mb）。
+    同一进程内并行的任务共享 RSS，峰值是该任务运行期间整个进程的峰值
+"""
+import os
+import gc
+import sys
+import threading
+from contextlib import contextmanager
+
+from metrics import REGISTRY, span
+
+LARGE_FILE_PAGES = int(os.environ.get('LARGE_FILE_PAGES', '500'))   # 0 = 关闭大文件模式
+MEMORY_LIMIT_MB  = float(os.environ.get('MEMORY_LIMIT_MB', '0'))     # 0 = 不限
+MAX_OPEN_DOCS    = int(os.environ.get('MAX_OPEN_DOCS', '8'))         # 0 = 不限
+RSS_SAMPLE_INTERVAL = 0.2   # 秒
+RELEASE_STEP_MB  = 32       # 释放后仍超限时，RSS 再增长这么多才再次释放（避免逐页空转）
+
+_slots      = threading.BoundedSemaphore(MAX_OPEN_DOCS) if MAX_OPEN_DOCS > 0 else None
+_open_lock  = threading.Lock()
+_open_count = 0
+_limit_lock  = threading.Lock()   # 串行化 check_limit：并发超限时只释放一次
+_released_at = None         # 上次超限释放后的 RSS（MB），持 _limit_lock 读写
+
+OVER_LIMIT = REGISTRY.counter('pdfbm_memory_over_limit_total',
+                              '大文件模式下进程 RSS 超过 MEMORY_LIMIT_MB 的次数')
+
+
+def is_large(total_pages):
+    return LARGE_FILE_PAGES > 0 and total_pages >= LARGE_FILE_PAGES
+
+
+def _win_rss_mb():
+    import ctypes
+    from ctypes import wintypes
+
+    class _Counters(ctypes.Structure):
+        _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + [
+            (name, ctypes.c_size_t) for name in (
+                'PeakWorkingSetSize', 'WorkingSetSize',
+                'QuotaPeakPagedPoolUsage', 'QuotaPagedPoolUsage',
+                'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage',
+                'PagefileUsage', 'PeakPagefileUsage')]
+
+    kernel32, psapi = ctypes.windll.kernel32, ctypes.windll.psapi
+    kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+    psapi.GetProcessMemoryInfo.argtypes = [wintypes.HANDLE, ctypes.POINTER(_Counters),
+                                           wintypes.DWORD]
+    counters = _Counters(cb=ctypes.sizeof(_Counters))
+    if not psapi.GetProcessMemoryInfo(kernel32.GetCurrentProcess(),
+                                      ctypes.byref(counters), counters.cb):
+        return None
+    return counters.WorkingSetSize / 2**20
+
+
+def current_rss_mb():
+    """当前进程 RSS（MB，Windows 为工作集）；无法获取时返回 None。"""
+    try:
+        if sys.platform == 'win32':
+            return _win_rss_mb()
+        with open('/proc/self/statm') as fh:
+            return int(fh.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def release():
+    """清空 MuPDF 资源缓存并回收垃圾。"""
+    import fitz
+    fitz.TOOLS.store_shrink(100)
+    gc.collect()
+
+
+def check_limit():
+    """进程 RSS 超过 MEMORY_LIMIT_MB 时释放缓存，返回是否释放。"""
+    global _released_at
+    if MEMORY_LIMIT_MB <= 0:
+        return False
+    with _limit_lock:
+        rss = current_rss_mb()
+        if rss is None or rss <= MEMORY_LIMIT_MB:
+            _released_at = None
+            return False
+        if _released_at is not None and rss < _released_at + RELEASE_STEP_MB:
+            return False
+        OVER_LIMIT.inc()
+        release()
+        _released_at = current_rss_mb()
+        return True
+
+
+@contextmanager
+def open_pdf(path):
+    """打开 PDF 并占用一个文档名额，退出时关闭（大文件同时清空缓存）并归还名额。"""
+    import fitz
+    global _open_count
+    if _slots is not None and not _slots.acquire(blocking=False):
+        with span('open_doc_wait'):
+            _slots.acquire()
+    with _open_lock:
+        _open_count += 1
+    try:
+        doc = fitz.open(path)
+        large = is_large(len(doc))
+        try:
+            yield doc
+        finally:
+            doc.close()
+            if large:
+                release()
+    finally:
+        with _open_lock:
+            _open_count -= 1
+        if _slots is not None:
+            _slots.release()
+
+
+def iter_pages(doc, pages=None):
+    """
+    逐页产出 (页码, page)，不预先加载页面。大文件模式下调用方处理完一页（取下一页）时
+    检查内存上限。
+    """
+    large = is_large(len(doc))
+    for i in (range(len(doc)) if pages is None else pages):
+        yield i, doc[i]
+        if large:
+            check_limit()
+
+
+class RssTracker:
+    """后台线程每 interval 秒采样一次进程 RSS，记录峰值（MB）。"""
+
+    def __init__(self, interval=RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.peak     = None
+        self._stop    = threading.Event()
+        self._thread  = None
+
+    def sample(self):
+        rss = current_rss_mb()
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+        return rss
+
+    def start(self):
+        self.sample()
+        self._thread = threading.Thread(target=self._loop, daemon=True, name='rss-tracker')
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """停止采样，返回峰值（MB，保留 1 位小数；无法获取 RSS 时为 None）。"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.sample()
+        return None if self.peak is None else round(self.peak, 1)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+
+REGISTRY.gauge('pdfbm_process_rss_bytes', '服务进程当前 RSS（字节）',
+               fn=lambda: {(): int((current_rss_mb() or 0) * 2**20)})
+REGISTRY.gauge('pdfbm_open_documents', '流水线当前打开的 PDF 文档数',
+               fn=lambda: {(): _open_count})
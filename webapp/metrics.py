@@ -0,0 +1,286 @@
+"""
+轻量耗时埋点与 Prometheus 指标
+  - span(name)：计时上下文管理器 / 装饰器，写入全局直方图 pdfbm_span_seconds，
+    并累加到当前线程正在记录的任务耗时报告（TimingReport）
+  - TimingReport：单个任务的步骤耗时 + 热点函数累计耗时；包装 emit 后，
+    SSE 的 step_start / done 事件带上结构化耗时字段，结束时写入 job 目录 timings.json
+  - REGISTRY.render()：Prometheus 文本格式（/metrics）
+
+不依赖 prometheus_client；指标数量很少，按需扩展。
+"""
+import os
+import json
+import time
+import threading
+from functools import wraps
+from contextlib import contextmanager
+
+TIMINGS_FILE = 'timings.json'
+
+_DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+                    30, 60, 120, 300, 600)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _fmt_labels(names, values, le=None):
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if le is not None:
+        parts.append(f'le="{le}"')
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _fmt_value(v):
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name, help_, labels=()):
+        self.name   = name
+        self.help   = help_
+        self.labels = tuple(labels)
+        self._lock  = threading.Lock()
+        self._data: dict = {}
+
+    def _key(self, labels):
+        return tuple(labels.get(n, '') for n in self.labels)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._data[key] = self._data.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._data.items())
+        return self.header() + [f'{self.name}{_fmt_labels(self.labels, k)} {_fmt_value(v)}'
+                                for k, v in items]
+
+
+class Gauge(_Metric):
+    """取值由回调在抓取时计算：fn() → {标签值元组: 数值}。"""
+    kind = 'gauge'
+
+    def __init__(self, name, help_, labels=(), fn=None):
+        super().__init__(name, help_, labels)
+        self.fn = fn
+
+    def render(self):
+        try:
+            data = self.fn() if self.fn else {}
+        except Exception:
+            data = {}
+        return self.header() + [f'{self.name}{_fmt_labels(self.labels, k)} {_fmt_value(v)}'
+                                for k, v in sorted(data.items())]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_, labels=(), buckets=_DEFAULT_BUCKETS):
+        super().__init__(name, help_, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            st = self._data.get(key)
+            if st is None:
+                st = self._data[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, le in enumerate(self.buckets):
+                if value <= le:
+                    st[0][i] += 1
+            st[1] += value
+            st[2] += 1
+
+    def render(self):
+        with self._lock:
+            items = sorted((k, (list(c), s, n)) for k, (c, s, n) in self._data.items())
+        lines = self.header()
+        for key, (counts, total, n) in items:
+            for le, c in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{_fmt_labels(self.labels, key, le)} {c}')
+            lines.append(f'{self.name}_bucket{_fmt_labels(self.labels, key, "+Inf")} {n}')
+            lines.append(f'{self.name}_sum{_fmt_labels(self.labels, key)} {total!r}')
+            lines.append(f'{self.name}_count{_fmt_labels(self.labels, key)} {n}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_, labels=()):
+        return self._add(Counter(name, help_, labels))
+
+    def gauge(self, name, help_, labels=(), fn=None):
+        return self._add(Gauge(name, help_, labels, fn))
+
+    def histogram(self, name, help_, labels=(), buckets=_DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help_, labels, buckets))
+
+    def render(self):
+        lines = []
+        for m in self._metrics:
+            lines.extend(m.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY       = Registry()
+SPAN_SECONDS   = REGISTRY.histogram('pdfbm_span_seconds',
+                                    '流水线步骤与热点函数耗时（秒）', ['span'])
+CACHE_REQUESTS = REGISTRY.counter('pdfbm_cache_requests_total',
+                                  '缓存查询次数（result=hit|miss）', ['cache', 'result'])
+JOBS_FINISHED  = REGISTRY.counter('pdfbm_jobs_finished_total',
+                                  '结束的流水线任务数', ['status'])
+
+
+def cache_lookup(cache, hits=0, misses=0):
+    """记录缓存命中 / 未命中次数（page_text、offset、ai_chunk、toc_library、upload_dedup 等）。"""
+    if hits:
+        CACHE_REQUESTS.inc(hits, cache=cache, result='hit')
+    if misses:
+        CACHE_REQUESTS.inc(misses, cache=cache, result='miss')
+
+
+# ── 计时 ──────────────────────────────────────────────────────────
+
+_local = threading.local()    # .report：当前线程正在记录的 TimingReport
+
+
+class span:
+    """
+    计时上下文管理器，也可作装饰器：
+        with span('mineru_upload'): ...
+        @span('ocr')
+        def ocr_page(...): ...
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        dt = time.perf_counter() - self._t0
+        SPAN_SECONDS.observe(dt, span=self.name)
+        report = getattr(_local, 'report', None)
+        if report is not None:
+            report.add_span(self.name, dt)
+        return False
+
+    def __call__(self, fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(self.name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+
+def bind(fn):
+    """让 fn 在其他线程（如线程池）中执行时，span 仍计入调用方线程当前的报告。"""
+    report = getattr(_local, 'report', None)
+    if report is None:
+        return fn
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        with report.recording():
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+class TimingReport:
+    """
+    单个任务的耗时报告：{elapsed, steps: {step: 秒}, spans: {名称: {count, seconds}}}。
+    rss：可选的 RSS 采样器（memory.RssTracker），报告附带运行期间的峰值 peak_rss_mb。
+    """
+
+    def __init__(self, rss=None):
+        self.rss   = rss
+        self.t0    = time.perf_counter()
+        self.steps: dict = {}
+        self.spans: dict = {}
+        self._step = None           # (步骤号, 开始时间)
+        self._lock = threading.Lock()
+
+    def add_span(self, name, seconds):
+        with self._lock:
+            st = self.spans.setdefault(name, {'count': 0, 'seconds': 0.0})
+            st['count']   += 1
+            st['seconds'] += seconds
+
+    def _close_step(self, now):
+        if self._step is None:
+            return None
+        step, start = self._step
+        dt = now - start
+        self.steps[f'step{step}'] = round(self.steps.get(f'step{step}', 0) + dt, 3)
+        SPAN_SECONDS.observe(dt, span=f'step{step}')
+        self._step = None
+        return dt
+
+    def wrap_emit(self, emit):
+        """包装 emit：step_start 附带 elapsed 与上一步耗时，done / error 附带完整报告。"""
+        def _emit(type_, msg='', step=None, progress=None, **kwargs):
+            now = time.perf_counter()
+            if type_ == 'step_start' and step is not None:
+                prev = self._step[0] if self._step else None
+                dt   = self._close_step(now)
+                self._step = (step, now)
+                kwargs['elapsed'] = round(now - self.t0, 3)
+                if dt is not None:
+                    kwargs['prev_step']         = prev
+                    kwargs['prev_step_seconds'] = round(dt, 3)
+            elif type_ in ('done', 'error'):
+                self._close_step(now)
+                kwargs['elapsed'] = round(now - self.t0, 3)
+                kwargs['timings'] = self.to_dict()
+            emit(type_, msg, step=step, progress=progress, **kwargs)
+        return _emit
+
+    @contextmanager
+    def recording(self):
+        """在当前线程内把 span 计时累加到本报告。"""
+        prev = getattr(_local, 'report', None)
+        _local.report = self
+        try:
+            yield self
+        finally:
+            _local.report = prev
+
+    def to_dict(self):
+        with self._lock:
+            spans = {k: {'count': v['count'], 'seconds': round(v['seconds'], 3)}
+                     for k, v in sorted(self.spans.items())}
+        out = {'elapsed': round(time.perf_counter() - self.t0, 3),
+               'steps':   dict(self.steps),
+               'spans':   spans}
+        if self.rss is not None and self.rss.peak is not None:
+            out['peak_rss_mb'] = round(self.rss.peak, 1)
+        return out
+
+    def save(self, path):
+        """写入 path（未结束的步骤按当前时间结算）。"""
+        self._close_step(time.perf_counter())
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            json.dump(self.to_dict(), fh, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
@@ -0,0 +1,229 @@
+"""
+整份文档的逐页特征索引（每个上传文件构建一次，随 CAS 持久化为 page_index.json）
+  - 有文本层的页：每页一次取文本，每个特征用一条多行正则在整页文本上统计，
+    不再逐行循环
+  - 扫描页：上传时只 OCR 抽样页（默认前 25 页，即主目录检测范围），
+    其余页标记为待补，检测条文说明目录时按需 OCR 后写回索引；
+    没有“条文说明”书签时在后半部分每隔 CLAUSE_PROBE_STEP 页抽样 OCR，按“条文说明”关键词
+    或条号章号回落（正文已到第 6 章，抽样页又从 1.0.1 开始）定位条文说明起始页
+  - 主目录检测（detect_toc_pages）与条文说明目录检测（find_clause_toc_pages）
+    都由索引打分，不再各自顺序扫描
+
+特征按列存储（每列长度 = 总页数，待补页为 None）：
+  chars            文本层字符数（去除首尾空白）
+  kw_toc           “目录 / 目 录 / 目次”出现次数
+  kw_clause        “条文说明”出现次数
+  leaders          以点线引导符或空白 + 页码结尾的行数（主目录打分）
+  tails            以文字 + 页码结尾的行数（条文说明目录打分）
+  sections         “1 / 1.2 + 标题”开头的行数（主目录打分）
+  clause_sections  “1 / 1.2.3 + 空白”开头的行数（条文说明目录打分）
+  chapter          页面上第一个条号（如 6.3.11）的章号，没有条号为 0（定位条文说明起始页）
+"""
+import os
+import re
+import threading
+
+from memory import open_pdf, iter_pages
+from metrics import span
+from render_queue import RENDER_QUEUE
+
+INDEX_VERSION    = 2
+OCR_SAMPLE_PAGES = 25    # 上传时 OCR 的扫描页范围（与主目录检测范围一致）
+TEXT_LAYER_MIN   = 50    # 文本层少于该字符数视为扫描页
+CLAUSE_PROBE_STEP   = 8  # 定位条文说明起始页时后半部分的抽样间隔（页）
+CLAUSE_PROBE_BUDGET = 80 # 抽样 OCR 的页数上限（千页扫描件约为后半部分的 1/6）
+
+FEATURES = ('chars', 'kw_toc', 'kw_clause', 'leaders', 'tails',
+            'sections', 'clause_sections', 'chapter')
+
+_RE_LINE_WS = re.compile(r'\s*\n\s*')      # 去掉每行首尾空白并合并空行
+_RE_KW_TOC  = re.compile(r'目\s?录|目次')
+_RE_LEADERS = re.compile(r'^(?:.*(?:\.|[^\S\n]){3,}\d+|[1-9].*[^\S\n]\d+)$', re.M)
+_RE_TAILS   = re.compile(r'[\u4e00-\u9fff\w][^\S\n]*\d+$', re.M)
+_RE_SECS    = re.compile(r'^[1-9]\d*(?:\.\d+)?[^\S\n]+\S', re.M)
+_RE_CSECS   = re.compile(r'^[1-9]\d*(?:\.\d+)*[^\S\n]', re.M)
+_RE_CLAUSE_NO = re.compile(r'^([1-9]\d*)(?:\.\d+){2}[^\S\n]', re.M)
+
+
+def page_features(text):
+    """单页文本 → 特征元组（顺序同 FEATURES）。"""
+    text = _RE_LINE_WS.sub('\n', text.strip())
+    clause_no = _RE_CLAUSE_NO.search(text)
+    return (len(text),
+            len(_RE_KW_TOC.findall(text)),
+            text.count('条文说明'),
+            len(_RE_LEADERS.findall(text)),
+            len(_RE_TAILS.findall(text)),
+            len(_RE_SECS.findall(text)),
+            len(_RE_CSECS.findall(text)),
+            int(clause_no.group(1)) if clause_no else 0)
+
+
+_tesseract_lock  = threading.Lock()
+_tesseract_ready = False
+
+
+def setup_tesseract():
+    """
+    自动定位 tesseract 和包含 chi_sim.traineddata 的 tessdata 目录。
+    首次 OCR（或预热）时才执行一次，导入模块时不探测文件系统。
+    """
+    global _tesseract_ready
+    if _tesseract_ready:
+        return
+    with _tesseract_lock:
+        if _tesseract_ready:
+            return
+        import pytesseract
+        cmd = os.environ.get("TESSERACT_CMD",
+                             r"C:\Program Files\Tesseract-OCR\tesseract.exe")
+        pytesseract.pytesseract.tesseract_cmd = cmd
+
+        # 候选 tessdata 目录（按优先级）
+        candidates = [
+            os.environ.get("TESSDATA_PREFIX", ""),                        # 环境变量
+            os.path.join(os.path.dirname(os.path.abspath(cmd)), "tessdata"),  # exe 同级
+            r"C:\Program Files\Tesseract-OCR\tessdata",                   # 默认安装路径
+            r"C:\Program Files (x86)\Tesseract-OCR\tessdata",
+        ]
+        for p in candidates:
+            if p and os.path.isfile(os.path.join(p, "chi_sim.traineddata")):
+                os.environ["TESSDATA_PREFIX"] = p
+                break
+        _tesseract_ready = True
+
+
+@span('ocr')
+def ocr_page(page, scale):
+    """Tesseract 识别单页（灰度渲染，scale 为相对 72 DPI 的缩放）。后台优先级，让位于缩略图。"""
+    import fitz
+    import pytesseract
+    from PIL import Image
+    setup_tesseract()
+    with RENDER_QUEUE.slot():
+        pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale), colorspace=fitz.csGRAY)
+        # 直接用灰度像素构造图像（省去 PNG 编解码），像素图随即释放，识别期间只保留一份位图
+        img = Image.frombytes('L', (pix.width, pix.height), pix.samples)
+        del pix
+        try:
+            return pytesseract.image_to_string(img, lang="chi_sim+eng", config="--psm 3")
+        finally:
+            img.close()
+
+
+class PageIndex:
+    def __init__(self, total):
+        self.total  = total
+        self.source = [None] * total          # 'text' | 'ocr' | None（待补 OCR）
+        self.cols   = {name: [None] * total for name in FEATURES}
+
+    # ── 构建 / 补全 ─────────────────────────────────────────────────
+
+    @classmethod
+    @span('page_index_build')
+    def build(cls, pdf_path, sample_pages=OCR_SAMPLE_PAGES, ocr_scale=1.0):
+        """一次遍历所有页的文本层；扫描页只 OCR 前 sample_pages 页。"""
+        with open_pdf(pdf_path) as doc:
+            idx = cls(len(doc))
+            for i, page in iter_pages(doc):
+                # 逐页申请后台名额：检测期间缩略图请求最多等一页
+                with RENDER_QUEUE.slot():
+                    text = page.get_text()
+                    if len(text.strip()) >= TEXT_LAYER_MIN:
+                        idx._set(i, text, 'text')
+                    elif i < sample_pages:
+                        idx._set(i, ocr_page(page, ocr_scale), 'ocr')
+                    else:
+                        idx.cols['chars'][i] = len(text.strip())
+        return idx
+
+    def _set(self, i, text, source):
+        for name, value in zip(FEATURES, page_features(text)):
+            self.cols[name][i] = value
+        self.source[i] = source
+
+    def missing(self, pages):
+        return [i for i in pages if 0 <= i < self.total and self.source[i] is None]
+
+    def ensure(self, pdf_path, pages, ocr_scale=1.5):
+        """OCR pages 中尚未索引的扫描页并写回，返回新 OCR 的页码列表。"""
+        todo = self.missing(pages)
+        if todo:
+            with open_pdf(pdf_path) as doc:
+                for i, page in iter_pages(doc, todo):
+                    self._set(i, ocr_page(page, ocr_scale), 'ocr')
+        return todo
+
+    # ── 打分与查询 ──────────────────────────────────────────────────
+
+    def toc_score(self, i):
+        """主目录打分：目录关键词 3 分 + 引导符行（≤5）+ 章节行（≤5），≥4 视为目录页。"""
+        c = self.cols
+        if self.source[i] is None:
+            return 0
+        return ((3 if c['kw_toc'][i] else 0) +
+                min(c['leaders'][i], 5) + min(c['sections'][i], 5))
+
+    def clause_score(self, i):
+        """条文说明目录打分：目录关键词 3 分 + 页码结尾行（≤6）+ 条号行（≤5），≥5 视为目录页。"""
+        c = self.cols
+        if self.source[i] is None:
+            return 0
+        return ((3 if c['kw_toc'][i] else 0) +
+                min(c['tails'][i], 6) + min(c['clause_sections'][i], 5))
+
+    def find_clause_start(self, start=None):
+        """第 start 页（默认文档后半部分）起第一处出现“条文说明”的已索引页，找不到返回 None。"""
+        if start is None:
+            start = self.total // 2
+        kw = self.cols['kw_clause']
+        for i in range(start, self.total):
+            if kw[i]:
+                return i
+        return None
+
+    def locate_clause_start(self, pdf_path, step=CLAUSE_PROBE_STEP, budget=CLAUSE_PROBE_BUDGET):
+        """
+        find_clause_start 的扫描件版本：已索引页中找不到时，在后半部分未索引的页中
+        每隔 step 页抽样 OCR（最多 budget 页）。抽样页出现“条文说明”，或其章号小于此前
+        抽样到的最大章号（条文说明从第 1 章重新开始）时，补 OCR 与上一个抽样页之间的页，
+        返回其中第一处出现“条文说明”的页；找不到返回 None。
+        """
+        hit = self.find_clause_start()
+        if hit is not None:
+            return hit
+        start  = self.total // 2
+        probes = self.missing(range(start, self.total))[::step][:budget]
+        prev, top = start - 1, 0
+        for p in probes:
+            self.ensure(pdf_path, [p])
+            chapter = self.cols['chapter'][p]
+            if self.cols['kw_clause'][p] or 0 < chapter < top:
+                self.ensure(pdf_path, range(prev + 1, p))
+                hit = self.find_clause_start(prev + 1)
+                if hit is not None and hit <= p:
+                    return hit
+            top, prev = max(top, chapter), p
+        return None
+
+    # ── 序列化 ──────────────────────────────────────────────────────
+
+    def to_dict(self):
+        return {'version': INDEX_VERSION, 'total': self.total,
+                'source': self.source, **self.cols}
+
+    @classmethod
+    def from_dict(cls, data):
+        """从 to_dict 的结果恢复；版本或结构不符时返回 None（调用方重建）。"""
+        try:
+            if data.get('version') != INDEX_VERSION:
+                return None
+            idx = cls(int(data['total']))
+            idx.source = list(data['source'])
+            for name in FEATURES:
+                idx.cols[name] = list(data[name])
+            if any(len(col) != idx.total for col in (idx.source, *idx.cols.values())):
+                return None
+            return idx
+        except (AttributeError, KeyError, TypeError, ValueError):
+            return None
@@ -4,36 +4,47 @@ PDF 书签注入流水线核心逻辑
 
 所有 print() 替换为 emit(type, msg, ...) 调用，向 SSE 队列发送事件。
 """
-import os, re, io, json, glob, shutil, requests, zipfile, time
-
-import fitz
-import pytesseract
-from PIL import Image
-
-
-def _setup_tesseract():
-    """自动定位 tesseract 和包含 chi_sim.traineddata 的 tessdata 目录。"""
-    cmd = os.environ.get("TESSERACT_CMD",
-                         r"C:\Program Files\Tesseract-OCR\tesseract.exe")
-    pytesseract.pytesseract.tesseract_cmd = cmd
-
-    # 候选 tessdata 目录（按优先级）
-    candidates = [
-        os.environ.get("TESSDATA_PREFIX", ""),                        # 环境变量
-        os.path.join(os.path.dirname(os.path.abspath(cmd)), "tessdata"),  # exe 同级
-        r"C:\Program Files\Tesseract-OCR\tessdata",                   # 默认安装路径
-        r"C:\Program Files (x86)\Tesseract-OCR\tessdata",
-    ]
-    for p in candidates:
-        if p and os.path.isfile(os.path.join(p, "chi_sim.traineddata")):
-            os.environ["TESSDATA_PREFIX"] = p
-            return
+import os, re, io, json, glob, shutil, hashlib, zipfile, time, importlib
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from metrics import span, cache_lookup
+from memory import RssTracker, open_pdf, iter_pages
+from page_index import PageIndex, ocr_page, setup_tesseract
+from render_queue import RENDER_QUEUE, INTERACTIVE
+from storage import UPLOAD_DIR
+from toc_library import TOC_LIBRARY_ENABLED, toc_fingerprint, get_library
+
+# 重依赖在首次使用时于函数内导入（import fitz / requests），导入本模块本身不加载它们，
+# Tesseract 也在首次 OCR 时才定位；服务启动后可调用 warm_up() 在后台预先加载
+HEAVY_MODULES = ('fitz', 'requests', 'pytesseract', 'PIL.Image')
 
 
-_setup_tesseract()
+@span('warm_up')
+def warm_up():
+    """导入重依赖并定位 Tesseract，返回耗时（秒）。已加载的模块不重复计时。"""
+    t0 = time.perf_counter()
+    for name in HEAVY_MODULES:
+        importlib.import_module(name)
+    setup_tesseract()
+    return time.perf_counter() - t0
+
 
 MINERU_API_TOKEN = os.environ.get('MINERU_API_TOKEN', '')
-MINERU_API_BASE  = 'https://mineru.net/api/v4'
+MINERU_API_BASE  = os.environ.get('MINERU_API_BASE', 'https://mineru.net/api/v4')  # 可指向本地桩服务
+MINERU_POLL_INTERVAL = float(os.environ.get('MINERU_POLL_INTERVAL', '5'))  # 轮询间隔（秒）
+MINERU_TIMEOUT       = 600
+
+# 上传 MinerU 前的 PDF 瘦身（见 _insert_pages）
+UPLOAD_OPTIMIZE     = os.environ.get('UPLOAD_OPTIMIZE', '1') != '0'
+UPLOAD_DPI          = int(os.environ.get('UPLOAD_DPI', '200'))          # 扫描页重新渲染的分辨率
+UPLOAD_JPEG_QUALITY = int(os.environ.get('UPLOAD_JPEG_QUALITY', '75'))
+SCAN_COVERAGE       = 0.8    # 单张图片覆盖页面面积的比例达到该值视为整页扫描图
+
+UPLOAD_BYTES = metrics.REGISTRY.counter('pdfbm_upload_bytes_total',
+                                        '上传 MinerU 的 PDF 字节数（kind=original_estimate 原样复制的估算大小，'
+                                        '按页面引用的对象与流长度估算、不实际序列化 / sent 实际上传）',
+                                        ['kind'])
 
 
 # ══════════════════════════════════════════════════════
@@ -42,64 +53,66 @@ MINERU_API_BASE  = 'https://mineru.net/api/v4'
 
 def get_pdf_page_count(pdf_path):
     """返回 PDF 总页数。"""
+    import fitz
     doc = fitz.open(pdf_path)
     n = len(doc)
     doc.close()
     return n
 
 
+@span('thumbnail')
 def render_page_thumbnail(pdf_path, page_num, width=130):
-    """将指定页渲染为 PNG bytes（低分辨率，用于预览）。"""
-    doc = fitz.open(pdf_path)
-    if page_num < 0 or page_num >= len(doc):
+    """将指定页渲染为 PNG bytes（低分辨率，用于预览）。交互优先级，先于后台 OCR 执行。"""
+    import fitz
+    with RENDER_QUEUE.slot(INTERACTIVE):
+        doc = fitz.open(pdf_path)
+        if page_num < 0 or page_num >= len(doc):
+            doc.close()
+            return None
+        page  = doc[page_num]
+        scale = width / page.rect.width
+        mat   = fitz.Matrix(scale, scale)
+        pix   = page.get_pixmap(matrix=mat, colorspace=fitz.csRGB)
+        data  = pix.tobytes("png")
         doc.close()
-        return None
-    page  = doc[page_num]
-    scale = width / page.rect.width
-    mat   = fitz.Matrix(scale, scale)
-    pix   = page.get_pixmap(matrix=mat, colorspace=fitz.csRGB)
-    data  = pix.tobytes("png")
-    doc.close()
     return data
 
 
-def _score_page_for_toc(page):
-    """对单页做轻量 OCR 打分，返回 (score, has_toc_word)。"""
-    # 优先使用内嵌文本（born-digital PDF 瞬间完成）
-    text = page.get_text()
-    if len(text.strip()) < 30:
-        # 扫描版：OCR，用 1.0x 比 1.5x 快约 40%
-        mat = fitz.Matrix(1.0, 1.0)
-        pix = page.get_pixmap(matrix=mat, colorspace=fitz.csGRAY)
-        img = Image.open(io.BytesIO(pix.tobytes("png")))
-        text = pytesseract.image_to_string(img, lang="chi_sim+eng", config="--psm 3")
-
-    lines = [l.strip() for l in text.splitlines() if l.strip()]
-    has_toc_word  = any("目录" in l or "目 录" in l for l in lines)
-    dot_num_lines = sum(1 for l in lines
-                        if re.search(r'[\.\s]{3,}\d+\s*$', l) or
-                           re.search(r'\s+\d+\s*$', l) and re.match(r'^[1-9]', l))
-    section_nums  = sum(1 for l in lines if re.match(r'^[1-9]\d*(\.\d+)?\s+\S', l))
-    score = (3 if has_toc_word else 0) + min(dot_num_lines, 5) + min(section_nums, 5)
-    return score, has_toc_word
-
-
-def detect_toc_pages(pdf_path, scan_limit=25):
+@span('detect_toc')
+def detect_toc_pages(pdf_path, scan_limit=25, index=None):
     """
-    OCR 扫描前 scan_limit 页，返回每页评分列表：
+    由逐页特征索引（page_index.PageIndex）为前 scan_limit 页打分，返回：
       [{'page': int, 'score': int, 'detected': bool}, ...]
-    后台线程调用，不阻塞主进程。
+    index 为 None 时现建索引。后台线程调用，不阻塞主进程。
     """
-    doc     = fitz.open(pdf_path)
-    total   = len(doc)
+    if index is None:
+        index = PageIndex.build(pdf_path, sample_pages=scan_limit)
+    pages = range(min(scan_limit, index.total))
+    index.ensure(pdf_path, pages, ocr_scale=1.0)
     results = []
-    for i in range(min(scan_limit, total)):
-        score, _ = _score_page_for_toc(doc[i])
+    for i in pages:
+        score = index.toc_score(i)
         results.append({'page': i, 'score': score, 'detected': score >= 4})
-    doc.close()
     return results
 
 
+def pick_toc_pages(results, total_pages):
+    """
+    由 detect_toc_pages 的评分结果选出建议目录页（0-indexed）：
+    取第一个连续簇（允许间隔 1 页）；无检出时退回第 4~8 页。
+    """
+    detected_raw = sorted(r['page'] for r in results if r['detected'])
+    if not detected_raw:
+        return list(range(3, min(8, total_pages)))
+    cluster = [detected_raw[0]]
+    for p in detected_raw[1:]:
+        if p <= cluster[-1] + 2:
+            cluster.append(p)
+        else:
+            break
+    return list(range(cluster[0], cluster[-1] + 1))
+
+
 # ══════════════════════════════════════════════════════
 # Step 1: 将用户选定的页面提取为独立 PDF
 # ══════════════════════════════════════════════════════
@@ -111,19 +124,13 @@ def extract_toc_pages(pdf_path, selected_pages, toc_out, emit):
     """
     emit('step_start', '提取目录页...', step=1, progress=0)
 
-    doc      = fitz.open(pdf_path)
-    total    = len(doc)
-    selected = sorted(set(p for p in selected_pages if 0 <= p < total))
+    with open_pdf(pdf_path) as doc:
+        total    = len(doc)
+        selected = sorted(set(p for p in selected_pages if 0 <= p < total))
 
-    emit('log', f'原始 PDF: {total} 页')
-    emit('log', f'目录页: PDF 第 {[p+1 for p in selected]} 页')
-
-    toc_doc = fitz.open()
-    for i in selected:
-        toc_doc.insert_pdf(doc, from_page=i, to_page=i)
-    toc_doc.save(toc_out)
-    toc_doc.close()
-    doc.close()
+        emit('log', f'原始 PDF: {total} 页')
+        emit('log', f'目录页: PDF 第 {[p+1 for p in selected]} 页')
+        _insert_pages(doc, selected, toc_out, emit)
 
     size_kb = os.path.getsize(toc_out) / 1024
     emit('log', f'已保存目录 PDF: {toc_out}  ({size_kb:.0f} KB, {len(selected)} 页)')
@@ -136,45 +143,68 @@ def extract_toc_pages(pdf_path, selected_pages, toc_out, emit):
 # Step 2 / Step 5: MinerU Cloud API
 # ══════════════════════════════════════════════════════
 
-def _run_mineru_api(pdf_path, out_dir, emit, step_num, start_pct):
-    """调用 MinerU Cloud API 解析 PDF，替代本地 magic-pdf。"""
+def _run_mineru_api(pdf_path, out_dir, emit, step_num, start_pct,
+                    batch_id=None, on_submitted=None):
+    """
+    调用 MinerU Cloud API 解析 PDF，替代本地 magic-pdf。
+    batch_id:      已提交过的批次（从检查点恢复），跳过上传直接轮询结果。
+    on_submitted:  上传完成后以 batch_id 回调，供调用方写入检查点。
+    """
     token = MINERU_API_TOKEN
     if not token:
         raise RuntimeError('未设置 MINERU_API_TOKEN')
 
     emit('step_start', 'MinerU Cloud API 处理中...', step=step_num, progress=start_pct)
+    if batch_id:
+        emit('log', f'从检查点恢复，继续查询已提交的批次 {batch_id}')
+    else:
+        batch_id = _submit_mineru(pdf_path, emit)
+        if on_submitted:
+            on_submitted(batch_id)
+    _fetch_mineru_result(batch_id, out_dir, emit)
+
+
+def _submit_mineru(pdf_path, emit):
+    """获取预签名地址并上传 PDF，返回 batch_id。"""
+    import requests
     headers = {
         'Authorization': f'Bearer {MINERU_API_TOKEN}',
         'Content-Type': 'application/json',
     }
 
-    # 1. 获取预签名上传地址
-    emit('log', '正在获取上传地址...')
-    filename = os.path.basename(pdf_path)
-    resp = requests.post(
-        f'{MINERU_API_BASE}/file-urls/batch',
-        headers=headers,
-        json={'files': [{'name': filename, 'is_ocr': True, 'data_id': filename}]},
-        timeout=30,
-    )
-    resp.raise_for_status()
-    body = resp.json()
-    if body.get('code') != 0:
-        raise RuntimeError(f'获取上传地址失败: {body}')
-    batch_id   = body['data']['batch_id']
-    upload_url = body['data']['file_urls'][0]
-
-    # 2. 上传 PDF
-    size_kb = os.path.getsize(pdf_path) // 1024
-    emit('log', f'上传 PDF（{size_kb} KB）...')
-    with open(pdf_path, 'rb') as f:
-        requests.put(upload_url, data=f, timeout=120).raise_for_status()
+    with span('mineru_upload'):
+        # 1. 获取预签名上传地址
+        emit('log', '正在获取上传地址...')
+        filename = os.path.basename(pdf_path)
+        resp = requests.post(
+            f'{MINERU_API_BASE}/file-urls/batch',
+            headers=headers,
+            json={'files': [{'name': filename, 'is_ocr': True, 'data_id': filename}]},
+            timeout=30,
+        )
+        resp.raise_for_status()
+        body = resp.json()
+        if body.get('code') != 0:
+            raise RuntimeError(f'获取上传地址失败: {body}')
+        batch_id   = body['data']['batch_id']
+        upload_url = body['data']['file_urls'][0]
+
+        # 2. 上传 PDF
+        size_kb = os.path.getsize(pdf_path) // 1024
+        emit('log', f'上传 PDF（{size_kb} KB）...')
+        with open(pdf_path, 'rb') as f:
+            requests.put(upload_url, data=f, timeout=120).raise_for_status()
     emit('log', '上传完成，等待云端解析...')
+    return batch_id
 
-    # 3. 轮询结果（最多等 10 分钟）
+
+@span('mineru_queue')
+def _poll_mineru(batch_id, emit):
+    """轮询批次状态（最多等 10 分钟），返回结果 ZIP 地址。"""
+    import requests
     auth_headers = {'Authorization': f'Bearer {MINERU_API_TOKEN}'}
-    for attempt in range(120):
-        time.sleep(5)
+    for attempt in range(int(MINERU_TIMEOUT / MINERU_POLL_INTERVAL)):
+        time.sleep(MINERU_POLL_INTERVAL)
         r = requests.get(
             f'{MINERU_API_BASE}/extract-results/batch/{batch_id}',
             headers=auth_headers,
@@ -188,22 +218,28 @@ def _run_mineru_api(pdf_path, out_dir, emit, step_num, start_pct):
         if not files:
             continue
         state = files[0].get('state', '')
-        emit('log', f'[MinerU] 状态: {state}（已等待 {attempt * 5}s）')
+        emit('log', f'[MinerU] 状态: {state}（已等待 {attempt * MINERU_POLL_INTERVAL:.0f}s）')
         if state == 'done':
-            zip_url = files[0]['full_zip_url']
-            break
+            return files[0]['full_zip_url']
         if state == 'failed':
             raise RuntimeError(f'MinerU 解析失败: {files[0].get("err_msg")}')
-    else:
-        raise RuntimeError('MinerU API 超时（10 分钟）')
+    raise RuntimeError('MinerU API 超时（10 分钟）')
+
+
+def _fetch_mineru_result(batch_id, out_dir, emit):
+    """轮询批次状态，完成后下载并解压结果到 out_dir。"""
+    import requests
+    # 3. 轮询结果
+    zip_url = _poll_mineru(batch_id, emit)
 
     # 4. 下载并解压 ZIP
     emit('log', '下载解析结果...')
-    zip_resp = requests.get(zip_url, timeout=120)
-    zip_resp.raise_for_status()
-    os.makedirs(out_dir, exist_ok=True)
-    with zipfile.ZipFile(io.BytesIO(zip_resp.content)) as zf:
-        zf.extractall(out_dir)
+    with span('mineru_download'):
+        zip_resp = requests.get(zip_url, timeout=120)
+        zip_resp.raise_for_status()
+        os.makedirs(out_dir, exist_ok=True)
+        with zipfile.ZipFile(io.BytesIO(zip_resp.content)) as zf:
+            zf.extractall(out_dir)
     emit('log', 'MinerU Cloud API 处理完成')
 
 
@@ -211,8 +247,9 @@ def _run_mineru_api(pdf_path, out_dir, emit, step_num, start_pct):
 # 共用解析工具函数
 # ══════════════════════════════════════════════════════
 
-RE_SEC_PREFIX = re.compile(r'^([1-9]\d*(?:\.\d+)*)\s*(.*)')
-_TRAIL = re.compile(r'[\u2026\u00b7\uff0e\uff0c.\s\uff08\uff3b（【(\uff1a:\u3001\uff09）】\uff3d]+$')
+# 目录行解析：每行只做一次预编译的行首匹配，页码从行尾反向扫描，
+# 不再对每行逐个尝试 re.search / 特殊条目列表。
+# 行为以 benchmarks/data/toc_parse_golden.jsonl 为准（benchmarks/bench_toc_parse.py 校验）。
 
 _SPECIALS = [
     ('附：条文说明',   '条文说明'),
@@ -221,19 +258,65 @@ _SPECIALS = [
     ('引用标准名录',   '引用标准名录'),
     ('条文说明',       '条文说明'),
 ]
+_SPECIAL_LABELS = dict(_SPECIALS)
+
+# 行首记号：附录 / 特殊条目 / 数字编号，三者互斥，一次 match 分派
+_RE_TOC_HEAD = re.compile(
+    r'附录\s*(?P<app>[A-Za-z])\s*'
+    r'|(?P<spec>' + '|'.join(re.escape(kw) for kw, _ in _SPECIALS) + r')'
+    r'|(?P<sec>[1-9]\d*(?:\.\d+)*)\s*'
+)
+_RE_APPENDIX_HEAD = re.compile(r'附录\s*[A-Za-z]')
+_RE_MERGED_SPLIT  = re.compile(
+    r'(?<=[）)】\]])\s*'
+    r'(?=[1-9]\d*(?:\.\d+)?\s*[\u4e00-\u9fff]'
+    r'|附录\s*[A-Za-z]|附：|标准用词|本规范用词|引用标准)'
+)
+
+# 标题末尾需去除的引导符/标点（另加所有空白字符）
+_TRAIL_CHARS = '\u2026\u00b7\uff0e\uff0c.\uff08\uff3b【(\uff1a:\u3001\uff09】\uff3d'
+_PAGE_OPEN   = '（([【'
+_PAGE_CLOSE  = '）)]】'
+_PAGE_EQ     = '=＝'
 
 
 def _clean_title(t):
-    return _TRAIL.sub('', t).strip()
+    while True:
+        stripped = t.rstrip(_TRAIL_CHARS).rstrip()
+        if stripped == t:
+            return t.strip()
+        t = stripped
 
 
 def _find_page_num(text):
-    m = re.search(r'[\uff08（(\[【]\s*[=＝]?\s*(\d{1,4})\s*[\uff09）)\]】]\s*$', text)
-    if m:
-        return m, int(m.group(1))
-    m = re.search(r'(\d{1,4})\s*$', text)
-    if m:
-        return m, int(m.group(1))
+    """
+    从行尾反向识别页码，返回 (页码起始下标, 页码)；无页码返回 (None, None)。
+    支持 "…… 12"、"(12)"、"（＝12）"、"【12】" 等形式，页码最多 4 位。
+    """
+    end = len(text.rstrip())
+    if not end:
+        return None, None
+    last = text[end - 1]
+
+    if last in _PAGE_CLOSE:
+        i = len(text[:end - 1].rstrip())
+        j = i
+        while j and text[j - 1].isdecimal():
+            j -= 1
+        if not 1 <= i - j <= 4:
+            return None, None
+        k = len(text[:j].rstrip())
+        if k and text[k - 1] in _PAGE_EQ:
+            k = len(text[:k - 1].rstrip())
+        if k and text[k - 1] in _PAGE_OPEN:
+            return k - 1, int(text[j:i])
+        return None, None
+
+    if last.isdecimal():
+        j = end - 1
+        while j and text[j - 1].isdecimal() and end - j < 4:
+            j -= 1
+        return j, int(text[j:end])
     return None, None
 
 
@@ -241,35 +324,35 @@ def _parse_toc_line(line):
     line = line.strip()
     if not line:
         return None
+    m = _RE_TOC_HEAD.match(line)
+    if not m:
+        return None
+    rest = line[m.end():]
 
     # 附录格式：允许 "附录 B"（有空格）和小写字母
-    app_m = re.match(r'^附录\s*([A-Za-z])\s*(.*)', line)
-    if app_m:
-        sec  = f"附录{app_m.group(1).upper()}"
-        rest = app_m.group(2)
-        pm, page = _find_page_num(rest)
-        if pm and 1 <= page <= 600:
-            title = _clean_title(rest[:pm.start()])
+    if m.group('app'):
+        sec = f"附录{m.group('app').upper()}"
+        start, page = _find_page_num(rest)
+        if start is not None and 1 <= page <= 600:
+            title = _clean_title(rest[:start])
             # 标题为空时用附录编号作为标题，避免漏掉附录条目
             return (1, sec, title or sec, page)
+        return None
 
     # 特殊条目
-    for kw, label in _SPECIALS:
-        if line.startswith(kw):
-            pm, page = _find_page_num(line[len(kw):])
-            if pm and 1 <= page <= 600:
-                return (1, label, "", page)
+    if m.group('spec'):
+        start, page = _find_page_num(rest)
+        if start is not None and 1 <= page <= 600:
+            return (1, _SPECIAL_LABELS[m.group('spec')], "", page)
+        return None
 
     # 数字编号章节
-    m = RE_SEC_PREFIX.match(line)
-    if not m:
-        return None
-    sec  = m.group(1)
-    rest = m.group(2).strip()
+    sec  = m.group('sec')
+    rest = rest.strip()
     if not rest:
         return None
-    pm, page = _find_page_num(rest)
-    if not pm:
+    start, page = _find_page_num(rest)
+    if start is None:
         if sec == '1':
             title = _clean_title(rest)
             if title:
@@ -277,41 +360,35 @@ def _parse_toc_line(line):
         return None
     if page < 1 or page > 600:
         return None
-    title = _clean_title(rest[:pm.start()])
+    title = _clean_title(rest[:start])
     if not title:
         return None
-    return (len(sec.split('.')), sec, title, page)
+    return (sec.count('.') + 1, sec, title, page)
 
 
 def _split_merged_entries(line):
-    parts = re.split(
-        r'(?<=[）)】\]])\s*'
-        r'(?=[1-9]\d*(?:\.\d+)?\s*[\u4e00-\u9fff]'
-        r'|附录\s*[A-Za-z]|附：|标准用词|本规范用词|引用标准)',
-        line,
-    )
+    # 拆分点必须紧跟右括号，没有右括号的行（绝大多数）直接返回
+    if not any(c in line for c in _PAGE_CLOSE):
+        line = line.strip()
+        return [line] if line else []
+    parts = _RE_MERGED_SPLIT.split(line)
     return [p.strip() for p in parts if p.strip()]
 
 
 def _preprocess_lines(lines):
-    merged, i = [], 0
-    while i < len(lines):
+    """合并被换行拆开的附录标题，并拆分粘连在一行的多个条目（单遍完成）。"""
+    result, i, n = [], 0, len(lines)
+    while i < n:
         line = lines[i].strip()
+        i += 1
         if not line:
-            i += 1
             continue
-        if (re.match(r'^附录\s*[A-Za-z]', line)
-                and not re.search(r'\d+\s*$', line)
-                and not re.search(r'[）)】\]]\s*$', line)):
-            if i + 1 < len(lines):
-                nxt = lines[i + 1].strip()
-                if nxt:
-                    line = line + nxt
-                    i += 1
-        merged.append(line)
-        i += 1
-    result = []
-    for line in merged:
+        if (i < n and line[-1] not in _PAGE_CLOSE and not line[-1].isdecimal()
+                and _RE_APPENDIX_HEAD.match(line)):
+            nxt = lines[i].strip()
+            if nxt:
+                line = line + nxt
+                i += 1
         result.extend(_split_merged_entries(line))
     return result
 
@@ -339,13 +416,203 @@ def _load_mineru_outputs(mineru_dir):
 # Step 3+4: 解析 MinerU 输出，注入 TOC 书签
 # ══════════════════════════════════════════════════════
 
-DEEPSEEK_API_KEY = os.environ.get('DEEPSEEK_API_KEY', '')
+DEEPSEEK_API_KEY  = os.environ.get('DEEPSEEK_API_KEY', '')
+DEEPSEEK_BASE_URL = os.environ.get('DEEPSEEK_BASE_URL', 'https://api.deepseek.com')  # 可指向本地兼容服务
+DEEPSEEK_MODEL    = os.environ.get('DEEPSEEK_MODEL', 'deepseek-chat')
+AI_WORKERS        = int(os.environ.get('AI_WORKERS', '4'))   # 并发请求数
+AI_CHUNK_LINES    = 120    # 每个请求发送的目录行数
+AI_CHUNK_OVERLAP  = 8      # 相邻分块重叠行数，避免条目恰好被切断
+AI_MAX_TOKENS     = 8192
+AI_CACHE_DIR      = os.environ.get('AI_CACHE_DIR') or os.path.join(UPLOAD_DIR, '_ai_cache')
+AI_CACHE_MAX_MB   = float(os.environ.get('AI_CACHE_MAX_MB', '64'))   # 超出时按最近使用淘汰，0 = 不限
+
+_AI_PROMPT = (
+    '以下是从中文PDF目录页OCR提取的文本，请解析为书签列表。\n\n'
+    'OCR文本：\n{toc_text}\n\n'
+    '返回JSON数组，每项格式：\n'
+    '{{"level": 层级, "section": "章节编号", "title": "标题", "page": 页码}}\n\n'
+    '说明：\n'
+    '- level 1=章级（如"1"、"2"、"附录A"），level 2=节级（如"1.1"、"2.3"）\n'
+    '- section 例如 "1"、"2.3"、"附录A"、"条文说明"\n'
+    '- title 只含标题文字，不含编号和页码\n'
+    '- page 为目录中显示的书内页码（整数）\n'
+    '- 只提取有明确页码的条目\n'
+    '只返回JSON数组，不要任何其他文字或代码块标记。'
+)
+
+
+def _chunk_lines(lines, size=AI_CHUNK_LINES, overlap=AI_CHUNK_OVERLAP):
+    """把目录行切成相互重叠的分块。"""
+    if len(lines) <= size:
+        return [lines] if lines else []
+    step = size - overlap
+    return [lines[i:i + size] for i in range(0, len(lines) - overlap, step)]
+
+
+def _ai_cache_key(chunk):
+    """
+    缓存键：服务地址 + 模型 + 提示词 + 分块文本的 SHA-256，任一变化都不会命中旧结果
+    （本地桩服务的回复不会被线上服务当作缓存命中）。
+    """
+    h = hashlib.sha256(f'{DEEPSEEK_BASE_URL}\n{DEEPSEEK_MODEL}\n{_AI_PROMPT}\n'.encode('utf-8'))
+    h.update('\n'.join(chunk).encode('utf-8'))
+    return h.hexdigest()
+
+
+def _ai_cache_load(key):
+    path = os.path.join(AI_CACHE_DIR, key + '.json')
+    try:
+        with open(path, encoding='utf-8') as fh:
+            entries = [tuple(e) for e in json.load(fh)]
+        os.utime(path)          # mtime 即最近使用时间，淘汰时据此排序
+        return entries
+    except (OSError, ValueError, TypeError):
+        return None
+
+
+def _ai_cache_trim():
+    """缓存超过 AI_CACHE_MAX_MB 时按最近使用时间淘汰，直到降到上限的 90%。"""
+    if AI_CACHE_MAX_MB <= 0:
+        return
+    files = []
+    for entry in os.scandir(AI_CACHE_DIR):
+        if entry.name.endswith('.json'):
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, entry.path))
+    total = sum(size for _, size, _ in files)
+    limit = AI_CACHE_MAX_MB * 1024 * 1024
+    if total <= limit:
+        return
+    for _, size, path in sorted(files):
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        if total <= limit * 0.9:
+            break
+
+
+def _ai_cache_save(key, entries):
+    try:
+        os.makedirs(AI_CACHE_DIR, exist_ok=True)
+        path = os.path.join(AI_CACHE_DIR, key + '.json')
+        with open(path + '.tmp', 'w', encoding='utf-8') as fh:
+            json.dump(entries, fh, ensure_ascii=False)
+        os.replace(path + '.tmp', path)
+        _ai_cache_trim()
+    except OSError:
+        pass   # 缓存写失败不影响解析结果
+
+
+class _JsonArrayStream:
+    """
+    增量解析流式返回的 JSON 数组：每收到一个完整的对象就立即产出，
+    不必等整段响应结束（也兼容 ```json 包裹）。
+    """
+    _decoder = json.JSONDecoder()
+
+    def __init__(self):
+        self.buf = ''
+        self.pos = None     # '[' 之后的扫描位置
+
+    def feed(self, text):
+        self.buf += text
+        out = []
+        if self.pos is None:
+            i = self.buf.find('[')
+            if i < 0:
+                return out
+            self.pos = i + 1
+        buf = self.buf
+        while True:
+            while self.pos < len(buf) and buf[self.pos] in ' \t\r\n,':
+                self.pos += 1
+            if self.pos >= len(buf) or buf[self.pos] != '{':
+                return out
+            try:
+                obj, self.pos = self._decoder.raw_decode(buf, self.pos)
+            except ValueError:
+                return out          # 对象尚未接收完整
+            out.append(obj)
+
+
+def _ai_entry(e):
+    try:
+        return (int(e['level']), str(e['section']), str(e['title']), int(e['page']))
+    except (KeyError, ValueError, TypeError):
+        return None
+
+
+def _merge_ai_chunks(results):
+    """
+    按分块顺序合并。重复只出现在相邻分块的重叠区：取前一块条目的最长后缀
+    与当前块条目前缀按 (章节号, 页码) 对齐后去掉，多卷目录中重复的章节号不受影响。
+    """
+    merged, prev = [], []
+    for entries in results:
+        keys = [(e[1], e[3]) for e in entries]
+        k = min(len(prev), len(keys))
+        while k and prev[-k:] != keys[:k]:
+            k -= 1
+        merged.extend(entries[k:])
+        prev = keys
+    return merged
+
+
+def _ai_parse_chunk(client, chunk, label, emit):
+    """解析单个分块：先查缓存，否则流式请求；输出被截断时对半拆分重试。"""
+    key = _ai_cache_key(chunk)
+    cached = _ai_cache_load(key)
+    cache_lookup('ai_chunk', hits=cached is not None, misses=cached is None)
+    if cached is not None:
+        emit('log', f'  分块 {label}: 命中缓存，{len(cached)} 条')
+        return cached
+
+    parser, entries, finish = _JsonArrayStream(), [], None
+    with span('ai_request'):
+        stream = client.chat.completions.create(
+            model=DEEPSEEK_MODEL,
+            max_tokens=AI_MAX_TOKENS,
+            stream=True,
+            messages=[{'role': 'user',
+                       'content': _AI_PROMPT.format(toc_text='\n'.join(chunk))}],
+        )
+        for event in stream:
+            if not event.choices:
+                continue
+            choice = event.choices[0]
+            if choice.delta and choice.delta.content:
+                for obj in parser.feed(choice.delta.content):
+                    e = _ai_entry(obj)
+                    if e:
+                        entries.append(e)
+            finish = choice.finish_reason or finish
+
+    if finish == 'length':
+        if len(chunk) <= 2 * AI_CHUNK_OVERLAP:
+            raise RuntimeError(f'AI 输出超出 max_tokens，分块 {label} 无法再拆分')
+        emit('log', f'  分块 {label}: 输出被截断，拆分为两块重试')
+        half = len(chunk) // 2
+        entries = _merge_ai_chunks([
+            _ai_parse_chunk(client, chunk[:half + AI_CHUNK_OVERLAP], f'{label}a', emit),
+            _ai_parse_chunk(client, chunk[half:], f'{label}b', emit),
+        ])
+    else:
+        emit('log', f'  分块 {label}: 解析 {len(entries)} 条')
+    _ai_cache_save(key, entries)
+    return entries
 
 
 def _parse_toc_with_ai(all_lines, emit):
     """
     用 DeepSeek API 将 MinerU 输出解析为书签条目列表。
     返回 [(level, section, title, page), ...] 格式，与正则解析结果一致。
+    目录行按 AI_CHUNK_LINES 分块（重叠 AI_CHUNK_OVERLAP 行）并发请求，
+    结果按分块文本哈希缓存在 AI_CACHE_DIR。
     """
     from openai import OpenAI
 
@@ -353,65 +620,82 @@ def _parse_toc_with_ai(all_lines, emit):
     if not api_key:
         raise RuntimeError('请设置 DEEPSEEK_API_KEY 环境变量后再使用 AI 解析功能')
 
-    # 取前 300 行，避免 token 超限
-    toc_text = '\n'.join(all_lines[:300])
-    emit('log', f'发送 {len(toc_text)} 字符到 DeepSeek API...')
-
-    client = OpenAI(api_key=api_key, base_url='https://api.deepseek.com')
-    resp = client.chat.completions.create(
-        model='deepseek-chat',
-        max_tokens=4096,
-        messages=[{
-            'role': 'user',
-            'content': (
-                '以下是从中文PDF目录页OCR提取的文本，请解析为书签列表。\n\n'
-                f'OCR文本：\n{toc_text}\n\n'
-                '返回JSON数组，每项格式：\n'
-                '{"level": 层级, "section": "章节编号", "title": "标题", "page": 页码}\n\n'
-                '说明：\n'
-                '- level 1=章级（如"1"、"2"、"附录A"），level 2=节级（如"1.1"、"2.3"）\n'
-                '- section 例如 "1"、"2.3"、"附录A"、"条文说明"\n'
-                '- title 只含标题文字，不含编号和页码\n'
-                '- page 为目录中显示的书内页码（整数）\n'
-                '- 只提取有明确页码的条目\n'
-                '只返回JSON数组，不要任何其他文字或代码块标记。'
-            ),
-        }],
-    )
-    raw_json = resp.choices[0].message.content.strip()
+    chunks  = _chunk_lines(all_lines)
+    workers = max(1, min(AI_WORKERS, len(chunks)))
+    emit('log', f'{len(all_lines)} 行目录分为 {len(chunks)} 块，'
+                f'{workers} 路并发发送到 DeepSeek API...')
 
-    # 兼容模型有时会用 ```json ... ``` 包裹的情况
-    if raw_json.startswith('```'):
-        raw_json = re.sub(r'^```[a-z]*\n?', '', raw_json)
-        raw_json = re.sub(r'\n?```$', '', raw_json)
+    client = OpenAI(api_key=api_key, base_url=DEEPSEEK_BASE_URL)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(metrics.bind(
+            lambda ic: _ai_parse_chunk(client, ic[1], f'{ic[0] + 1}/{len(chunks)}', emit)),
+            enumerate(chunks)))
 
-    emit('log', 'DeepSeek 返回响应，解析 JSON...')
-    entries = json.loads(raw_json)
-
-    raw_entries = []
-    for e in entries:
-        try:
-            level   = int(e['level'])
-            section = str(e['section'])
-            title   = str(e['title'])
-            page    = int(e['page'])
-            raw_entries.append((level, section, title, page))
-            emit('log', f"  L{level}  {section:10s}  p={page:3d}  '{title[:40]}'")
-        except (KeyError, ValueError, TypeError):
-            continue
+    raw_entries = _merge_ai_chunks(results)
+    for level, section, title, page in raw_entries:
+        emit('log', f"  L{level}  {section:10s}  p={page:3d}  '{title[:40]}'")
 
     emit('log', f'AI 共解析 {len(raw_entries)} 条目录条目')
     return raw_entries
 
 
-def step3_parse_inject(pdf_path, mineru_dir, output_pdf, toc_scan_start, emit,
-                       toc_page_indices=None, use_ai=False):
-    """解析 MinerU 输出，注入 TOC 书签。返回 (offset, bookmark_count, clause_pdf_page)。"""
-    if use_ai:
-        emit('step_start', 'AI 智能解析目录中...', step=3, progress=45)
-    else:
-        emit('step_start', '解析目录并注入书签...', step=3, progress=45)
+@span('offset_vote')
+def _vote_offset(doc, raw_entries, toc_scan_start, emit, quick_ocr,
+                 page_text_cache=None):
+    """
+    扫描正文页，多章节交叉投票，返回 {候选offset: 票数}。
+    逐页流式处理：每页取到文本（命中缓存的页直接复用）就地对所有参考章节投票，
+    不保留整段正文的文本；大文件模式下页面资源随即释放（memory.iter_pages）。
+    """
+    total = len(doc)
+
+    # 多章节交叉投票确定 offset
+    # 取前5个1级章节作为参考（数字编号）
+    ref_entries = [e for e in raw_entries if e[0] == 1 and re.match(r'^\d+$', e[1])][:5]
+    if not ref_entries:
+        ref_entries = raw_entries[:3]
+    refs = [(ref_sec, ref_book_page,
+             re.compile(r'^' + re.escape(ref_sec) + r'\s+\S'),
+             re.compile(r'^' + re.escape(ref_sec) + r'\.'))
+            for ref_lvl, ref_sec, ref_title, ref_book_page in ref_entries]
 
+    emit('log', f'扫描正文页定位章节起始（PDF第{toc_scan_start+1}页起）...')
+    offset_votes: dict = {}
+    scanned = cached = 0
+    for i, page in iter_pages(doc, range(toc_scan_start, min(toc_scan_start + 80, total))):
+        # 每页只扫一次；命中缓存的页直接复用，新扫描的页写回
+        scanned += 1
+        if page_text_cache is not None and i in page_text_cache:
+            text = page_text_cache[i]
+            cached += 1
+        else:
+            text = quick_ocr(page)
+            if page_text_cache is not None:
+                page_text_cache[i] = text
+
+        lines = [l.strip() for l in text.splitlines() if l.strip()]
+        for ref_sec, ref_book_page, ref_pat, ref_sub in refs:
+            for j, line in enumerate(lines[:15]):
+                if not ref_pat.match(line):
+                    continue
+                following = lines[j+1 : j+6]
+                has_subsec = any(ref_sub.match(fl) for fl in following)
+                if following and not has_subsec and j >= 5:
+                    continue
+                cand = i - (ref_book_page - 1)
+                offset_votes[cand] = offset_votes.get(cand, 0) + 1
+                emit('log', f"  '{ref_sec}' 章在PDF第{i+1}页，书页码={ref_book_page}，候选offset={cand}")
+                break
+    if page_text_cache is not None:
+        cache_lookup('page_text', hits=cached, misses=scanned - cached)
+    if cached:
+        emit('log', f'  {cached} 页命中文本缓存，跳过 OCR')
+    return offset_votes
+
+
+@span('toc_parse')
+def parse_toc_entries(mineru_dir, emit, use_ai=False):
+    """解析 MinerU 输出为 [(level, section, title, page), ...]；解析不到任何条目时抛出异常。"""
     all_lines = _load_mineru_outputs(mineru_dir)
     if not all_lines:
         raise RuntimeError(f'未找到 MinerU 输出文件！目录: {mineru_dir}')
@@ -434,11 +718,102 @@ def step3_parse_inject(pdf_path, mineru_dir, output_pdf, toc_scan_start, emit,
         for raw_l in all_lines[:25]:
             emit('log', f'  >> {repr(raw_l)}')
         raise RuntimeError('解析到 0 条目录，请检查上方日志中的 MinerU 输出格式')
+    return raw_entries
+
+
+# ── 书签构建（流水线与书签编辑 bookmarks.py 共用）──────────────────
+# 书签项为 [level, 标题, PDF页码(1-indexed), key]；key 为章节号（条文说明加 'clause:' 前缀，
+# “目录”书签为 'toc'），供书签编辑定位条目。写入 PDF 前用 strip_keys 去掉 key。
+
+def _entry_bookmarks(entries, offset, total, emit, min_page=1, level_shift=0, key_prefix=''):
+    """目录条目 → 书签项：只取前两级、每个章节号只取首条，页码越界的跳过。"""
+    seen = set()
+    bookmarks = []
+    for level, sec, title, book_page in entries:
+        if level > 2 or sec in seen:
+            continue
+        seen.add(sec)
+        pdf_page_1idx = book_page - 1 + offset + 1
+        if pdf_page_1idx < min_page or pdf_page_1idx > total:
+            emit('log', f'  跳过越界: {sec} book_p={book_page} → pdf_p={pdf_page_1idx}')
+            continue
+        full_title = f"{sec}  {title}" if title else sec
+        bookmarks.append([level + level_shift, full_title, pdf_page_1idx, key_prefix + sec])
+    return bookmarks
+
+
+def normalize_levels(toc):
+    """修正层级跳变：每项最多比前一项深一级（set_toc 的要求），保留 level 之后的字段。"""
+    result, prev = [], 1
+    for e in toc:
+        lvl = max(1, min(e[0], prev + 1))
+        result.append([lvl] + list(e[1:]))
+        prev = lvl
+    return result
+
+
+def toc_bookmarks(raw_entries, offset, total, toc_page_indices=None, emit=None):
+    """主目录书签；toc_page_indices 非空时在最前面插入指向第一个目录页的“目录”书签。"""
+    emit = emit or (lambda *a, **k: None)
+    bookmarks = normalize_levels(_entry_bookmarks(raw_entries, offset, total, emit))
+
+    # 在最前面插入"目录"书签，指向用户选定的第一个目录页
+    if toc_page_indices:
+        toc_pdf_page = min(toc_page_indices) + 1   # 0-indexed → 1-indexed
+        if 1 <= toc_pdf_page <= total:
+            bookmarks = [[1, '目录', toc_pdf_page, 'toc']] + bookmarks
+    return bookmarks
+
+
+def insert_clause_bookmarks(toc, clause_entries, offset, total, emit=None):
+    """在“条文说明”书签之后插入条文说明子书签（不早于条文说明页）；书签中没有条文说明时抛出 RuntimeError。"""
+    emit = emit or (lambda *a, **k: None)
+    clause_1idx = clause_idx = None
+    for i, item in enumerate(toc):
+        if '条文说明' in item[1]:
+            clause_1idx = item[2]
+            clause_idx  = i
+            break
+
+    if clause_1idx is None:
+        raise RuntimeError('书签中未找到条文说明！')
+
+    emit('log', f'条文说明: PDF第{clause_1idx}页，书签下标={clause_idx}')
+    sub = _entry_bookmarks(clause_entries, offset, total, emit, min_page=clause_1idx,
+                           level_shift=1, key_prefix='clause:')
+
+    emit('log', f'子书签数: {len(sub)}')
+    for b in sub:
+        emit('log', f"  L{b[0]}  p{b[2]:3d}  {b[1][:60]}")
+    return toc[:clause_idx+1] + sub + toc[clause_idx+1:]
+
+
+def strip_keys(bookmarks):
+    """书签项 → set_toc 接受的 [level, 标题, 页码]。"""
+    return [b[:3] for b in bookmarks]
 
-    # 确定页码偏移（OCR 扫描正文找第一章）
-    doc = fitz.open(pdf_path)
-    total = len(doc)
 
+def step3_parse_inject(pdf_path, mineru_dir, output_pdf, toc_scan_start, emit,
+                       toc_page_indices=None, use_ai=False,
+                       page_text_cache=None, known_offset=None, raw_entries=None):
+    """
+    解析 MinerU 输出，注入 TOC 书签。
+    返回 (offset, bookmark_count, clause_pdf_page, raw_entries)。
+    page_text_cache: {页码: 文本}，命中的页不再 OCR，新扫描的页会写回。
+    known_offset:    已知页码偏移（同一文件、同一目录页的历史结果），跳过正文扫描。
+    raw_entries:     已有的目录条目（如目录指纹库命中），此时不读取 mineru_dir。
+    """
+    if raw_entries is not None:
+        emit('step_start', '使用目录指纹库中的条目注入书签...', step=3, progress=45)
+        emit('log', f'目录指纹库提供 {len(raw_entries)} 条目录条目')
+    else:
+        if use_ai:
+            emit('step_start', 'AI 智能解析目录中...', step=3, progress=45)
+        else:
+            emit('step_start', '解析目录并注入书签...', step=3, progress=45)
+        raw_entries = parse_toc_entries(mineru_dir, emit, use_ai)
+
+    # 确定页码偏移（OCR 扫描正文找第一章）
     first_sec = next((e for e in raw_entries if e[1] == '1'), None)
     if first_sec is None:
         first_sec = raw_entries[0]
@@ -448,80 +823,32 @@ def step3_parse_inject(pdf_path, mineru_dir, output_pdf, toc_scan_start, emit,
 
     def quick_ocr(page):
         """优先用内嵌文本（born-digital PDF），扫描版才走 Tesseract。"""
-        text = page.get_text()
-        if len(text.strip()) > 50:
-            return text
-        mat = fitz.Matrix(1.5, 1.5)
-        pix = page.get_pixmap(matrix=mat, colorspace=fitz.csGRAY)
-        img = Image.open(io.BytesIO(pix.tobytes("png")))
-        return pytesseract.image_to_string(img, lang="chi_sim+eng", config="--psm 3")
-
-    # 预扫描页面文本（每页只扫一次）
-    emit('log', f'扫描正文页定位章节起始（PDF第{toc_scan_start+1}页起）...')
-    page_texts = {}
-    for i in range(toc_scan_start, min(toc_scan_start + 80, total)):
-        page_texts[i] = quick_ocr(doc[i])
-
-    # 多章节交叉投票确定 offset
-    # 取前5个1级章节作为参考（数字编号）
-    ref_entries = [e for e in raw_entries if e[0] == 1 and re.match(r'^\d+$', e[1])][:5]
-    if not ref_entries:
-        ref_entries = raw_entries[:3]
-
-    offset_votes: dict = {}
-    for ref_lvl, ref_sec, ref_title, ref_book_page in ref_entries:
-        ref_pat = re.compile(r'^' + re.escape(ref_sec) + r'\s+\S')
-        ref_sub = re.compile(r'^' + re.escape(ref_sec) + r'\.')
-        for i, text in page_texts.items():
-            lines = [l.strip() for l in text.splitlines() if l.strip()]
-            for j, line in enumerate(lines[:15]):
-                if not ref_pat.match(line):
-                    continue
-                following = lines[j+1 : j+6]
-                has_subsec = any(ref_sub.match(fl) for fl in following)
-                if following and not has_subsec and j >= 5:
-                    continue
-                cand = i - (ref_book_page - 1)
-                offset_votes[cand] = offset_votes.get(cand, 0) + 1
-                emit('log', f"  '{ref_sec}' 章在PDF第{i+1}页，书页码={ref_book_page}，候选offset={cand}")
-                break
+        with RENDER_QUEUE.slot():
+            text = page.get_text()
+            if len(text.strip()) > 50:
+                return text
+            return ocr_page(page, 1.5)
+
+    cache_lookup('offset', hits=known_offset is not None, misses=known_offset is None)
+    with open_pdf(pdf_path) as doc:
+        total = len(doc)
+        if known_offset is not None:
+            offset = known_offset
+            emit('log', f'复用已缓存的页码偏移 offset={offset}（相同文件与目录页）')
+            offset_votes = None
+        else:
+            offset_votes = _vote_offset(doc, raw_entries, toc_scan_start, emit,
+                                        quick_ocr, page_text_cache)
 
     if offset_votes:
         offset = max(offset_votes, key=offset_votes.get)
         emit('log', f'投票结果: {dict(sorted(offset_votes.items()))} → offset={offset}')
-    else:
+    elif offset_votes is not None:
         offset = toc_scan_start - (book_page_1 - 1)
         emit('log', f'未找到章节起始页，估算 offset={offset}')
 
     # 构建书签
-    def normalize_levels(toc):
-        result, prev = [], 1
-        for e in toc:
-            lvl = max(1, min(e[0], prev + 1))
-            result.append([lvl, e[1], e[2]])
-            prev = lvl
-        return result
-
-    seen = set()
-    bookmarks = []
-    for level, sec, title, book_page in raw_entries:
-        if level > 2 or sec in seen:
-            continue
-        seen.add(sec)
-        pdf_page_1idx = book_page - 1 + offset + 1
-        if pdf_page_1idx < 1 or pdf_page_1idx > total:
-            emit('log', f'  跳过越界: {sec} book_p={book_page} → pdf_p={pdf_page_1idx}')
-            continue
-        full_title = f"{sec}  {title}" if title else sec
-        bookmarks.append([level, full_title, pdf_page_1idx])
-
-    bookmarks = normalize_levels(bookmarks)
-
-    # 在最前面插入"目录"书签，指向用户选定的第一个目录页
-    if toc_page_indices:
-        toc_pdf_page = min(toc_page_indices) + 1   # 0-indexed → 1-indexed
-        if 1 <= toc_pdf_page <= total:
-            bookmarks = [[1, '目录', toc_pdf_page]] + bookmarks
+    bookmarks = toc_bookmarks(raw_entries, offset, total, toc_page_indices, emit)
 
     emit('log', f'注入 {len(bookmarks)} 个书签')
     for b in bookmarks:
@@ -534,76 +861,61 @@ def step3_parse_inject(pdf_path, mineru_dir, output_pdf, toc_scan_start, emit,
         (b[2] for b in bookmarks if '条文说明' in b[1]), None
     )
 
-    doc.set_toc(bookmarks)
-    doc.save(output_pdf)
-    doc.close()
+    # 重新打开再写书签：扫描正文时 OCR 过的页面资源已随上一次关闭释放
+    with open_pdf(pdf_path) as doc:
+        doc.set_toc(strip_keys(bookmarks))
+        doc.save(output_pdf)
     emit('log', f'已保存: {output_pdf}')
-    return offset, len(bookmarks), clause_pdf_page
+    return offset, len(bookmarks), clause_pdf_page, raw_entries
 
 
 # ══════════════════════════════════════════════════════
 # Step 4: 提取条文说明目录页
 # ══════════════════════════════════════════════════════
 
-def step_clause_a(bm_pdf, orig_pdf, output_pdf, emit):
-    """从条文说明起始页扫描目录页，保存为 output_pdf。返回 True 表示找到。"""
-    emit('step_start', '提取条文说明目录页...', step=4, progress=60)
+def find_clause_toc_pages(bm_pdf, orig_pdf, emit, index=None):
+    """
+    从条文说明起始页起，由逐页特征索引找条文说明目录页，
+    返回页码列表（0-indexed），未找到返回 None。
+    index: 原始 PDF 的 PageIndex（上传时已构建）；窗口内未索引的扫描页按需 OCR 并写回。
+    """
 
     def find_clause_start(pdf_path):
-        doc = fitz.open(pdf_path)
-        toc = doc.get_toc()
-        doc.close()
+        with open_pdf(pdf_path) as doc:
+            toc = doc.get_toc()
         for item in toc:
             if '条文说明' in item[1]:
                 return item[2] - 1  # 1-indexed → 0-indexed
         return None
 
+    if index is None:
+        index = PageIndex.build(orig_pdf, sample_pages=0)
+    total = index.total
+
     clause_0idx = find_clause_start(bm_pdf)
     if clause_0idx is None:
-        clause_0idx = 211
-        emit('log', f'书签中未找到条文说明，使用默认: PDF第{clause_0idx+1}页')
+        clause_0idx = index.locate_clause_start(orig_pdf)
+        if clause_0idx is None:
+            emit('log', '书签与页面索引中均未找到条文说明起始页')
+            return None
+        emit('log', f'书签中未找到条文说明，页面索引定位到: PDF第{clause_0idx+1}页')
     else:
         emit('log', f'条文说明起始: PDF第{clause_0idx+1}页')
 
-    doc = fitz.open(orig_pdf)
-    total = len(doc)
-
-    def ocr_page(page):
-        """优先用内嵌文本，扫描版才走 Tesseract。"""
-        text = page.get_text()
-        if len(text.strip()) > 50:
-            return text
-        mat = fitz.Matrix(1.5, 1.5)
-        pix = page.get_pixmap(matrix=mat, colorspace=fitz.csGRAY)
-        img = Image.open(io.BytesIO(pix.tobytes("png")))
-        return pytesseract.image_to_string(img, lang="chi_sim+eng", config="--psm 3")
-
-    def score_toc(text):
-        lines = [l.strip() for l in text.splitlines() if l.strip()]
-        score = 0
-        if any('目次' in l or '目录' in l for l in lines):
-            score += 3
-        score += min(sum(1 for l in lines
-                         if re.search(r'[\u4e00-\u9fff\w]\s*\d+\s*$', l)), 6)
-        score += min(sum(1 for l in lines
-                         if re.match(r'^[1-9]\d*(?:\.\d+)*[\s\u3000]', l)), 5)
-        return score
-
-    scan_start = clause_0idx
-    emit('log', f'扫描 PDF第{scan_start+1}页 → 第{min(scan_start+15, total)}页...')
+    window = range(clause_0idx, min(clause_0idx + 15, total))
+    ocred  = index.ensure(orig_pdf, window)
+    emit('log', f'检查 PDF第{window.start+1}页 → 第{window.stop}页'
+                f'（补 OCR {len(ocred)} 页，其余命中页面索引）...')
 
     candidates = []
-    for i in range(scan_start, min(scan_start + 15, total)):
-        text = ocr_page(doc[i])
-        s = score_toc(text)
+    for i in window:
+        s = index.clause_score(i)
         emit('log', f'  PDF第{i+1}页: score={s}')
         if s >= 5:
             candidates.append(i)
 
     if not candidates:
-        emit('log', '未检测到条文说明目录页，跳过条文说明书签注入')
-        doc.close()
-        return False
+        return None
 
     cluster = [candidates[0]]
     for p in candidates[1:]:
@@ -615,14 +927,20 @@ def step_clause_a(bm_pdf, orig_pdf, output_pdf, emit):
     pages = list(range(cluster[0], cluster[-1] + 1))
     if pages[-1] + 1 < total:
         pages.append(pages[-1] + 1)
+    return pages
+
+
+def step_clause_a(bm_pdf, orig_pdf, output_pdf, emit, index=None):
+    """从条文说明起始页查找目录页，保存为 output_pdf。返回 True 表示找到。"""
+    emit('step_start', '提取条文说明目录页...', step=4, progress=60)
+
+    pages = find_clause_toc_pages(bm_pdf, orig_pdf, emit, index=index)
+    if not pages:
+        emit('log', '未检测到条文说明目录页，跳过条文说明书签注入')
+        return False
 
     emit('log', f'提取条文说明目录页（PDF页码）: {[p+1 for p in pages]}')
-    out = fitz.open()
-    for p in pages:
-        out.insert_pdf(doc, from_page=p, to_page=p)
-    out.save(output_pdf)
-    out.close()
-    doc.close()
+    _save_pages_as_pdf(orig_pdf, pages, output_pdf, emit)
     emit('log', f'已保存: {output_pdf}（{len(pages)}页）')
     return True
 
@@ -632,7 +950,7 @@ def step_clause_a(bm_pdf, orig_pdf, output_pdf, emit):
 # ══════════════════════════════════════════════════════
 
 def step_clause_c(bm_pdf, mineru_dir, output_pdf, offset, emit):
-    """解析条文说明目录 MinerU 输出，注入子书签。返回总书签数。"""
+    """解析条文说明目录 MinerU 输出，注入子书签。返回 (总书签数, 条文说明目录条目)。"""
     emit('step_start', '注入条文说明子书签...', step=6, progress=90)
 
     all_lines = _load_mineru_outputs(mineru_dir)
@@ -653,81 +971,356 @@ def step_clause_c(bm_pdf, mineru_dir, output_pdf, offset, emit):
     if not raw:
         raise RuntimeError('条文说明解析到 0 条！')
 
-    doc   = fitz.open(bm_pdf)
-    total = len(doc)
-    toc   = doc.get_toc()
-
-    clause_1idx = clause_idx = None
-    for i, item in enumerate(toc):
-        if '条文说明' in item[1]:
-            clause_1idx = item[2]
-            clause_idx  = i
-            break
-
-    if clause_1idx is None:
-        raise RuntimeError('书签中未找到条文说明！')
+    with open_pdf(bm_pdf) as doc:
+        total = len(doc)
+        toc   = doc.get_toc()
 
-    emit('log', f'条文说明: PDF第{clause_1idx}页，书签下标={clause_idx}')
     emit('log', f'使用页码偏移 offset={offset}')
+    new_toc = insert_clause_bookmarks(toc, raw, offset, total, emit)
 
-    seen = set()
-    sub  = []
-    for level, sec, title, book_page in raw:
-        if level > 2 or sec in seen:
-            continue
-        seen.add(sec)
-        pdf_p = book_page - 1 + offset + 1   # 1-indexed
-        if pdf_p < clause_1idx or pdf_p > total:
-            emit('log', f'  跳过越界: {sec} book_p={book_page} → pdf_p={pdf_p}')
-            continue
-        full = f"{sec}  {title}" if title else sec
-        sub.append([level + 1, full, pdf_p])
-
-    emit('log', f'子书签数: {len(sub)}')
-    for b in sub:
-        emit('log', f"  L{b[0]}  p{b[2]:3d}  {b[1][:60]}")
-
-    new_toc = toc[:clause_idx+1] + sub + toc[clause_idx+1:]
-    doc.set_toc(new_toc)
-
-    if os.path.abspath(output_pdf) == os.path.abspath(bm_pdf):
-        tmp = output_pdf + '.tmp'
-        doc.save(tmp)
-        doc.close()
-        os.replace(tmp, output_pdf)
-    else:
-        doc.save(output_pdf)
-        doc.close()
+    in_place = os.path.abspath(output_pdf) == os.path.abspath(bm_pdf)
+    target   = output_pdf + '.tmp' if in_place else output_pdf
+    with open_pdf(bm_pdf) as doc:
+        doc.set_toc(strip_keys(new_toc))
+        doc.save(target)
+    if in_place:
+        os.replace(target, output_pdf)
 
     size_mb = os.path.getsize(output_pdf) / 1024 / 1024
     emit('log', f'完成！总书签: {len(new_toc)}，文件大小: {size_mb:.1f}MB')
-    return len(new_toc)
+    return len(new_toc), raw
 
 
 # ══════════════════════════════════════════════════════
 # 完整流水线入口
 # ══════════════════════════════════════════════════════
 
-def _save_pages_as_pdf(src_pdf, page_indices, out_pdf):
-    """将指定页面（0-indexed）提取为独立 PDF。"""
-    doc   = fitz.open(src_pdf)
-    total = len(doc)
-    out   = fitz.open()
-    for i in sorted(set(p for p in page_indices if 0 <= p < total)):
-        out.insert_pdf(doc, from_page=i, to_page=i)
-    out.save(out_pdf)
-    out.close()
-    doc.close()
+def _scan_image(page):
+    """
+    整页扫描图的 (有效 DPI, 是否灰度, 图片流字节数)；不是整页扫描图时返回 None。
+    只读图片字典与摆放位置，不解码图片（get_image_info 会解码，600 DPI 整页约 1 秒）。
+    """
+    area = abs(page.rect)
+    for item in page.get_images(full=True):
+        xref, width, height, bpc, colorspace = item[0], item[2], item[3], item[4], item[5]
+        bbox = page.get_image_bbox(item) & page.rect
+        if bbox.is_empty or abs(bbox) < SCAN_COVERAGE * area:
+            continue
+        dpi  = max(width / bbox.width, height / bbox.height) * 72
+        gray = bpc == 1 or colorspace in ('DeviceGray', 'CalGray')
+        return dpi, gray, len(page.parent.xref_stream_raw(xref) or b'')
+    return None
+
+
+def _rerasterize(page):
+    """
+    整页扫描图分辨率高于 UPLOAD_DPI 或不是灰度图时，按 UPLOAD_DPI 渲染为灰度 JPEG；
+    结果比原图片流小才返回，否则返回 None（保留原图）。
+    """
+    import fitz
+    scan = _scan_image(page)
+    if scan is None:
+        return None
+    dpi, gray, raw_bytes = scan
+    if dpi <= UPLOAD_DPI * 1.2 and gray:
+        return None
+    with RENDER_QUEUE.slot():
+        pix  = page.get_pixmap(dpi=UPLOAD_DPI, colorspace=fitz.csGRAY, annots=False)
+        data = pix.tobytes('jpeg', jpg_quality=UPLOAD_JPEG_QUALITY)
+    return data if len(data) < raw_bytes else None
+
 
+_XREF_REF  = re.compile(r'(\d+) 0 R')
+_SKIP_KEYS = re.compile(r'/(?:Parent|P|Dest|A)\s+(?:\d+ 0 R|\[[^\]]*\])')
+_PDF_OVERHEAD    = 300      # 文件头、目录对象、页树与 trailer
+_OBJ_OVERHEAD    = 40       # "N 0 obj" / "endobj" 与交叉引用表中的一行
+_STREAM_OVERHEAD = 20       # "stream" / "endstream"
 
-def run_pipeline(pdf_path, job_dir, emit, toc_pages, clause_event, clause_pages_holder, use_ai=False):
+
+def _pages_size(doc, pages):
+    """
+    pages 页（0-indexed）逐页 insert_pdf 原样复制后的大致字节数，不序列化文档：
+    每页从页面对象出发，沿内容流、资源与批注引用到的对象（不含 /Parent 等回指其他页的引用）
+    累加对象字典与原始流长度，再加上对象与交叉引用表的格式开销。
+    逐页复制时各页共享的资源（字体等）每页各复制一份，所以按页分别去重。
+    """
+    size = _PDF_OVERHEAD
+    for i in pages:
+        seen, stack = set(), [doc[i].xref]
+        while stack:
+            xref = stack.pop()
+            if xref in seen or not 0 < xref < doc.xref_length():
+                continue
+            seen.add(xref)
+            obj = doc.xref_object(xref, compressed=True)
+            size += len(obj) + _OBJ_OVERHEAD
+            if doc.xref_is_stream(xref):
+                kind, length = doc.xref_get_key(xref, 'Length')
+                if kind == 'xref':
+                    length = doc.xref_object(int(length.split()[0])).strip()
+                size += (int(length) if length.isdigit() else 0) + _STREAM_OVERHEAD
+            stack.extend(int(n) for n in _XREF_REF.findall(_SKIP_KEYS.sub('', obj)))
+    return size
+
+
+def _insert_pages(doc, pages, out_pdf, emit=None):
+    """
+    把 doc 的 pages 页（0-indexed，已排序去重）复制到新 PDF 并保存，供上传 MinerU。
+    UPLOAD_OPTIMIZE 开启时生成足够识别的最小 PDF：
+      - 不复制批注、链接与表单域；只保留页面实际引用的资源
+        （insert_pdf 会带上共享资源字典里其他页的字体、图片）
+      - 整页扫描图按 _rerasterize 重新渲染为 UPLOAD_DPI 灰度 JPEG
+      - 保存时回收无用对象、压缩流与对象
+    原样复制的大小由 _pages_size 估算，只有瘦身结果不比它小（或关闭瘦身）时才真正原样复制。
+    返回 (原样复制的字节数（估算；真正原样复制时为实际大小）, 写出的字节数)。
+    """
+    import fitz
+
+    def verbatim_copy():
+        verbatim = fitz.open()
+        for i in pages:
+            verbatim.insert_pdf(doc, from_page=i, to_page=i)
+        raw = verbatim.tobytes()
+        verbatim.close()
+        return raw
+
+    data, rasterized = None, 0
+    if UPLOAD_OPTIMIZE:
+        original = _pages_size(doc, pages)
+        with span('upload_optimize'):
+            out = fitz.open()
+            for i in pages:
+                jpeg = _rerasterize(doc[i])
+                if jpeg is not None:
+                    rect = doc[i].rect
+                    out.new_page(width=rect.width, height=rect.height).insert_image(rect, stream=jpeg)
+                    rasterized += 1
+                else:
+                    out.insert_pdf(doc, from_page=i, to_page=i,
+                                   links=False, annots=False, widgets=False)
+                    out[-1].clean_contents()
+            optimized = out.tobytes(garbage=4, deflate=True, use_objstms=1)
+            out.close()
+        if len(optimized) < original:
+            data = optimized
+    if data is None:
+        data = verbatim_copy()
+        original = len(data)
+    with open(out_pdf, 'wb') as fh:
+        fh.write(data)
+
+    UPLOAD_BYTES.inc(original, kind='original_estimate')
+    UPLOAD_BYTES.inc(len(data), kind='sent')
+    if emit and UPLOAD_OPTIMIZE:
+        emit('log', f'上传 PDF 瘦身: 约 {original / 1024:.0f} KB（原样复制估算）→ {len(data) / 1024:.0f} KB'
+                    f'（{len(pages)} 页，重新栅格化 {rasterized} 页）')
+    return original, len(data)
+
+
+def _save_pages_as_pdf(src_pdf, page_indices, out_pdf, emit=None):
+    """将指定页面（0-indexed）提取为独立 PDF（上传 MinerU 用，见 _insert_pages）。"""
+    with open_pdf(src_pdf) as doc:
+        total = len(doc)
+        _insert_pages(doc, sorted(set(p for p in page_indices if 0 <= p < total)), out_pdf, emit)
+
+
+def toc_cache_key(toc_pages, use_ai=False):
+    """offset 缓存键：目录页集合 + 解析方式（二者相同则解析结果相同）。"""
+    key = ','.join(str(p) for p in sorted(set(toc_pages)))
+    return f'{key}:ai' if use_ai else key
+
+
+CHECKPOINT_FILE = 'checkpoint.json'
+
+# 阶段顺序及各阶段完成后必须存在的产物（相对 job_dir）
+PIPELINE_STAGES = [
+    ('extract',       'toc_only.pdf'),
+    ('mineru_toc',    'toc_mineru_out'),
+    ('parse_inject',  'toc_bm.pdf'),
+    ('clause_select', None),
+    ('mineru_clause', 'clause_mineru_out'),
+    ('clause_inject', 'final.pdf'),
+]
+
+
+class PipelineCheckpoint:
+    """
+    job 目录下的阶段清单（checkpoint.json）。每个阶段完成后写入其结果，
+    进程重启后 run_pipeline 据此跳过已完成阶段，避免重复 OCR 与云端调用。
+    params 与已有清单不一致（如用户改选了目录页）时清单作废；用户重新运行已结束的任务时
+    由调用方先 clear()，只有中断后的自动续跑复用清单。
+    交互选择的条文说明目录页不记入清单（续跑时重新询问）。
+    """
+
+    def __init__(self, job_dir, params):
+        self.job_dir = job_dir
+        self.path    = os.path.join(job_dir, CHECKPOINT_FILE)
+        self.data    = self.load(job_dir) or {}
+        if self.data.get('params') != params:
+            self.data = {'params': params, 'stages': {}}
+            self._save()
+
+    @staticmethod
+    def load(job_dir):
+        try:
+            with open(os.path.join(job_dir, CHECKPOINT_FILE), encoding='utf-8') as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def clear(job_dir):
+        """删除清单及中间产物（final.pdf 保留，由重新运行覆盖）。"""
+        for name in [CHECKPOINT_FILE] + [a for _, a in PIPELINE_STAGES[:-1] if a]:
+            path = os.path.join(job_dir, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.exists(path):
+                os.remove(path)
+
+    def get(self, stage):
+        return self.data['stages'].get(stage, {})
+
+    def done(self, stage):
+        """
+        阶段已完成，且产物仍在或已被后续阶段取代
+        （中间产物在下一阶段完成后即被删除，见 _discard）。
+        """
+        if not self.get(stage).get('done'):
+            return False
+        names    = [n for n, _ in PIPELINE_STAGES]
+        artifact = dict(PIPELINE_STAGES)[stage]
+        if artifact is None or os.path.exists(os.path.join(self.job_dir, artifact)):
+            return True
+        return any(self.done(later) for later in names[names.index(stage) + 1:])
+
+    def update(self, stage, **fields):
+        self.data['stages'].setdefault(stage, {}).update(fields)
+        self._save()
+
+    def complete(self, stage, **fields):
+        self.update(stage, done=True, **fields)
+
+    def reset(self, stage):
+        if self.data['stages'].pop(stage, None) is not None:
+            self._save()
+
+    def finish(self, summary):
+        self.data['finished'] = summary
+        self._save()
+
+    def _save(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            json.dump(self.data, fh, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+
+def _mineru_stage(ckpt, stage, pdf_path, out_dir, emit, step_num, start_pct):
+    """带检查点的 MinerU 调用：已提交的批次优先续查，失效时重新提交。"""
+    batch_id = ckpt.get(stage).get('batch_id')
+    on_submitted = lambda bid: ckpt.update(stage, batch_id=bid)
+    if batch_id:
+        try:
+            _run_mineru_api(pdf_path, out_dir, emit, step_num, start_pct,
+                            batch_id=batch_id)
+            ckpt.complete(stage)
+            return
+        except Exception as e:
+            emit('log', f'⚠ 续查批次失败（{e}），重新提交')
+    _run_mineru_api(pdf_path, out_dir, emit, step_num, start_pct,
+                    on_submitted=on_submitted)
+    ckpt.complete(stage)
+
+
+KEEP_INTERMEDIATES = os.environ.get('KEEP_INTERMEDIATES') == '1'   # 调试时保留中间产物
+
+
+def _discard(*paths):
+    """删除已被后续阶段消费的中间产物，使 job 目录只保留输入与最终输出。"""
+    if KEEP_INTERMEDIATES:
+        return
+    for p in paths:
+        if os.path.isdir(p):
+            shutil.rmtree(p, ignore_errors=True)
+        elif os.path.exists(p):
+            os.remove(p)
+
+
+def _resumed(emit, msg, step, progress):
+    emit('step_start', f'{msg}（从检查点恢复）', step=step, progress=progress)
+
+
+def _library_lookup(pdf_path, toc_pages, emit, use_ai=False):
+    """
+    计算目录页指纹并查指纹库，返回 (fingerprint, 命中的条目或 None)。
+    use_ai 时不查库（用户选 AI 通常是为了修正有误的解析），只返回指纹供解析后覆盖库中条目。
+    """
+    if not TOC_LIBRARY_ENABLED:
+        return None, None
+    try:
+        fingerprint = toc_fingerprint(pdf_path, toc_pages)
+    except Exception as exc:
+        emit('log', f'目录指纹计算失败（{exc}），不使用指纹库')
+        return None, None
+    if fingerprint is None:
+        return None, None
+    if use_ai:
+        emit('log', 'AI 解析不复用目录指纹库，解析结果将更新指纹库')
+        return fingerprint, None
+    library = get_library()
+    with span('toc_library_lookup'):
+        hit = library.lookup(fingerprint)
+    cache_lookup('toc_library', hits=hit is not None, misses=hit is None)
+    if hit is None:
+        emit('log', f'目录指纹库未命中（库中 {len(library)} 份目录）')
+        return fingerprint, None
+    entry_id, sim = hit
+    entries = library.load_entries(entry_id)
+    emit('log', f'目录指纹库命中 {entry_id}（相似度 {sim:.2f}），复用 {len(entries)} 条目录条目')
+    return fingerprint, entries
+
+
+def run_pipeline(pdf_path, job_dir, emit, toc_pages, clause_event, clause_pages_holder,
+                 use_ai=False, cache=None, auto_clause=False):
     """
     6 步完整流水线。
     toc_pages:            用户选定的主目录页列表（0-indexed）。
     clause_event:         threading.Event，step3 完成后等待用户确认条文说明。
     clause_pages_holder:  长度为 1 的列表，用于接收用户选定的条文说明目录页；
                           None 表示跳过。
+    cache:                可选 dict，同一文件内容的历史产物（见 upload_store）：
+                            'page_texts': {页码: 文本}  — 读取并写回
+                            'offsets':    {目录页键: offset} — 读取并写回
+                            'page_index': PageIndex — 条文说明检测时读取并补全
+    auto_clause:          True 时不等待用户，直接采用 find_clause_toc_pages 的结果
+                          （无人值守的批处理使用）。clause_event 为 None 且未开启
+                          auto_clause 时，直接跳过条文说明。
+    各阶段结果写入 job_dir/checkpoint.json；以相同参数再次调用时从第一个未完成阶段继续。
+    各步骤与热点函数耗时、运行期间的进程 RSS 峰值写入 job_dir/timings.json，
+    并随 step_start / done 事件推送。
+    返回摘要 dict：{offset, toc_bookmarks, total_bookmarks, clause_pages}。
     """
+    report = metrics.TimingReport(rss=RssTracker().start())
+    status = 'error'
+    try:
+        with report.recording():
+            summary = _run_stages(pdf_path, job_dir, report.wrap_emit(emit), toc_pages,
+                                  clause_event, clause_pages_holder, use_ai, cache,
+                                  auto_clause)
+        status = 'done'
+        return summary
+    finally:
+        metrics.JOBS_FINISHED.inc(status=status)
+        report.rss.stop()
+        try:
+            report.save(os.path.join(job_dir, metrics.TIMINGS_FILE))
+        except OSError:
+            pass
+
+
+def _run_stages(pdf_path, job_dir, emit, toc_pages, clause_event, clause_pages_holder,
+                use_ai, cache, auto_clause):
     toc_pdf       = os.path.join(job_dir, 'toc_only.pdf')
     toc_mineru    = os.path.join(job_dir, 'toc_mineru_out')
     toc_bm_pdf    = os.path.join(job_dir, 'toc_bm.pdf')
@@ -735,20 +1328,80 @@ def run_pipeline(pdf_path, job_dir, emit, toc_pages, clause_event, clause_pages_
     clause_mineru = os.path.join(job_dir, 'clause_mineru_out')
     final_pdf     = os.path.join(job_dir, 'final.pdf')
 
+    ckpt = PipelineCheckpoint(job_dir, {
+        'toc_pages': sorted(set(toc_pages)),
+        'use_ai':    use_ai,
+    })
+
     # Step 1: 提取用户选定的目录页
-    toc_scan_start = extract_toc_pages(pdf_path, toc_pages, toc_pdf, emit)
+    if ckpt.done('extract'):
+        _resumed(emit, '目录页已提取', step=1, progress=0)
+        toc_scan_start = ckpt.get('extract')['toc_scan_start']
+    else:
+        toc_scan_start = extract_toc_pages(pdf_path, toc_pages, toc_pdf, emit)
+        ckpt.complete('extract', toc_scan_start=toc_scan_start)
+
+    # 目录指纹库：同一标准的其他扫描件已处理过时直接复用目录条目，跳过 MinerU
+    fingerprint = library_entries = None
+    if not ckpt.done('mineru_toc') and not ckpt.done('parse_inject'):
+        fingerprint, library_entries = _library_lookup(pdf_path, toc_pages, emit, use_ai)
 
     # Step 2: MinerU Cloud API OCR 目录页
-    _run_mineru_api(toc_pdf, toc_mineru, emit, step_num=2, start_pct=15)
+    if ckpt.done('mineru_toc'):
+        _resumed(emit, '目录页 MinerU 结果已就绪', step=2, progress=15)
+    elif library_entries is not None:
+        emit('step_start', '目录指纹库命中，跳过 MinerU 识别', step=2, progress=15)
+        ckpt.complete('mineru_toc', library=True)
+    else:
+        _mineru_stage(ckpt, 'mineru_toc', toc_pdf, toc_mineru, emit,
+                      step_num=2, start_pct=15)
+    _discard(toc_pdf)
 
     # Step 3: 解析 MinerU 输出，注入主目录书签
-    offset, toc_count, clause_pdf_page = step3_parse_inject(
-        pdf_path, toc_mineru, toc_bm_pdf, toc_scan_start, emit,
-        toc_page_indices=toc_pages, use_ai=use_ai)
+    if ckpt.done('parse_inject'):
+        _resumed(emit, '主目录书签已注入', step=3, progress=45)
+        st = ckpt.get('parse_inject')
+        offset, toc_count, clause_pdf_page = (
+            st['offset'], st['toc_count'], st['clause_pdf_page'])
+    else:
+        if cache is None:
+            cache = {}
+        page_text_cache = cache.setdefault('page_texts', {})
+        offsets         = cache.setdefault('offsets', {})
+        offset_key      = toc_cache_key(toc_pages, use_ai)
+        offset, toc_count, clause_pdf_page, raw_entries = step3_parse_inject(
+            pdf_path, toc_mineru, toc_bm_pdf, toc_scan_start, emit,
+            toc_page_indices=toc_pages, use_ai=use_ai,
+            page_text_cache=page_text_cache, known_offset=offsets.get(offset_key),
+            raw_entries=library_entries)
+        offsets[offset_key] = offset
+        if fingerprint is not None and library_entries is None:
+            get_library().add(fingerprint, raw_entries)
+        ckpt.complete('parse_inject', offset=offset, toc_count=toc_count,
+                      clause_pdf_page=clause_pdf_page, raw_entries=raw_entries)
+    _discard(toc_mineru)
 
     # Step 4: 询问用户是否添加条文说明子目录
-    if clause_pdf_page is not None:
+    asked = False
+    if ckpt.done('clause_inject'):
+        # 续跑时最终 PDF 已生成：不再询问
+        _resumed(emit, '条文说明目录页已确定', step=4, progress=60)
+        clause_pages = ckpt.get('clause_inject').get('clause_pages')
+    elif ckpt.done('clause_select'):
+        _resumed(emit, '条文说明目录页已确定', step=4, progress=60)
+        clause_pages = ckpt.get('clause_select')['clause_pages']
+    elif clause_pdf_page is not None and auto_clause:
+        emit('step_start', '自动检测条文说明目录页...', step=4, progress=60)
+        clause_pages = find_clause_toc_pages(toc_bm_pdf, pdf_path, emit,
+                                             index=(cache or {}).get('page_index'))
+        if not clause_pages:
+            emit('log', '未检测到条文说明目录页，跳过条文说明书签注入')
+    elif clause_pdf_page is not None and clause_event is None:
+        emit('step_start', '准备完成...', step=4, progress=60)
+        clause_pages = None
+    elif clause_pdf_page is not None:
         # 通知前端展示条文说明目录页选择器（clause_page 为 0-indexed 起始展示页）
+        asked = not clause_event.is_set()        # 预置了条文说明页的 Event 已触发
         emit('select_clause',
              f'主目录书签已注入（共 {toc_count} 个）。'
              f'条文说明在第 {clause_pdf_page} 页，是否添加子目录书签？',
@@ -760,26 +1413,54 @@ def run_pipeline(pdf_path, job_dir, emit, toc_pages, clause_event, clause_pages_
         emit('log', '未找到条文说明书签，跳过子目录注入')
         emit('step_start', '准备完成...', step=4, progress=60)
         clause_pages = None
-
-    if clause_pages:
-        # Step 5: MinerU OCR 条文说明目录
-        emit('log', f'条文说明目录页（0-indexed）: {clause_pages}')
-        _save_pages_as_pdf(pdf_path, clause_pages, clause_toc)
-        _run_mineru_api(clause_toc, clause_mineru, emit, step_num=5, start_pct=65)
+    if not asked:
+        ckpt.complete('clause_select', clause_pages=clause_pages or None)
+
+    if ckpt.done('clause_inject'):
+        _resumed(emit, '最终 PDF 已生成', step=6, progress=90)
+        total_bookmarks = ckpt.get('clause_inject')['total_bookmarks']
+    elif clause_pages:
+        # Step 5: MinerU OCR 条文说明目录（续跑时用户可能改选了页码，只复用同一组页的结果）
+        if ckpt.get('mineru_clause').get('clause_pages') != clause_pages:
+            ckpt.reset('mineru_clause')
+            shutil.rmtree(clause_mineru, ignore_errors=True)
+        if ckpt.done('mineru_clause'):
+            _resumed(emit, '条文说明 MinerU 结果已就绪', step=5, progress=65)
+        else:
+            emit('log', f'条文说明目录页（0-indexed）: {clause_pages}')
+            _save_pages_as_pdf(pdf_path, clause_pages, clause_toc, emit)
+            ckpt.update('mineru_clause', clause_pages=clause_pages)
+            _mineru_stage(ckpt, 'mineru_clause', clause_toc, clause_mineru, emit,
+                          step_num=5, start_pct=65)
+        _discard(clause_toc)
 
         # Step 6: 注入条文说明子书签
+        clause_entries = None
         try:
-            total_bookmarks = step_clause_c(
+            total_bookmarks, clause_entries = step_clause_c(
                 toc_bm_pdf, clause_mineru, final_pdf, offset, emit)
         except Exception as e:
             emit('log', f'⚠ 条文说明子书签注入失败（{e}），将以主目录书签完成')
-            shutil.copy2(toc_bm_pdf, final_pdf)
+            os.replace(toc_bm_pdf, final_pdf)
             total_bookmarks = toc_count
             emit('step_start', '完成最后处理...', step=6, progress=90)
+        ckpt.complete('clause_inject', total_bookmarks=total_bookmarks,
+                      clause_entries=clause_entries, clause_pages=clause_pages)
     else:
-        shutil.copy2(toc_bm_pdf, final_pdf)
+        # 主目录书签 PDF 即最终结果：改名而非复制，避免两份同样大小的文件
+        os.replace(toc_bm_pdf, final_pdf)
         total_bookmarks = toc_count
         emit('log', '跳过条文说明子目录，直接完成')
         emit('step_start', '完成最后处理...', step=6, progress=90)
+        ckpt.complete('clause_inject', total_bookmarks=total_bookmarks, clause_pages=None)
+    _discard(clause_mineru, toc_bm_pdf)
 
     emit('done', f'完成！共注入 {total_bookmarks} 个书签', progress=100)
+    summary = {
+        'offset':          offset,
+        'toc_bookmarks':   toc_count,
+        'total_bookmarks': total_bookmarks,
+        'clause_pages':    clause_pages or None,
+    }
+    ckpt.finish(summary)
+    return summary
@@ -0,0 +1,113 @@
+"""
+按需性能剖析（单个任务开启，或 PROFILE_JOBS=1 全局开启）
+  - cProfile 确定性剖析：<name>.prof，可用 pstats / snakeviz 查看
+  - 采样剖析：后台线程每 SAMPLE_INTERVAL 秒抓一次被剖析线程的调用栈，
+    写成折叠栈文件 <name>.collapsed（每行 “外层;…;内层 次数”），
+    可直接交给 flamegraph.pl / speedscope 生成火焰图
+未开启时 profiled() 直接返回，不安装任何钩子。
+
+覆盖范围：
+  - 折叠栈只采样调用线程：线程池中的工作（如 AI 分块并发请求）在火焰图里表现为
+    主线程等待 future 的栈
+  - cProfile 在 Python 3.11 及以下只记录调用线程；Python 3.12+ 基于 sys.monitoring，
+    是进程级的，剖析期间其他线程（其他任务、HTTP 请求）的调用也会计入 .prof。
+    3.12+ 同一时刻只有一个任务做 cProfile 剖析，其余同时剖析的任务只做采样剖析
+    （.collapsed 仍只含本任务线程）
+"""
+import os
+import sys
+import cProfile
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+PROFILE_JOBS    = os.environ.get('PROFILE_JOBS', '0') == '1'
+SAMPLE_INTERVAL = float(os.environ.get('PROFILE_SAMPLE_INTERVAL', '0.005'))
+MAX_STACK_DEPTH = 128
+
+PROCESS_WIDE_CPROFILE = sys.version_info >= (3, 12)
+_cprofile_lock = threading.Lock()      # 3.12+：同一时刻只允许一个任务做 cProfile 剖析
+
+PROFILE_SUFFIXES = ('.prof', '.collapsed')
+
+
+def _frame_label(code):
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class StackSampler:
+    """定时采样指定线程的调用栈，按折叠栈计数。"""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval  = interval
+        self.stacks    = Counter()
+        self.samples   = 0
+        self._stop     = threading.Event()
+        self._thread   = threading.Thread(target=self._loop, daemon=True,
+                                          name=f'sampler-{thread_id}')
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as fh:
+            for stack, count in self.stacks.most_common():
+                fh.write(f'{stack} {count}\n')
+
+
+@contextmanager
+def profiled(path_prefix, enabled=True):
+    """
+    在当前线程剖析 with 块，结束时写入 <path_prefix>.prof 与 <path_prefix>.collapsed。
+    enabled 为假时什么也不做。Python 3.12+ 上已有任务在做 cProfile 剖析（或其他剖析器
+    已在运行）时只做采样剖析，不生成 .prof。
+    """
+    if not enabled:
+        yield
+        return
+    locked = PROCESS_WIDE_CPROFILE and _cprofile_lock.acquire(blocking=False)
+    prof = None
+    if locked or not PROCESS_WIDE_CPROFILE:
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+        except ValueError:
+            prof = None
+    sampler = StackSampler(threading.get_ident())
+    sampler.start()
+    try:
+        yield
+    finally:
+        sampler.stop()
+        if prof is not None:
+            prof.disable()
+            prof.dump_stats(path_prefix + '.prof')
+        if locked:
+            _cprofile_lock.release()
+        sampler.write(path_prefix + '.collapsed')
+
+
+def profile_files(directory):
+    """directory 下的剖析产物文件名（已排序）。"""
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    return sorted(n for n in names if n.startswith('profile_') and n.endswith(PROFILE_SUFFIXES))
@@ -0,0 +1,144 @@
+"""
+逐页渲染 / OCR 的优先级队列：交互式缩略图优先于后台 OCR
+  - 耗 CPU 的逐页工作（缩略图渲染、目录页检测与正文扫描的取文本 / OCR）先在队列中取得
+    一个执行名额，再在调用线程中执行（PyMuPDF 对象不跨线程传递）。同优先级先来先得
+  - 名额数 RENDER_SLOTS（默认 CPU 核数）：
+      INTERACTIVE（缩略图）   执行中的缩略图少于 RENDER_SLOTS 即可执行，不等后台工作
+      BACKGROUND（OCR 等）    没有排队的缩略图、且执行中的总数少于 RENDER_SLOTS 时才执行
+    正在执行的一页 OCR 无法中断，缩略图与它并行执行而不是排在其后；后台工作逐页申请名额，
+    缩略图突发期间后台最多再做完手上这一页
+  - 同一线程已持有名额时再次申请直接执行（如 PageIndex.build 逐页取文本时调用 ocr_page）
+  - 按优先级统计排队与执行耗时：/metrics 中的 pdfbm_render_wait_seconds /
+    pdfbm_render_run_seconds，以及 GET /render_queue 返回的最近 STATS_WINDOW 次的分位数
+"""
+import os
+import time
+import itertools
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+from metrics import REGISTRY
+
+INTERACTIVE = 0
+BACKGROUND  = 1
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', BACKGROUND: 'background'}
+
+RENDER_SLOTS = int(os.environ.get('RENDER_SLOTS', '0')) or (os.cpu_count() or 1)
+STATS_WINDOW = 1000
+
+_LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+WAIT_SECONDS = REGISTRY.histogram('pdfbm_render_wait_seconds',
+                                  '逐页渲染 / OCR 排队等待名额的耗时（秒）', ['priority'],
+                                  buckets=_LATENCY_BUCKETS)
+RUN_SECONDS  = REGISTRY.histogram('pdfbm_render_run_seconds',
+                                  '逐页渲染 / OCR 占用名额的耗时（秒）', ['priority'],
+                                  buckets=_LATENCY_BUCKETS)
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class RenderQueue:
+    def __init__(self, slots=RENDER_SLOTS):
+        self.slots    = max(1, slots)
+        self._cond    = threading.Condition()
+        self._tickets = itertools.count()
+        self._waiting = {p: deque() for p in PRIORITY_NAMES}
+        self._running = {p: 0 for p in PRIORITY_NAMES}
+        self._held    = threading.local()       # .depth：当前线程持有名额的嵌套层数
+        self._stats   = {p: {'count': 0, 'wait': deque(maxlen=STATS_WINDOW),
+                             'run': deque(maxlen=STATS_WINDOW)} for p in PRIORITY_NAMES}
+
+    def _may_run(self, priority, ticket):
+        """ticket 是否可以开始执行。"""
+        if self._waiting[priority][0] != ticket:
+            return False
+        if priority == INTERACTIVE:
+            return self._running[INTERACTIVE] < self.slots
+        return (not self._waiting[INTERACTIVE]
+                and sum(self._running.values()) < self.slots)
+
+    @contextmanager
+    def slot(self, priority=BACKGROUND):
+        """占用一个执行名额，退出时归还。"""
+        depth = getattr(self._held, 'depth', 0)
+        if depth:
+            self._held.depth = depth + 1
+            try:
+                yield
+            finally:
+                self._held.depth = depth
+            return
+
+        t0 = time.perf_counter()
+        with self._cond:
+            ticket = next(self._tickets)
+            self._waiting[priority].append(ticket)
+            try:
+                while not self._may_run(priority, ticket):
+                    self._cond.wait()
+            except BaseException:
+                self._waiting[priority].remove(ticket)
+                self._cond.notify_all()
+                raise
+            self._waiting[priority].popleft()
+            self._running[priority] += 1
+            self._cond.notify_all()              # 可能还有空闲名额给下一个排队者
+        t1 = time.perf_counter()
+        self._held.depth = 1
+        try:
+            yield
+        finally:
+            self._held.depth = 0
+            t2 = time.perf_counter()
+            with self._cond:
+                self._running[priority] -= 1
+                stats = self._stats[priority]
+                stats['count'] += 1
+                stats['wait'].append(t1 - t0)
+                stats['run'].append(t2 - t1)
+                self._cond.notify_all()
+            name = PRIORITY_NAMES[priority]
+            WAIT_SECONDS.observe(t1 - t0, priority=name)
+            RUN_SECONDS.observe(t2 - t1, priority=name)
+
+    def stats(self):
+        """名额配置、当前排队 / 执行数与各优先级最近 STATS_WINDOW 次的耗时分位数（毫秒）。"""
+        def ms(v):
+            return None if v is None else round(v * 1000, 1)
+
+        with self._cond:
+            result = {'slots': self.slots, 'priorities': {}}
+            for p, name in PRIORITY_NAMES.items():
+                st = self._stats[p]
+                wait, run = list(st['wait']), list(st['run'])
+                result['priorities'][name] = {
+                    'count':       st['count'],
+                    'waiting':     len(self._waiting[p]),
+                    'running':     self._running[p],
+                    'wait_p50_ms': ms(_percentile(wait, 0.5)),
+                    'wait_p95_ms': ms(_percentile(wait, 0.95)),
+                    'wait_max_ms': ms(max(wait, default=None)),
+                    'run_p50_ms':  ms(_percentile(run, 0.5)),
+                    'run_p95_ms':  ms(_percentile(run, 0.95)),
+                }
+        return result
+
+    def depth(self):
+        with self._cond:
+            data = {}
+            for p, name in PRIORITY_NAMES.items():
+                data[(name, 'waiting')] = len(self._waiting[p])
+                data[(name, 'running')] = self._running[p]
+            return data
+
+
+RENDER_QUEUE = RenderQueue()
+
+REGISTRY.gauge('pdfbm_render_queue', '逐页渲染 / OCR 队列中排队与执行中的数量',
+               ['priority', 'state'], fn=RENDER_QUEUE.depth)
@@ -0,0 +1,140 @@
+"""
+磁盘配额与产物生命周期
+  - 统计 uploads/ 实际占用（硬链接只计一次）及每个 job 的字节数
+  - 超出全局配额时按最近访问时间（LRU）淘汰已结束的 job，
+    再淘汰没有 job 引用的去重缓存（uploads/_cas/<sha256>/）
+  - 完整统计要遍历整个 uploads/，ensure_space 只在估计占用接近配额（USAGE_RECHECK）
+    或上次统计已超过 USAGE_TTL 秒时重新统计，其余时候在上次结果上累加写入量
+中间产物的即时删除在 pipeline_core.run_pipeline 中完成。
+"""
+import os
+import time
+import shutil
+import threading
+
+UPLOAD_DIR    = os.environ.get('UPLOAD_DIR') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'uploads')       # 所有产物与缓存的根目录
+DISK_QUOTA_MB = int(os.environ.get('DISK_QUOTA_MB', '10240'))   # 默认 10 GB
+USAGE_TTL     = 300     # 秒
+USAGE_RECHECK = 0.9     # 估计占用超过配额的该比例时重新完整统计
+
+
+def dir_bytes(path, exclusive=False):
+    """
+    目录下文件总字节数。exclusive=True 时只统计没有其他硬链接的文件，
+    即删除该目录后实际能释放的空间。
+    """
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                st = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            if exclusive and st.st_nlink > 1:
+                continue
+            total += st.st_size
+    return total
+
+
+class StorageManager:
+    def __init__(self, root, quota_bytes=DISK_QUOTA_MB * 1024 * 1024):
+        self.root        = root
+        self.quota_bytes = quota_bytes
+        self.cas_dir     = os.path.join(root, '_cas')
+        self.partial_dir = os.path.join(root, '_partial')
+        self._lock       = threading.Lock()
+        self._used       = None      # 上次完整统计的占用 + 此后 ensure_space 放行的写入量
+        self._measured   = 0.0
+
+    def usage(self):
+        """
+        返回 {used, cas, partial, caches: {目录名: bytes}, jobs: {job_id: bytes}}。
+        used 按 inode 去重；jobs 中的字节数包含与 CAS 共享的 input.pdf；
+        caches 为其余以 _ 开头的目录（AI 缓存、目录指纹库等），不计为 job。
+        """
+        seen, used = set(), 0
+        cas = partial = 0
+        caches: dict = {}
+        jobs: dict = {}
+        for name in os.listdir(self.root):
+            top = os.path.join(self.root, name)
+            if not os.path.isdir(top):
+                continue
+            size = 0
+            for root, _, files in os.walk(top):
+                for fn in files:
+                    try:
+                        st = os.stat(os.path.join(root, fn))
+                    except OSError:
+                        continue
+                    size += st.st_size
+                    key = (st.st_dev, st.st_ino)
+                    if key not in seen:
+                        seen.add(key)
+                        used += st.st_size
+            if top == self.cas_dir:
+                cas = size
+            elif top == self.partial_dir:
+                partial = size
+            elif name.startswith('_'):
+                caches[name] = size
+            else:
+                jobs[name] = size
+        return {'used': used, 'cas': cas, 'partial': partial, 'caches': caches, 'jobs': jobs}
+
+    def _measure(self):
+        self._used     = self.usage()['used']
+        self._measured = time.time()
+        return self._used
+
+    def ensure_space(self, needed, candidates, evict):
+        """
+        保证再写入 needed 字节后不超过配额。
+        candidates: [(job_id, last_access), ...] 可淘汰的已结束 job
+        evict:      evict(job_id) 回调，负责删除 job 目录并注销；job 已不可淘汰（如被重新启动）
+                    时返回 False
+        返回 True 表示空间足够（可能已淘汰部分 job / 缓存）。
+        """
+        with self._lock:
+            used = self._used
+            if (used is None or time.time() - self._measured > USAGE_TTL
+                    or used + needed > self.quota_bytes * USAGE_RECHECK):
+                used = self._measure()
+            if used + needed <= self.quota_bytes:
+                self._used = used + needed
+                return True
+            ok = self._evict(used, needed, candidates, evict)
+            self._measure()
+            if ok:
+                self._used += needed
+            return ok
+
+    def _evict(self, used, needed, candidates, evict):
+        """按 LRU 淘汰 job，再淘汰无引用的 CAS 条目，直到放得下 needed。"""
+        for job_id, _ in sorted(candidates, key=lambda c: c[1]):
+            freed = dir_bytes(os.path.join(self.root, job_id), exclusive=True)
+            if not evict(job_id):
+                continue
+            used -= freed
+            if used + needed <= self.quota_bytes:
+                return True
+        for path in self._unreferenced_cas():
+            used -= dir_bytes(path)
+            shutil.rmtree(path, ignore_errors=True)
+            if used + needed <= self.quota_bytes:
+                return True
+        return used + needed <= self.quota_bytes
+
+    def _unreferenced_cas(self):
+        """没有任何 job 硬链接引用的 CAS 条目，按最近访问时间升序。"""
+        entries = []
+        for name in os.listdir(self.cas_dir):
+            path = os.path.join(self.cas_dir, name)
+            try:
+                if os.stat(os.path.join(path, 'input.pdf')).st_nlink > 1:
+                    continue
+                entries.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        return [p for _, p in sorted(entries)]
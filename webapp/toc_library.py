@@ -0,0 +1,214 @@
+"""
+目录指纹库：同一标准的不同扫描件 / 印次复用已解析的目录条目
+  - 指纹：目录页文本（优先文本层，扫描页用 Tesseract 快速 OCR）去掉标点与空白后，
+    取 3 字 shingle 集合的 MinHash 签名（60 个 32 位最小哈希）
+  - 查找：签名估计的 Jaccard 相似度 ≥ TOC_MATCH_SIMILARITY 且文本长度相近视为同一目录。
+    签名切成 20 段 × 3 行做 LSH 倒排，只比对至少一段完全相同的候选
+    （相似度 0.6 时漏检率 < 1%），库中有数万份目录时查找仍在毫秒级
+  - 命中时 run_pipeline 跳过目录页 MinerU 识别，直接用库中条目求 offset 并注入；
+    AI 解析（use_ai）不查库，重新解析的结果覆盖库中相近的条目（修正此前有误的正则解析）
+  - 库中条目超过 TOC_LIBRARY_MAX_ENTRIES 时按收录（或最近一次覆盖）先后淘汰最早的，
+    同时压缩 index.jsonl
+
+目录布局:
+  <TOC_LIBRARY_DIR>/index.jsonl          {id, sig, length, entries, created}  追加写（覆盖时同 id 再写一行）
+  <TOC_LIBRARY_DIR>/entries/<id>.json    [[level, section, title, page], ...]
+"""
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+
+from memory import open_pdf, iter_pages
+from page_index import ocr_page, TEXT_LAYER_MIN
+from metrics import span
+from storage import UPLOAD_DIR
+
+TOC_LIBRARY_ENABLED  = os.environ.get('TOC_LIBRARY', '1') != '0'
+TOC_LIBRARY_DIR      = os.environ.get('TOC_LIBRARY_DIR') or os.path.join(UPLOAD_DIR, '_toc_library')
+TOC_LIBRARY_MAX_ENTRIES = int(os.environ.get('TOC_LIBRARY_MAX_ENTRIES', '10000'))   # 0 = 不限
+TOC_MATCH_SIMILARITY = float(os.environ.get('TOC_MATCH_SIMILARITY', '0.6'))
+
+MIN_FINGERPRINT_CHARS = 60      # 归一化后文本太短（如空白页）不计算指纹
+SHINGLE   = 3
+NUM_PERM  = 60
+_BANDS    = 20
+_ROWS     = NUM_PERM // _BANDS
+_PRIME    = (1 << 61) - 1
+_rnd      = random.Random(20260301)
+_PERMS    = [(_rnd.randrange(1, _PRIME), _rnd.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+_RE_NOISE = re.compile(r'[^0-9A-Za-z\u4e00-\u9fff]+')
+
+
+def minhash(text):
+    """归一化文本 3 字 shingle 集合的 MinHash 签名（NUM_PERM 个 32 位整数）。"""
+    xs = {int.from_bytes(hashlib.blake2b(text[i:i + SHINGLE].encode('utf-8'),
+                                         digest_size=8).digest(), 'big')
+          for i in range(max(1, len(text) - SHINGLE + 1))}
+    return tuple(min((a * x + b) % _PRIME for x in xs) & 0xffffffff for a, b in _PERMS)
+
+
+def similarity(sig_a, sig_b):
+    """两个签名估计的 Jaccard 相似度。"""
+    return sum(x == y for x, y in zip(sig_a, sig_b)) / NUM_PERM
+
+
+@span('toc_fingerprint')
+def toc_fingerprint(pdf_path, toc_pages):
+    """
+    目录页的指纹 (MinHash 签名, 归一化文本长度)；文本太少时返回 None。
+    页码、章节号保留在指纹中：同名标准的不同版本页码不同，不会误命中。
+    """
+    parts = []
+    with open_pdf(pdf_path) as doc:
+        pages = [i for i in sorted(set(toc_pages)) if 0 <= i < len(doc)]
+        for i, page in iter_pages(doc, pages):
+            text = page.get_text()
+            if len(text.strip()) < TEXT_LAYER_MIN:
+                text = ocr_page(page, 1.0)
+            parts.append(text)
+    norm = _RE_NOISE.sub('', ''.join(parts))
+    if len(norm) < MIN_FINGERPRINT_CHARS:
+        return None
+    return minhash(norm), len(norm)
+
+
+class TocLibrary:
+    def __init__(self, root=TOC_LIBRARY_DIR, max_entries=TOC_LIBRARY_MAX_ENTRIES):
+        self.root        = root
+        self.max_entries = max_entries
+        self.entries_dir = os.path.join(root, 'entries')
+        self.index_path  = os.path.join(root, 'index.jsonl')
+        self._lock       = threading.Lock()
+        self._fps: dict  = {}                               # id → (签名, 文本长度)，按收录先后
+        self._records: dict = {}                            # id → index.jsonl 中的最新一行
+        self._bands      = [dict() for _ in range(_BANDS)]  # 段内容 → [id, ...]
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_path, encoding='utf-8') as fh:
+                for line in fh:
+                    try:
+                        rec = json.loads(line)
+                        sig = tuple(int(rec['sig'][i:i + 8], 16)
+                                    for i in range(0, NUM_PERM * 8, 8))
+                        self._register(rec['id'], sig, int(rec['length']))
+                        self._fps[rec['id']] = self._fps.pop(rec['id'])   # 覆盖行按最新收录排序
+                        self._records[rec['id']] = rec
+                    except (ValueError, KeyError, TypeError):
+                        continue    # 追加写被中断留下的残行
+        except OSError:
+            return
+        self._trim()
+
+    def _register(self, entry_id, sig, length):
+        if entry_id in self._fps:           # 覆盖已有条目：签名沿用，不重复登记
+            return
+        self._fps[entry_id] = (sig, length)
+        for b in range(_BANDS):
+            self._bands[b].setdefault(sig[b * _ROWS:(b + 1) * _ROWS], []).append(entry_id)
+
+    def _unregister(self, entry_id):
+        sig, _ = self._fps.pop(entry_id)
+        self._records.pop(entry_id, None)
+        for b in range(_BANDS):
+            key = sig[b * _ROWS:(b + 1) * _ROWS]
+            ids = self._bands[b].get(key, [])
+            if entry_id in ids:
+                ids.remove(entry_id)
+            if not ids:
+                self._bands[b].pop(key, None)
+
+    def _trim(self):
+        """超过 max_entries 时淘汰最早收录的条目并重写 index.jsonl（需持锁调用）。"""
+        if self.max_entries <= 0 or len(self._fps) <= self.max_entries:
+            return
+        for entry_id in list(self._fps)[:len(self._fps) - self.max_entries]:
+            self._unregister(entry_id)
+            try:
+                os.remove(os.path.join(self.entries_dir, entry_id + '.json'))
+            except OSError:
+                pass
+        with open(self.index_path + '.tmp', 'w', encoding='utf-8') as fh:
+            for entry_id in self._fps:
+                fh.write(json.dumps(self._records[entry_id]) + '\n')
+        os.replace(self.index_path + '.tmp', self.index_path)
+
+    def __len__(self):
+        return len(self._fps)
+
+    def lookup(self, fingerprint, min_similarity=TOC_MATCH_SIMILARITY):
+        """返回相似度最高的 (id, 相似度)；没有达到阈值的返回 None。"""
+        with self._lock:
+            return self._lookup(fingerprint, min_similarity)
+
+    def _lookup(self, fingerprint, min_similarity=TOC_MATCH_SIMILARITY):
+        """lookup 的实现，需持锁调用。"""
+        sig, length = fingerprint
+        best = None
+        seen = set()
+        for b in range(_BANDS):
+            for entry_id in self._bands[b].get(sig[b * _ROWS:(b + 1) * _ROWS], ()):
+                if entry_id in seen:
+                    continue
+                seen.add(entry_id)
+                other, other_len = self._fps[entry_id]
+                if not 0.8 <= length / other_len <= 1.25:
+                    continue
+                sim = similarity(sig, other)
+                if sim >= min_similarity and (best is None or sim > best[1]):
+                    best = (entry_id, sim)
+        return best
+
+    def load_entries(self, entry_id):
+        with open(os.path.join(self.entries_dir, entry_id + '.json'), encoding='utf-8') as fh:
+            return [tuple(e) for e in json.load(fh)]
+
+    def add(self, fingerprint, raw_entries):
+        """
+        收录一份目录条目，返回其 id。已有足够相近的指纹时用新解析的条目覆盖该 id 的条目
+        （查找与写入在同一把锁内，并发未命中的任务不会重复收录）。
+        """
+        sig, length = fingerprint
+        sig_hex = ''.join(f'{v:08x}' for v in sig)
+        with self._lock:
+            hit = self._lookup(fingerprint)
+            if hit is not None:
+                entry_id = hit[0]
+                sig_hex  = ''.join(f'{v:08x}' for v in self._fps[entry_id][0])
+                length   = self._fps[entry_id][1]
+            else:
+                entry_id = hashlib.blake2b(sig_hex.encode(), digest_size=8).hexdigest()
+            os.makedirs(self.entries_dir, exist_ok=True)
+            path = os.path.join(self.entries_dir, entry_id + '.json')
+            with open(path + '.tmp', 'w', encoding='utf-8') as fh:
+                json.dump([list(e) for e in raw_entries], fh, ensure_ascii=False)
+            os.replace(path + '.tmp', path)
+            rec = {'id': entry_id, 'sig': sig_hex, 'length': length,
+                   'entries': len(raw_entries), 'created': time.strftime('%Y-%m-%d %H:%M:%S')}
+            with open(self.index_path, 'a', encoding='utf-8') as fh:
+                fh.write(json.dumps(rec) + '\n')
+            if hit is not None:
+                self._fps[entry_id] = self._fps.pop(entry_id)    # 覆盖后按最新收录排序
+            else:
+                self._register(entry_id, sig, length)
+            self._records[entry_id] = rec
+            self._trim()
+        return entry_id
+
+
+_library = None
+_library_lock = threading.Lock()
+
+
+def get_library():
+    """进程内共享的指纹库实例（首次使用时加载索引）。"""
+    global _library
+    with _library_lock:
+        if _library is None:
+            _library = TocLibrary()
+        return _library
@@ -0,0 +1,326 @@
+"""
+分块上传与内容寻址存储
+  - 分块/断点续传：客户端按顺序 PUT 分块，服务端边落盘边计算 SHA-256
+  - 去重：相同内容的 PDF 只保存一份（uploads/_cas/<sha256>/input.pdf），
+    并复用其页数、目录页检测结果、正文页文本缓存与页码偏移
+
+目录布局:
+  uploads/_partial/<upload_id>/data.part   未完成的分块上传
+  uploads/_partial/<upload_id>/meta.json   {filename, size}
+  uploads/_cas/<sha256>/input.pdf          去重后的原始 PDF
+  uploads/_cas/<sha256>/meta.json          {total_pages, detected_pages, offsets}
+  uploads/_cas/<sha256>/page_texts.json    {页码(0-indexed): 文本}
+  uploads/_cas/<sha256>/page_index.json    逐页特征索引（page_index.PageIndex.to_dict）
+"""
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+
+CHUNK_SIZE     = 8 * 1024 * 1024    # 建议分块大小（8 MB）
+MAX_FILE_SIZE  = 2 * 1024 ** 3      # 单文件上限 2 GB
+PARTIAL_TTL    = 24 * 3600          # 未完成上传保留 24 小时
+CAS_TTL        = 7 * 24 * 3600      # 去重缓存 7 天未访问则清理
+
+_RE_UPLOAD_ID = re.compile(r'^[0-9a-f]{32}$')
+_RE_SHA256    = re.compile(r'^[0-9a-f]{64}$')
+
+
+def _last_activity(path):
+    """目录及其直接子项的最新 mtime（追加写分块不会更新目录 mtime）。"""
+    try:
+        latest = os.path.getmtime(path)
+        if os.path.isdir(path):
+            for name in os.listdir(path):
+                latest = max(latest, os.path.getmtime(os.path.join(path, name)))
+        return latest
+    except OSError:
+        return time.time()
+
+
+class UploadError(Exception):
+    """上传协议错误；status 为建议的 HTTP 状态码。"""
+
+    def __init__(self, msg, status=400, **extra):
+        super().__init__(msg)
+        self.status = status
+        self.extra  = extra
+
+
+class UploadStore:
+    def __init__(self, root):
+        self.root        = root
+        self.partial_dir = os.path.join(root, '_partial')
+        self.cas_dir     = os.path.join(root, '_cas')
+        os.makedirs(self.partial_dir, exist_ok=True)
+        os.makedirs(self.cas_dir, exist_ok=True)
+        # {upload_id: hashlib 对象}；进程重启后丢失，续传时从已落盘数据重算
+        self._hashers: dict = {}
+        # 正在写入分块、重算哈希或完成合并的 upload_id；这些耗时操作不持有全局锁，
+        # 慢客户端或重启后的哈希重算不阻塞其他上传
+        self._writing: set = set()
+        self._lock = threading.Lock()
+
+    # ── 分块上传 ──────────────────────────────────────────────────
+
+    def _partial_paths(self, upload_id):
+        if not _RE_UPLOAD_ID.match(upload_id or ''):
+            raise UploadError('upload_id 无效', 404)
+        d = os.path.join(self.partial_dir, upload_id)
+        return d, os.path.join(d, 'data.part'), os.path.join(d, 'meta.json')
+
+    def init_upload(self, filename, size):
+        """登记一次分块上传，返回 upload_id。"""
+        if not isinstance(filename, str) or not filename.lower().endswith('.pdf'):
+            raise UploadError('只支持 PDF 格式')
+        if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+            raise UploadError('文件大小无效')
+        if size > MAX_FILE_SIZE:
+            raise UploadError('文件过大', 413)
+
+        upload_id = uuid.uuid4().hex
+        d, part, meta = self._partial_paths(upload_id)
+        os.makedirs(d)
+        open(part, 'wb').close()
+        with open(meta, 'w', encoding='utf-8') as fh:
+            json.dump({'filename': filename, 'size': size}, fh, ensure_ascii=False)
+        with self._lock:
+            self._hashers[upload_id] = hashlib.sha256()
+        return upload_id
+
+    def status(self, upload_id):
+        """返回 {size, received}，供客户端断线后定位续传位置。"""
+        d, part, meta = self._partial_paths(upload_id)
+        if not os.path.exists(meta):
+            raise UploadError('上传不存在或已过期', 404)
+        with open(meta, encoding='utf-8') as fh:
+            info = json.load(fh)
+        return {'size': info['size'], 'received': os.path.getsize(part)}
+
+    def _claim(self, upload_id):
+        """
+        登记 upload_id 为处理中（需持锁调用，调用方已确认它不在处理中），
+        返回已登记的增量哈希对象的副本（进程重启后没有时返回 None）。
+        """
+        self._writing.add(upload_id)
+        h = self._hashers.get(upload_id)
+        return h.copy() if h is not None else None
+
+    @staticmethod
+    def _rehash(part, received):
+        """从已落盘的前 received 字节重算哈希（进程重启后续传时；调用方已登记为处理中，不持锁）。"""
+        h = hashlib.sha256()
+        with open(part, 'rb') as fh:
+            remaining = received
+            while remaining > 0:
+                buf = fh.read(min(CHUNK_SIZE, remaining))
+                if not buf:
+                    break
+                h.update(buf)
+                remaining -= len(buf)
+        return h
+
+    def write_chunk(self, upload_id, offset, stream, length=None):
+        """
+        在 offset 处追加一个分块。offset 必须等于已接收字节数，
+        否则抛出 409（extra 中带 received，客户端据此重新定位）。
+        stream 为类文件对象，按 64 KB 读取，不整体缓冲。
+        同一上传同时只能写一个分块（另一个分块写入中时抛出 409）；
+        只在校验偏移、登记写入和提交时持锁，重算哈希与读取请求体期间不持锁。
+        返回新的已接收字节数。
+        """
+        d, part, meta = self._partial_paths(upload_id)
+        with self._lock:
+            if upload_id in self._writing:
+                raise UploadError('另一分块正在写入或上传正在完成', 409)
+            st = self.status(upload_id)
+            received = st['received']
+            if offset != received:
+                raise UploadError('分块偏移不匹配', 409, received=received)
+            limit = st['size'] - received
+            if length is not None and length > limit:
+                raise UploadError('分块超出文件大小', 413, received=received)
+            h = self._claim(upload_id)
+
+        written = 0
+        try:
+            if h is None:
+                h = self._rehash(part, received)
+            with open(part, 'ab') as fh:
+                while True:
+                    buf = stream.read(64 * 1024)
+                    if not buf:
+                        break
+                    if written + len(buf) > limit:
+                        raise UploadError('分块超出文件大小', 413, received=received)
+                    fh.write(buf)
+                    h.update(buf)
+                    written += len(buf)
+        except BaseException:
+            # 丢弃半截分块，已登记的哈希状态仍对应 received 字节
+            with self._lock:
+                with open(part, 'ab') as fh:
+                    fh.truncate(received)
+                self._writing.discard(upload_id)
+            raise
+        with self._lock:
+            self._hashers[upload_id] = h
+            self._writing.discard(upload_id)
+        return received + written
+
+    def complete(self, upload_id):
+        """
+        校验上传完整后移入 CAS，返回 (sha256, 是否命中已有内容)。
+        完成期间上传登记为处理中，重复的 complete 请求得到 409，完成后得到 404。
+        """
+        d, part, meta = self._partial_paths(upload_id)
+        with self._lock:
+            if upload_id in self._writing:
+                raise UploadError('分块正在写入或上传正在完成', 409)
+            st = self.status(upload_id)
+            if st['received'] != st['size']:
+                raise UploadError('上传尚未完成', 409, received=st['received'])
+            h = self._claim(upload_id)
+        try:
+            if h is None:
+                h = self._rehash(part, st['received'])
+            with self._lock:
+                hit = self._adopt(part, h.hexdigest())
+                self._hashers.pop(upload_id, None)
+            shutil.rmtree(d, ignore_errors=True)
+        finally:
+            with self._lock:
+                self._writing.discard(upload_id)
+        return h.hexdigest(), hit
+
+    def save_stream(self, stream):
+        """
+        单次上传（/upload）：边写临时文件边计算哈希，再移入 CAS。
+        返回 (sha256, 是否命中已有内容)。
+        """
+        tmp = os.path.join(self.partial_dir, f'{uuid.uuid4().hex}.part')
+        h = hashlib.sha256()
+        try:
+            with open(tmp, 'wb') as fh:
+                while True:
+                    buf = stream.read(64 * 1024)
+                    if not buf:
+                        break
+                    fh.write(buf)
+                    h.update(buf)
+            sha = h.hexdigest()
+            with self._lock:
+                hit = self._adopt(tmp, sha)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return sha, hit
+
+    # ── 内容寻址存储 ──────────────────────────────────────────────
+
+    def cas_path(self, sha, name='input.pdf'):
+        if not _RE_SHA256.match(sha or ''):
+            raise UploadError('sha256 无效', 404)
+        return os.path.join(self.cas_dir, sha, name)
+
+    def _adopt(self, src, sha):
+        """将 src 移入 CAS；已存在则丢弃 src。需持锁调用。"""
+        dst = self.cas_path(sha)
+        if os.path.exists(dst):
+            os.remove(src)
+            self.touch(sha)
+            return True
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        os.replace(src, dst)
+        return False
+
+    def link_input(self, sha, job_dir):
+        """把 CAS 中的 PDF 链接到 job 目录（不支持硬链接时退化为复制）。"""
+        src = self.cas_path(sha)
+        dst = os.path.join(job_dir, 'input.pdf')
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+        return dst
+
+    def touch(self, sha):
+        try:
+            os.utime(os.path.dirname(self.cas_path(sha)))
+        except OSError:
+            pass
+
+    def load_meta(self, sha):
+        path = self.cas_path(sha, 'meta.json')
+        try:
+            with open(path, encoding='utf-8') as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return {}
+
+    def update_meta(self, sha, **fields):
+        with self._lock:
+            meta = self.load_meta(sha)
+            meta.update(fields)
+            self._write_json(self.cas_path(sha, 'meta.json'), meta)
+
+    def load_page_texts(self, sha):
+        """返回 {int 页码: 文本}；无缓存时返回空 dict。"""
+        path = self.cas_path(sha, 'page_texts.json')
+        try:
+            with open(path, encoding='utf-8') as fh:
+                return {int(k): v for k, v in json.load(fh).items()}
+        except (OSError, ValueError):
+            return {}
+
+    def save_page_texts(self, sha, page_texts):
+        with self._lock:
+            merged = self.load_page_texts(sha)
+            merged.update(page_texts)
+            self._write_json(self.cas_path(sha, 'page_texts.json'),
+                             {str(k): v for k, v in merged.items()})
+
+    def load_page_index(self, sha):
+        """返回 PageIndex.to_dict() 的结果；无缓存时返回 None。"""
+        try:
+            with open(self.cas_path(sha, 'page_index.json'), encoding='utf-8') as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def save_page_index(self, sha, data):
+        with self._lock:
+            self._write_json(self.cas_path(sha, 'page_index.json'), data)
+
+    @staticmethod
+    def _write_json(path, obj):
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            json.dump(obj, fh, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    # ── 过期清理 ──────────────────────────────────────────────────
+
+    def cleanup(self, now=None):
+        """删除过期的未完成上传与长期未访问的 CAS 条目。"""
+        now = now or time.time()
+        for base, ttl in ((self.partial_dir, PARTIAL_TTL), (self.cas_dir, CAS_TTL)):
+            for name in os.listdir(base):
+                path = os.path.join(base, name)
+                if now - _last_activity(path) <= ttl:
+                    continue
+                with self._lock:
+                    if name in self._writing:
+                        continue
+                    self._hashers.pop(name, None)
+                    if os.path.isdir(path):
+                        shutil.rmtree(path, ignore_errors=True)
+                    else:
+                        try:
+                            os.remove(path)
+                        except OSError:
+                            pass